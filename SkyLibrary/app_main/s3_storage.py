@@ -1,6 +1,10 @@
+from os import getpid, register_at_fork
+from threading import Lock
+
 from storages.backends.s3boto3 import S3Boto3Storage
 from boto3.session import Session as Boto3_Session
 from botocore.client import Config
+from django.conf import settings
 
 from .settings import MEDIA_STORAGE_BUCKET_NAME
 
@@ -12,14 +16,68 @@ class MediaStorage(S3Boto3Storage):
     file_overwrite = False
 
 
-def get_s3_connection():
+# the process S3 client (see get_s3_connection) and the id of the process, which created it
+_s3_client = None
+_s3_client_pid: int | None = None
+_s3_client_lock = Lock()
+
 
-    session = Boto3_Session()
+def _create_s3_client():
+
+    session = Boto3_Session(
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_S3_REGION_NAME,
+    )
 
-    s3 = session.client(
+    return session.client(
         service_name='s3',
-        endpoint_url='https://storage.yandexcloud.net',
-        config=Config(signature_version='s3v4'),
+        endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+        config=Config(
+            signature_version='s3v4',
+            max_pool_connections=settings.S3_CLIENT_MAX_POOL_CONNECTIONS,
+            tcp_keepalive=True,
+            connect_timeout=settings.S3_CLIENT_CONNECT_TIMEOUT,
+            read_timeout=settings.S3_CLIENT_READ_TIMEOUT,
+            retries={'mode': 'standard', 'total_max_attempts': settings.S3_CLIENT_MAX_ATTEMPTS},
+        ),
     )
 
-    return s3
+
+def get_s3_connection():
+    """
+        Function returns the S3 client of the process, it is created on the first call.
+
+        The client is thread-safe and keeps a pool of up to settings.S3_CLIENT_MAX_POOL_CONNECTIONS keep-alive
+        connections, so the credentials, the endpoint and the TLS connections are not resolved on every request.
+        The forked processes (gunicorn workers) create their own clients, the connections are not shared.
+    """
+
+    global _s3_client, _s3_client_pid
+
+    s3_client = _s3_client
+
+    if s3_client is not None and _s3_client_pid == getpid():
+        return s3_client
+
+    with _s3_client_lock:
+
+        if _s3_client is None or _s3_client_pid != getpid():
+            _s3_client = _create_s3_client()
+            _s3_client_pid = getpid()
+
+        return _s3_client
+
+
+def reset_s3_connection() -> None:
+    # the next get_s3_connection call creates a new client, for the settings changes and the forked processes
+
+    global _s3_client, _s3_client_pid, _s3_client_lock
+
+    # the lock may be held by a thread of the parent process, which does not exist in the forked one
+    _s3_client_lock = Lock()
+    _s3_client = None
+    _s3_client_pid = None
+
+
+register_at_fork(after_in_child=reset_s3_connection)
@@ -451,7 +451,51 @@ DEFAULT_FILE_STORAGE = 'app_main.s3_storage.MediaStorage'
 AWS_S3_ENDPOINT_URL = 'https://storage.yandexcloud.net'
 AWS_QUERYSTRING_AUTH = False
 AWS_S3_REGION_NAME = 'ru-central1'
+# the process S3 client (see app_main.s3_storage.get_s3_connection)
+S3_CLIENT_MAX_POOL_CONNECTIONS = 20  # keep-alive connections, more threads than this wait for a free connection
+S3_CLIENT_CONNECT_TIMEOUT = 5  # seconds
+S3_CLIENT_READ_TIMEOUT = 30  # seconds
+S3_CLIENT_MAX_ATTEMPTS = 3  # including the first one, the "standard" retry mode (with backoff)
+# media files multipart uploads, the parts presigned urls are given by batches of up to this size
+S3_PRESIGNED_URLS_BATCH_MAX_SIZE = 100
+# the presigned urls expire after the file upload time at this speed (bytes per second) and the minimum time
+S3_UPLOAD_MIN_SPEED = 1024 * 128
+S3_PRESIGNED_URL_MIN_EXPIRES_IN = 60 * 10  # seconds
+# the file is split to about this number of parts (from 5 MiB to FILE_UPLOAD_CHUNK_SIZE each, see
+# media_app.services.get_multipart_upload_plan), which are uploaded by the browser in parallel
+S3_UPLOAD_TARGET_PARTS_COUNT = 32
+S3_UPLOAD_MAX_CONCURRENCY = 4  # parts uploaded at the same time
+S3_UPLOAD_PART_MAX_ATTEMPTS = 4  # including the first one
+# seconds, a not completed upload can be resumed by the user during this time, older ones are aborted
+S3_UPLOAD_RESUME_TIMEOUT = 60 * 60 * 24
 TEST_RUNNER = 'app_main.test_runner.FastTestRunner'
+COMMENTS_PAGE_SIZE = 20  # media comments (without replies) per page on the view media page
+COMMENTS_REPLIES_DEPTH = 3  # nesting levels of replies loaded under a comment, deeper replies are loaded on demand
+# media downloads are buffered in the cache (if USE_CACHE and the cache is Redis or Memcached, with atomic increments)
+# and saved by the "flush_media_downloads" command,
+# it must be run more often than the timeout (in seconds)
+MEDIA_DOWNLOADS_BUFFER_TIMEOUT = 60 * 60 * 24
+# PostgreSQL text search configurations (stemming) of the LANGUAGES, used by the home page media full-text search
+MEDIA_SEARCH_CONFIGS = {'en-us': 'english', 'ru': 'russian'}
+# minimum pg_trgm similarity (0-1) of the home page similar text filters (title, author, user who added)
+MEDIA_TRIGRAM_SIMILARITY_THRESHOLD = 0.3
+# home page autocomplete, the per-process index checks the changes of the other processes at most once per interval
+AUTOCOMPLETE_INDEX_CHECK_INTERVAL = 5  # seconds
+AUTOCOMPLETE_SUGGESTIONS_LIMIT = 10
+# home page tags filter, the per-process index checks the changes of the other processes at most once per interval
+TAGS_INDEX_CHECK_INTERVAL = 5  # seconds
+MEDIA_FILTER_TAGS_COUNTS_CACHE_TIMEOUT = 60  # seconds, the tags counts (facets) of the home page filter results
+# seconds, the home page filter GET responses (server cache, invalidated on changes, and browsers cache)
+MEDIA_FILTER_CACHE_TIMEOUT = 60 * 5
+MEDIA_FILTER_BROWSER_CACHE_MAX_AGE = 30
+MEDIA_FILTER_PAGE_SIZE = 20  # media per page of the home page filter results
+JSON_STREAM_CHUNK_SIZE = 500  # rows per query and per sent chunk of the streaming JSON responses
+# home page blended ranking (see home_page_app.services.MediaFilter.order_by_blended_score), the score is the sum of
+# the weighted components: the text match rank, the rating (0-1), the downloads (0-1) and the freshness (0-1)
+MEDIA_RANKING_WEIGHTS = {'text': 1.0, 'rating': 1.0, 'downloads': 0.5, 'freshness': 0.5}
+MEDIA_RANKING_DOWNLOADS_HALF = 100  # the downloads number, which gives a half of the downloads component
+MEDIA_RANKING_FRESHNESS_HALF_LIFE = 30  # days, the media age, which gives a half of the freshness component
+MEDIA_RANKING_TOP_CANDIDATES_FACTOR = 3  # the top media candidates per indexed score component: top size * factor
 
 # VARIABLES FOR TESTS ONLY!!! DO NOT CHANGE!!! SECURITY RISKS!!!
 IS_TEST = False  # must be False, do not change
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.22 on 2026-10-18 09:20
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# the GIN trigram index is PostgreSQL specific, so it is created only there,
+# it is built on UPPER(username) to serve both icontains and the trigram similarity filters (see MediaFilter)
+USERNAME_TRIGRAM_INDEX_NAME = 'user_username_trgm_idx'
+
+
+def create_username_trigram_index(apps, schema_editor):
+
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    User = apps.get_model('accounts_app', 'User')
+
+    schema_editor.execute(
+        f'CREATE INDEX {USERNAME_TRIGRAM_INDEX_NAME} ON {User._meta.db_table} USING gin (UPPER(username) gin_trgm_ops)'
+    )
+
+
+def drop_username_trigram_index(apps, schema_editor):
+
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(f'DROP INDEX IF EXISTS {USERNAME_TRIGRAM_INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts_app', '0011_alter_user_email_alter_user_role'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_username_trigram_index, drop_username_trigram_index),
+    ]
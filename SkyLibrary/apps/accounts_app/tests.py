@@ -405,6 +405,14 @@ class ProfileTestCase(TestCase):
             1,  # 1 object at database
         )
 
+        # check the media rating aggregates
+
+        self.media.refresh_from_db()
+
+        self.assertEqual(self.media.rating_sum, int(new_new_rating_value))
+        self.assertEqual(self.media.rating_count, 1)
+        self.assertEqual(self.media.rating_avg, int(new_new_rating_value))
+
         MediaRating.objects.filter(media=self.media, user_who_added=self.user).delete()
 
         self.client.logout()
@@ -105,7 +105,7 @@ class ViewProfile(LoginRequiredMixin, View):
                 }
 
                 try:
-                    instance = MediaRating.objects.get(media=media)
+                    instance = MediaRating.objects.get(media=media, user_who_added=request.user)
 
                 except MediaRating.DoesNotExist:
                     instance = None
@@ -114,22 +114,11 @@ class ViewProfile(LoginRequiredMixin, View):
 
                 if form.is_valid():
 
-                    media_rating_data = {
-                        'media': form.cleaned_data['media'],
-                        'user_who_added': form.cleaned_data['user_who_added'],
-                        'rating': form.cleaned_data['rating'],
-                    }
-
-                    if instance:
-                        MediaRating.objects.filter(
-                            media=media_rating_data['media'], user_who_added=media_rating_data['user_who_added']
-                        ).update(rating=media_rating_data['rating'])
-
-                    else:
-                        MediaRating.objects.create(**media_rating_data)
+                    # saving through the model keeps the media rating aggregates correct
+                    media_rating = form.save()
 
                     return HttpResponse(
-                        dumps({'result_rating': media_rating_data['rating']}), content_type='application/json'
+                        dumps({'result_rating': media_rating.rating}), content_type='application/json'
                     )
 
             return HttpResponse(dumps({'result_rating': ''}), content_type='application/json')
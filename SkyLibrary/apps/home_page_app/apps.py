@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class HomePageAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'home_page_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401 (connects the signals receivers)
@@ -2,7 +2,7 @@ from django import forms
 from django.utils.translation import gettext_lazy as _
 
 from crispy_forms.helper import FormHelper
-from crispy_forms.layout import Layout, Submit, Fieldset, HTML
+from crispy_forms.layout import Layout, Submit, Fieldset, HTML, Field, Div
 from crispy_forms.bootstrap import FormActions
 from crispy_bootstrap5.bootstrap5 import FloatingField
 
@@ -20,6 +20,13 @@ class FilterMediaForm(forms.Form):
 
     TAGS_CHOICES = MediaTags.objects.all()
 
+    search = forms.CharField(
+        max_length=300,
+        required=False,
+        label=_('Search'),
+        # suggestions are loaded by index.js
+        widget=forms.TextInput(attrs={'list': 'search_autocomplete_list', 'autocomplete': 'off'}),
+    )
     title = forms.CharField(max_length=300, required=False, label=_('title'))
     author = forms.CharField(max_length=300, required=False, label=_('author'))
     tags = forms.ModelMultipleChoiceField(queryset=TAGS_CHOICES, required=False, label=_('Tags'))
@@ -33,6 +40,9 @@ class FilterMediaForm(forms.Form):
         required=False, label=_('Issue procedure'), choices=_rating_direction_choices_with_empty, initial=-1
     )
     user_who_added = forms.CharField(max_length=300, required=False, label=_('user who added'))
+    similar_text = forms.BooleanField(required=False, label=_('Allow typos in the title, author and user'))
+    best_first = forms.BooleanField(required=False, label=_('Most relevant first'))
+    newest_first = forms.BooleanField(required=False, label=_('Newest first'))
 
     @property
     def helper(self):
@@ -50,9 +60,18 @@ class FilterMediaForm(forms.Form):
         helper.layout = Layout(
             Fieldset(
                 _('Text filters:'),
+                FloatingField('search', id='filter_media_form_search_field'),
                 FloatingField('title', id='filter_media_form_title_field'),
                 FloatingField('author', id='filter_media_form_author_field'),
                 FloatingField('user_who_added', id='filter_media_form_user_who_added_field'),
+                Div(
+                    Field('similar_text', id='filter_media_form_similar_text_field'),
+                    HTML(
+                        '<label class="small ms-2 mb-3" for="filter_media_form_similar_text_field">%s</label>' %
+                        _('Allow typos in the title, author and user')
+                    ),
+                    css_class='d-flex',
+                ),
             ),
             Fieldset(
                 _('Tags filter:'),
@@ -65,6 +84,22 @@ class FilterMediaForm(forms.Form):
             Fieldset(
                 _('Rating filters:'),
                 'rating_direction',
+                Div(
+                    Field('best_first', id='filter_media_form_best_first_field'),
+                    HTML(
+                        '<label class="small ms-2 mb-3" for="filter_media_form_best_first_field">%s</label>' %
+                        _('Most relevant first')
+                    ),
+                    css_class='d-flex',
+                ),
+                Div(
+                    Field('newest_first', id='filter_media_form_newest_first_field'),
+                    HTML(
+                        '<label class="small ms-2 mb-3" for="filter_media_form_newest_first_field">%s</label>' %
+                        _('Newest first')
+                    ),
+                    css_class='d-flex',
+                ),
                 'rating_minimum_value',
                 'rating_maximum_value',
             ),
@@ -0,0 +1,118 @@
+from random import Random
+from statistics import median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from accounts_app.models import User
+from media_app.models import Media, MediaRating
+from home_page_app.services import MediaFilter, _ASCENDING, _DESCENDING
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Measure the MediaFilter rating filter, sort and search latency on a growing amount of generated media, '
+        'all generated data is rolled back at the end'
+    )
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--sizes', nargs='+', type=int, default=[1_000, 10_000, 100_000], help='Media amounts to measure on'
+        )
+        parser.add_argument('--repeats', type=int, default=20, help='Query repeats for every measurement')
+
+    @staticmethod
+    def _get_queries() -> dict:
+
+        def default_query():
+            media_filter = MediaFilter()
+            media_filter.filter_by_rating()
+            return media_filter.get(20)
+
+        def bounded_query():
+            media_filter = MediaFilter()
+            media_filter.filter_by_rating(direction=_ASCENDING, minimum_value=2, maximum_value=4)
+            return media_filter.get(20)
+
+        def bounded_with_title_query():
+            media_filter = MediaFilter()
+            media_filter.filter_by_rating(direction=_DESCENDING, minimum_value=3)
+            media_filter.filter_by_title('7')
+            return media_filter.get(20)
+
+        def search_query():
+            media_filter = MediaFilter()
+            media_filter.filter_by_search('description 7')
+            return media_filter.get(20)
+
+        return {
+            'default': default_query,
+            'bounded': bounded_query,
+            'bounded + title': bounded_with_title_query,
+            'search': search_query,
+        }
+
+    def _measure(self, query, repeats: int) -> float:
+
+        timings = []
+
+        for _ in range(repeats):
+
+            start = perf_counter()
+            list(query())
+            timings.append(perf_counter() - start)
+
+        return median(timings) * 1000
+
+    def handle(self, *args, **kwargs):
+
+        sizes = sorted(kwargs['sizes'])
+        repeats = kwargs['repeats']
+        queries = self._get_queries()
+        random = Random(0)
+        max_rating = max(MediaRating.rating_choices_list)
+
+        self.stdout.write(f'{"media":>10}' + ''.join(f'{name:>20}' for name in queries) + '  (median ms)')
+
+        with transaction.atomic():
+
+            user = User.objects.create(
+                username='benchmark_media_filter_user', email='benchmark@mail.com', role=User.VISITOR
+            )
+
+            created = 0
+
+            for size in sizes:
+
+                Media.objects.bulk_create(
+                    (
+                        Media(
+                            title=f'benchmark {i}',
+                            description=f'benchmark description {i}',
+                            author=f'benchmark author {i % 100}',
+                            user_who_added=user,
+                            active=Media.ACTIVE,
+                            file='benchmark.pdf',
+                            rating_avg=round(random.uniform(0, max_rating), 2),
+                        )
+                        for i in range(created, size)
+                    ),
+                    batch_size=1000,
+                )
+                created = max(created, size)
+
+                # bulk_create does not call Media.save()
+                Media.update_search_vector()
+
+                # refresh the planner statistics after the bulk insert
+                with connection.cursor() as cursor:
+                    cursor.execute(f'ANALYZE {Media._meta.db_table}')
+
+                self.stdout.write(
+                    f'{size:>10}' + ''.join(f'{self._measure(query, repeats):>20.2f}' for query in queries.values())
+                )
+
+            transaction.set_rollback(True)
@@ -1,6 +1,20 @@
-from typing import Literal, get_args
+from bisect import bisect_left, insort
+from datetime import date
+from hashlib import sha1
+from threading import Lock
+from time import monotonic
+from typing import Callable, Literal, get_args
+from uuid import uuid4
 
-from django.db.models import QuerySet, Count, Case, When, Value, IntegerField
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.postgres.lookups import TrigramSimilar
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connection
+from django.db.models import QuerySet, Q, F, Func, Value, FloatField, ExpressionWrapper
+from django.db.models.functions import Cast, Upper
+from django.db.models.lookups import GreaterThanOrEqual
+from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
 from media_app.models import Media, MediaTags, MediaRating
@@ -14,11 +28,97 @@ RATING_DIRECTION_CHOICES = (
 )
 RATING_DIRECTION_CHOICES_LIST = [_ASCENDING, _DESCENDING]
 
+# the rating is shown rounded to 2 decimal places, so the bounds are widened by half of the last shown digit,
+# this keeps the filter consistent with the shown values and still comparing the raw (indexed) column
+RATING_ROUNDING_TOLERANCE = 0.005
+
+# the pg_trgm "%" operator threshold (the pg_trgm.similarity_threshold setting default)
+_PG_TRGM_DEFAULT_SIMILARITY_THRESHOLD = 0.3
+
+# per-process indexes (see _CacheVersionedIndex) cache keys, the generation is changed if the cache is cleared,
+# the changes are a sequence of events with increasing versions
+_INDEX_GENERATION_KEY = '{name}_index_generation'
+_INDEX_VERSION_KEY = '{name}_index_version'
+_INDEX_CHANGE_KEY = '{name}_index_change_{version}'
+_INDEX_CHANGE_TIMEOUT = 60 * 60
+# more changes than this are not applied one by one, the index is rebuilt
+_INDEX_MAX_CHANGES = 1000
+
+# parsers of the MediaFilter sorting fields values in the pages cursors (see MediaFilter.get_page)
+_CURSOR_VALUE_PARSERS = {
+    'rating_avg': float,
+    'pub_date': date.fromisoformat,
+    'search_rank': float,
+    'text_similarity': float,
+    'blended_score': float,
+    'id': int,
+}
+
+
+class _DaysAge(Func):
+    # days from the date expression (the second one) to the date (the first one)
+
+    arg_joiner = ' - '
+    template = '(%(expressions)s)'  # PostgreSQL date subtraction, the integer number of days
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, template='(JULIANDAY(%(expressions)s))', arg_joiner=') - JULIANDAY(', **extra_context
+        )
+
+
+def _get_blended_score_indexed_components(today: date) -> list[tuple[str, ExpressionWrapper, Callable]]:
+    """
+        Function returns the blended score (see MediaFilter.order_by_blended_score) components, which depend
+        on one indexed media field each and are not decreasing with it: [(field name, expression, function), ...],
+        where the function calculates the component from the field value in Python (see MediaFilter._get_top).
+    """
+
+    weights = settings.MEDIA_RANKING_WEIGHTS
+    rating_weight = weights['rating'] / max(MediaRating.rating_choices_list)
+    downloads_half = float(settings.MEDIA_RANKING_DOWNLOADS_HALF)
+    freshness_half_life = float(settings.MEDIA_RANKING_FRESHNESS_HALF_LIFE)
+    freshness_weight = weights['freshness'] * freshness_half_life
+
+    return [
+        (
+            'rating_avg',
+            ExpressionWrapper(F('rating_avg') * rating_weight, output_field=FloatField()),
+            lambda rating_avg: rating_avg * rating_weight,
+        ),
+        # 0 without downloads, a half of the weight with MEDIA_RANKING_DOWNLOADS_HALF downloads, up to the weight
+        (
+            'downloads_count',
+            ExpressionWrapper(
+                weights['downloads'] * F('downloads_count') / (F('downloads_count') + downloads_half),
+                output_field=FloatField(),
+            ),
+            lambda downloads_count: weights['downloads'] * downloads_count / (downloads_count + downloads_half),
+        ),
+        # the weight for the today media, a half of it for the MEDIA_RANKING_FRESHNESS_HALF_LIFE days old media
+        (
+            'pub_date',
+            ExpressionWrapper(
+                freshness_weight / (freshness_half_life + _DaysAge(Value(today), F('pub_date'))),
+                output_field=FloatField(),
+            ),
+            lambda pub_date: freshness_weight / (freshness_half_life + (today - pub_date).days),
+        ),
+    ]
+
 
 class MediaFilter:
 
     def __init__(self) -> None:
         self._media = Media.objects.filter(active=Media.ACTIVE)
+        self._ordering: tuple[str, ...] = ()
+        # sum of the similarities of the similar text filters, annotated as "text_similarity" in get()
+        self._text_similarity: Cast | Value | None = None
+        # the applied filters with normalized arguments, in the applying order (see get_key)
+        self._filters: list[tuple] = []
+        # the full-text search is applied, so the media are annotated with "search_rank"
+        self._searched = False
 
     def filter_by_rating(
             self,
@@ -27,49 +127,825 @@ class MediaFilter:
             maximum_value: int = max(MediaRating.rating_choices_list),
     ) -> None:
 
-        # filtering media by minimum and maximum rating values
-        result_media = filter(lambda media: minimum_value <= media.get_rating() <= maximum_value, self._media)
+        # filtering by the stored rating average, the queryset stays lazy, so other filters can be added after
+        self._media = self._media.filter(
+            rating_avg__gte=minimum_value - RATING_ROUNDING_TOLERANCE,
+            rating_avg__lt=maximum_value + RATING_ROUNDING_TOLERANCE,
+        )
 
-        # sorting media by rating with a given direction
-        result_media = sorted(result_media, key=lambda media: media.get_rating(), reverse=direction == _DESCENDING)
+        # the sorting is applied in get(), "id" makes the order stable for media with the same rating
+        self._ordering = ('rating_avg' if direction == _ASCENDING else '-rating_avg', 'id')
 
-        result_pks = [media.pk for media in result_media]
-
-        # adds a QuerySet, not a filter object and orders it correctly
-        self._media = Media.objects.filter(pk__in=result_pks).order_by(
-            Case(
-                *[When(pk=pk, then=Value(i)) for i, pk in enumerate(result_pks)],
-                output_field=IntegerField(),
-            ).asc(),
-        )
+        self._filters.append(('rating', direction, minimum_value, maximum_value))
 
     def _filter_by_text(self, text: str, media_field_name: str) -> None:
         # filtering by text in a given media field name
         # full chain after substitution example: self._media = self._media.filter(title__icontains=text)
         self._media = self._media.filter(**{f'{media_field_name}__icontains': text})
 
-    def filter_by_title(self, text: str) -> None:
-        self._filter_by_text(text, 'title')
+        self._filters.append(('text', media_field_name, text.casefold()))
+
+    def _filter_by_similar_text(self, text: str, media_field_name: str) -> None:
+        """
+            Filtering by text similar to a given media field value (typos are allowed), the result is sorted
+            by the similarity if no other sorting is set.
+
+            PostgreSQL: pg_trgm trigram similarity not less than settings.MEDIA_TRIGRAM_SIMILARITY_THRESHOLD,
+            served by the GIN trigram indexes on UPPER(field) (see the migrations), which serve icontains too.
+            Other databases: icontains, without similarity.
+        """
+
+        if connection.vendor == 'postgresql':
 
-    def filter_by_author(self, text: str) -> None:
-        self._filter_by_text(text, 'author')
+            threshold = settings.MEDIA_TRIGRAM_SIMILARITY_THRESHOLD
+
+            # the trigram similarity is case-insensitive, Upper() is needed to use the indexes only
+            trigram_similarity = TrigramSimilarity(Upper(media_field_name), text)
+
+            # the threshold is a part of the query, not the pg_trgm.similarity_threshold session setting,
+            # which would stay on the (persistent) connection for the other requests
+            self._media = self._media.filter(GreaterThanOrEqual(trigram_similarity, threshold))
+
+            # the indexed "%" operator (with the default session threshold) finds the candidates,
+            # only if it does not skip the media with the similarity not less than the threshold
+            if threshold >= _PG_TRGM_DEFAULT_SIMILARITY_THRESHOLD:
+                self._media = self._media.filter(TrigramSimilar(Upper(media_field_name), text))
+
+            # "real" is cast to "double precision", so the value is the same in the pages cursors (see get_page)
+            similarity = Cast(trigram_similarity, FloatField())
+
+        else:
+
+            self._filter_by_text(text, media_field_name)
+
+            similarity = Value(0.0, output_field=FloatField())
+
+        self._text_similarity = similarity if self._text_similarity is None else self._text_similarity + similarity
+
+        self._filters.append(('similar_text', media_field_name, text.casefold()))
+
+        if not self._ordering:
+            self._ordering = ('-text_similarity', 'id')
+
+    def filter_by_title(self, text: str, similar: bool = False) -> None:
+
+        if similar:
+            self._filter_by_similar_text(text, 'title')
+
+        else:
+            self._filter_by_text(text, 'title')
+
+    def filter_by_author(self, text: str, similar: bool = False) -> None:
+
+        if similar:
+            self._filter_by_similar_text(text, 'author')
+
+        else:
+            self._filter_by_text(text, 'author')
 
-    def filter_by_user_who_added(self, text: str) -> None:
-        self._media = self._media.filter(user_who_added__username__icontains=text)
+    def filter_by_user_who_added(self, text: str, similar: bool = False) -> None:
+
+        if similar:
+            self._filter_by_similar_text(text, 'user_who_added__username')
+
+        else:
+            self._filter_by_text(text, 'user_who_added__username')
+
+    def filter_by_search(self, text: str) -> None:
+        """
+            Full-text search by the media title, author and description, the result is sorted by relevance
+            if no other sorting is set (the rating filter sorting is more important).
+
+            PostgreSQL: the query is matched with the stored GIN-indexed search vector (see Media.search_vector)
+            in every language of settings.MEDIA_SEARCH_CONFIGS and ranked with the vector weights.
+            Other databases: every query word must be in one of the fields (icontains), without relevance.
+        """
+
+        if connection.vendor == 'postgresql':
+
+            search_query = None
+
+            for config in dict.fromkeys(settings.MEDIA_SEARCH_CONFIGS.values()):
+
+                config_search_query = SearchQuery(text, config=config, search_type='websearch')
+
+                search_query = config_search_query if search_query is None else search_query | config_search_query
+
+            self._media = self._media.filter(search_vector=search_query).annotate(
+                # "real" is cast to "double precision", so the value is the same in the pages cursors (see get_page)
+                search_rank=Cast(SearchRank(F('search_vector'), search_query), FloatField())
+            )
+
+        else:
+
+            for word in text.split():
+                self._media = self._media.filter(
+                    Q(title__icontains=word) | Q(author__icontains=word) | Q(description__icontains=word)
+                )
+
+            self._media = self._media.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+        if not self._ordering:
+            self._ordering = ('-search_rank', 'id')
+
+        self._searched = True
+
+        self._filters.append(('search', ' '.join(text.casefold().split())))
 
     def filter_by_tags(self, tags: QuerySet[MediaTags]) -> None:
 
-        tags_list = list(tags)
+        tags_ids = sorted({tag.id for tag in tags})
+
+        # filtering by tags (all tags in the media must be present), the media ids are found by the tags index
+        self._media = self._media.filter(id__in=tags_index.get_media_ids(tags_ids))
+
+        self._filters.append(('tags', tuple(tags_ids)))
+
+    def order_by_recency(self) -> None:
+
+        # newest first, "id" makes the order stable for media with the same publication date
+        self._ordering = ('-pub_date', '-id')
+
+        self._filters.append(('recency',))
+
+    def order_by_blended_score(self) -> None:
+        """
+            The best media first by the blended score (annotated as "blended_score" in get()), the sum of the weighted
+            (settings.MEDIA_RANKING_WEIGHTS) text match rank (the search rank and the text similarity, if the text
+            filters are applied), rating, downloads number and freshness, calculated in SQL from the stored values.
+        """
+
+        self._ordering = ('-blended_score', 'id')
+
+        self._filters.append(('blended_score',))
+
+    def _get_blended_score(self) -> Cast:
+
+        score = sum(
+            (expression for _, expression, _ in _get_blended_score_indexed_components(date.today())),
+            start=Value(0.0, output_field=FloatField()),
+        )
+
+        if self._searched:
+            score += settings.MEDIA_RANKING_WEIGHTS['text'] * F('search_rank')
+
+        if self._text_similarity is not None:
+            score += settings.MEDIA_RANKING_WEIGHTS['text'] * F('text_similarity')
+
+        # "double precision" on PostgreSQL, so the value is the same in the pages cursors (see get_page)
+        return Cast(ExpressionWrapper(score, output_field=FloatField()), FloatField())
+
+    def get_key(self) -> str:
+        # the same key for the same filters (regardless of the text case and the tags order), for the cache keys
+        return sha1(repr(self._filters).encode()).hexdigest()
+
+    def get_tags_counts(self) -> dict[int, int]:
+        """
+            Returns the numbers of the filtered media with each tag (facets), tags without media are not included.
+
+            The filtered media ids are loaded with one query (no query without filters) and counted
+            with the tags index, the result is cached until the media or tags change (see media_filter_version),
+            at most settings.MEDIA_FILTER_TAGS_COUNTS_CACHE_TIMEOUT seconds.
+        """
+
+        if not self._filters:
+            return tags_index.get_tags_counts()
+
+        cache_key = f'media_filter_tags_counts_{self.get_key()}_{media_filter_version.get()}'
 
-        # filtering by tags (all tags in the media must be present)
-        self._media = self._media.filter(tags__in=tags_list).annotate(
-            tags_founded=Count('tags')
-        ).filter(tags_founded=len(tags_list))
+        tags_counts = cache.get(cache_key)
+
+        if tags_counts is None:
+
+            tags_counts = tags_index.get_tags_counts(self._media.order_by().values_list('id', flat=True))
+
+            cache.set(cache_key, tags_counts, settings.MEDIA_FILTER_TAGS_COUNTS_CACHE_TIMEOUT)
+
+        return tags_counts
 
     def get(self, amount: int | None) -> QuerySet[Media]:
 
+        media = self._media
+
+        if self._text_similarity is not None:
+            media = media.annotate(text_similarity=self._text_similarity)
+
+        if self._ordering and self._ordering[0] == '-blended_score':
+            media = media.annotate(blended_score=self._get_blended_score())
+
+        if self._ordering:
+            media = media.order_by(*self._ordering)
+
         if amount:
-            return self._media[:amount]
+            return media[:amount]
+
+        else:
+            return media
+
+    def get_page(
+            self,
+            cursor: str | None = None,
+            page_size: int | None = None,
+            fields: tuple[str, ...] | None = None,
+    ) -> tuple[list[Media] | list[dict], str | None]:
+        """
+            Returns a page of the filtered media and the cursor of the next page (None if it is the last page),
+            "cursor" is a value returned by the previous call, None for the first page.
+            "page_size" is settings.MEDIA_FILTER_PAGE_SIZE by default.
+            "fields" - if given, the media are dicts with only these fields (and the sorting fields) values.
+
+            Keyset pagination: the next page starts after the (sorting value, id) of the last media of the page,
+            so every page costs the same (sorted by id if no sorting is set).
+            The first page sorted by the blended score is found with the indexes if possible (see _get_top).
+            Raises ValueError if the cursor is incorrect.
+        """
+
+        if page_size is None:
+            page_size = settings.MEDIA_FILTER_PAGE_SIZE
+
+        if not self._ordering:
+            self._ordering = ('id',)
+
+        media = self.get(None)
+
+        if cursor:
+
+            cursor_values = cursor.split('_')
+
+            if len(cursor_values) != len(self._ordering):
+                raise ValueError(f'Incorrect cursor - "{cursor}"')
+
+            media = media.filter(self._get_keyset_filter(cursor_values))
+
+        ordering_fields_names = [ordering_field.lstrip('-') for ordering_field in self._ordering]
+
+        if fields:
+            media = media.values(*dict.fromkeys((*fields, *ordering_fields_names)))
+
+        # one more media, to know if there is a next page
+        top_media = None if cursor else self._get_top(media, page_size + 1)
+
+        media = list(media[:page_size + 1]) if top_media is None else top_media
+
+        if len(media) > page_size:
+
+            media = media[:page_size]
+
+            last_media = media[-1]
+
+            next_cursor = '_'.join(
+                str(last_media[field_name] if fields else getattr(last_media, field_name))
+                for field_name in ordering_fields_names
+            )
 
         else:
-            return self._media
+            next_cursor = None
+
+        return media, next_cursor
+
+    def _get_top(self, media: QuerySet, amount: int) -> list[Media] | list[dict] | None:
+        """
+            Returns the first "amount" media of the sorted by the blended score queryset ("media") with the indexes
+            (the threshold algorithm), or None if it is not possible and the whole queryset must be sorted.
+
+            The candidates are the media with the greatest values of every indexed score component field
+            (amount * settings.MEDIA_RANKING_TOP_CANDIDATES_FACTOR media per field, each is an index scan), any other
+            media score is not greater than the sum of the components of the last candidates (the threshold),
+            so the sorted candidates are the result, if the last of them has a greater score.
+            The text match components are not indexed, so the text filters sorting is not supported.
+        """
+
+        if self._ordering != ('-blended_score', 'id') or self._searched or self._text_similarity is not None:
+            return None
+
+        candidates_amount = amount * settings.MEDIA_RANKING_TOP_CANDIDATES_FACTOR
+        candidates_ids = set()
+        threshold = 0.0
+        all_media_are_candidates = False
+
+        for field_name, _, get_component in _get_blended_score_indexed_components(date.today()):
+
+            field_candidates = list(
+                self._media.order_by(f'-{field_name}', '-id').values_list('id', field_name)[:candidates_amount]
+            )
+
+            candidates_ids.update(media_id for media_id, _ in field_candidates)
+
+            if len(field_candidates) < candidates_amount:
+                # all of the filtered media are the candidates, so the candidates result is exact
+                all_media_are_candidates = True
+                break
+
+            threshold += get_component(field_candidates[-1][1])
+
+        top_media = list(media.filter(id__in=candidates_ids)[:amount])
+
+        if all_media_are_candidates:
+            return top_media
+
+        # every field gave "candidates_amount" media, so there are "amount" media at least
+        last_media = top_media[-1]
+        last_media_score = last_media['blended_score'] if isinstance(last_media, dict) else last_media.blended_score
+
+        # with a tolerance for the difference of the database and Python floats calculations
+        return top_media if last_media_score > threshold + 1e-9 else None
+
+    def _get_keyset_filter(self, cursor_values: list[str]) -> Q:
+        # media after the cursor in the lexicographic order of the sorting fields, for example ('-rating_avg', 'id'):
+        # Q(rating_avg__lt=rating_avg) | Q(rating_avg=rating_avg, id__gt=id)
+
+        keyset_filter = Q()
+        previous_fields_values = {}
+
+        for ordering_field, cursor_value in zip(self._ordering, cursor_values):
+
+            field_name = ordering_field.lstrip('-')
+            field_value = _CURSOR_VALUE_PARSERS[field_name](cursor_value)
+            lookup = 'lt' if ordering_field.startswith('-') else 'gt'
+
+            keyset_filter |= Q(**previous_fields_values, **{f'{field_name}__{lookup}': field_value})
+
+            previous_fields_values[field_name] = field_value
+
+        return keyset_filter
+
+
+class CacheVersion:
+    # a number in the cache, incremented on the data changes, for the cache keys of the data
+
+    def __init__(self, key: str) -> None:
+        self._key = key
+
+    def get(self) -> int:
+
+        version = cache.get(self._key)
+
+        if version is None:
+
+            cache.add(self._key, 0, None)
+
+            version = cache.get(self._key, 0)
+
+        return version
+
+    def increment(self) -> None:
+
+        try:
+
+            cache.add(self._key, 0, None)
+            cache.incr(self._key)
+
+        except ValueError:
+            # the cache is not shared (dummy)
+            pass
+
+
+# the version of the media filter results (the media and tags, which change the found media and their order),
+# changed by the home_page_app.signals receivers; the media counters (ratings, downloads, comments) change often,
+# so they are not versioned and the cached results may show them outdated up to the cache timeout
+media_filter_version = CacheVersion('media_filter_version')
+
+
+class _CacheVersionedIndex:
+    """
+        Base class of the per-process in-memory indexes of media data.
+
+        Changes are registered by the home_page_app.signals receivers (see register_change) and versioned through
+        the cache: the version is checked at most once per "check_interval_setting" seconds (and right after
+        a change in this process), then only the changed objects are reloaded (see _apply_changes).
+        The whole index is rebuilt (see _rebuild) on the first lookup, after the cache clearing,
+        if the changes are expired or if concurrent changes got the same version.
+        Lookups must hold the lock and call _update() first.
+    """
+
+    # changed objects types
+    MEDIA = 'media'
+    TAG = 'tag'
+
+    def __init__(self, name: str, check_interval_setting: str) -> None:
+
+        self._generation_key = _INDEX_GENERATION_KEY.format(name=name)
+        self._version_key = _INDEX_VERSION_KEY.format(name=name)
+        self._change_key = _INDEX_CHANGE_KEY.replace('{name}', name)
+        self._check_interval_setting = check_interval_setting
+
+        self._lock = Lock()
+        self._generation: str | None = None
+        self._version: int | None = None
+        # None means what the check is needed on the next lookup
+        self._last_check_time: float | None = None
+
+    def _rebuild(self) -> None:
+        raise NotImplementedError
+
+    def _apply_changes(self, changes: list[tuple[str, int]]) -> None:
+        raise NotImplementedError
+
+    def _update(self) -> None:
+
+        if self._last_check_time is not None and \
+                monotonic() - self._last_check_time < getattr(settings, self._check_interval_setting):
+            return
+
+        self._last_check_time = monotonic()
+
+        values = cache.get_many([self._generation_key, self._version_key])
+
+        if self._generation_key not in values:
+
+            cache.add(self._generation_key, uuid4().hex, None)
+            cache.add(self._version_key, 0, None)
+
+            values = cache.get_many([self._generation_key, self._version_key])
+
+        # None if the cache is not shared (dummy), then the index is rebuilt on every check
+        generation = values.get(self._generation_key)
+        version = values.get(self._version_key, 0)
+
+        if generation is not None and generation == self._generation and self._version is not None and \
+                0 <= version - self._version <= _INDEX_MAX_CHANGES:
+
+            if version == self._version:
+                return
+
+            changes_keys = [
+                self._change_key.format(version=change_version)
+                for change_version in range(self._version + 1, version + 1)
+            ]
+
+            changes = cache.get_many(changes_keys)
+
+            # all changes must be available, otherwise some of them are expired or not set yet
+            if len(changes) == len(changes_keys):
+
+                self._apply_changes(list(changes.values()))
+                self._version = version
+
+                return
+
+        self._rebuild()
+
+        self._generation, self._version = generation, version
+
+    def register_change(self, object_type: str, object_id: int) -> None:
+        # must be called after the change is committed (the other processes reload the object from the database)
+
+        try:
+
+            cache.add(self._version_key, 0, None)
+            version = cache.incr(self._version_key)
+
+        except ValueError:
+            # the cache is not shared (dummy), the index is rebuilt
+            pass
+
+        else:
+
+            # the cache may increment values with a get and a set (e.g. DatabaseCache), so concurrent changes
+            # may get the same version, then only one of them is stored and the whole index is rebuilt
+            if not cache.add(
+                    self._change_key.format(version=version), (object_type, object_id), _INDEX_CHANGE_TIMEOUT
+            ):
+                cache.set(self._generation_key, uuid4().hex, None)
+
+        # the change is applied by the next lookup of this process
+        self._last_check_time = None
+
+
+def _normalize_autocomplete_text(text: str) -> str:
+    return ' '.join(text.casefold().split())
+
+
+class AutocompleteIndex(_CacheVersionedIndex):
+    """
+        Per-process prefix index of the active media titles, authors and the media tags names (in every language),
+        lookups are binary searches over the sorted index keys, without the database.
+        Checks the changes once per settings.AUTOCOMPLETE_INDEX_CHECK_INTERVAL seconds (see _CacheVersionedIndex).
+    """
+
+    TITLE_SUGGESTION = 'title'
+    AUTHOR_SUGGESTION = 'author'
+    TAG_SUGGESTION = 'tag'
+
+    def __init__(self) -> None:
+
+        super().__init__('autocomplete', 'AUTOCOMPLETE_INDEX_CHECK_INTERVAL')
+
+        # (normalized text, suggestion type, object id, language or '') sorted tuples,
+        # the text is indexed from every word, so "gat" finds "The Great Gatsby"
+        self._keys: list[tuple[str, str, int, str]] = []
+        # (object type, object id): object keys
+        self._object_keys: dict[tuple[str, int], list[tuple[str, str, int, str]]] = {}
+        # media id: (title, author)
+        self._media: dict[int, tuple[str, str]] = {}
+        # tag id: {language: name}
+        self._tags: dict[int, dict[str, str]] = {}
+
+    @staticmethod
+    def _get_text_keys(text: str, suggestion_type: str, object_id: int, language: str = '') -> list:
+
+        words = _normalize_autocomplete_text(text).split(' ')
+
+        return [(' '.join(words[i:]), suggestion_type, object_id, language) for i in range(len(words)) if words[i]]
+
+    def _add_object(self, object_type: str, object_id: int, values, keep_sorted: bool = True) -> None:
+
+        if object_type == self.MEDIA:
+
+            title, author = values
+            self._media[object_id] = (title, author)
+
+            keys = self._get_text_keys(title, self.TITLE_SUGGESTION, object_id) + \
+                self._get_text_keys(author, self.AUTHOR_SUGGESTION, object_id)
+
+        else:
+
+            self._tags[object_id] = values
+
+            keys = []
+
+            for language, name in values.items():
+                keys += self._get_text_keys(name, self.TAG_SUGGESTION, object_id, language)
+
+        self._object_keys[(object_type, object_id)] = keys
+
+        if keep_sorted:
+            for key in keys:
+                insort(self._keys, key)
+
+        else:
+            self._keys += keys
+
+    def _remove_object(self, object_type: str, object_id: int) -> None:
+
+        (self._media if object_type == self.MEDIA else self._tags).pop(object_id, None)
+
+        for key in self._object_keys.pop((object_type, object_id), []):
+
+            index = bisect_left(self._keys, key)
+
+            if index < len(self._keys) and self._keys[index] == key:
+                del self._keys[index]
+
+    @staticmethod
+    def _load_objects(object_type: str, object_ids: list[int] | None = None) -> dict[int, tuple | dict]:
+        # loads the indexed values of the objects (of all objects if object_ids is None), one query
+
+        if object_type == AutocompleteIndex.MEDIA:
+
+            media = Media.objects.filter(active=Media.ACTIVE)
+
+            if object_ids is not None:
+                media = media.filter(id__in=object_ids)
+
+            return {media_id: (title, author) for media_id, title, author in media.values_list('id', 'title', 'author')}
+
+        else:
+
+            languages = [language for language, _ in settings.LANGUAGES]
+            name_fields = [f'name_{language.replace("-", "_")}' for language in languages]
+
+            tags = MediaTags.objects.all() if object_ids is None else MediaTags.objects.filter(id__in=object_ids)
+
+            return {
+                tag_id: dict(zip(languages, names)) for tag_id, *names in tags.values_list('id', *name_fields)
+            }
+
+    def _rebuild(self) -> None:
+
+        self._keys, self._object_keys, self._media, self._tags = [], {}, {}, {}
+
+        for object_type in (self.MEDIA, self.TAG):
+            for object_id, values in self._load_objects(object_type).items():
+                self._add_object(object_type, object_id, values, keep_sorted=False)
+
+        # all the keys are sorted once
+        self._keys.sort()
+
+    def _apply_changes(self, changes: list[tuple[str, int]]) -> None:
+
+        for object_type in (self.MEDIA, self.TAG):
+
+            object_ids = list({
+                object_id for change_object_type, object_id in changes if change_object_type == object_type
+            })
+
+            if not object_ids:
+                continue
+
+            objects = self._load_objects(object_type, object_ids)
+
+            for object_id in object_ids:
+
+                self._remove_object(object_type, object_id)
+
+                # inactive and deleted objects are not loaded
+                if object_id in objects:
+                    self._add_object(object_type, object_id, objects[object_id])
+
+    def get_suggestions(self, text: str, language: str, limit: int | None = None) -> list[dict[str, str]]:
+        """
+            Returns suggestions for the text (the start of any word of a title, author or a tag name
+            in the language), sorted alphabetically by the matched part, up to "limit"
+            (settings.AUTOCOMPLETE_SUGGESTIONS_LIMIT by default).
+
+            Structure:
+                result = [
+                    # "link" is only in the title suggestions, "id" is only in the tag suggestions
+                    {'type': 'title' | 'author' | 'tag', 'text': str, 'link': str, 'id': int},
+                    ...
+                ]
+        """
+
+        if limit is None:
+            limit = settings.AUTOCOMPLETE_SUGGESTIONS_LIMIT
+
+        prefix = _normalize_autocomplete_text(text)
+
+        if not prefix:
+            return []
+
+        suggestions = []
+        # one suggestion for the same text, for example an author of many media
+        found_texts = set()
+
+        with self._lock:
+
+            self._update()
+
+            index = bisect_left(self._keys, (prefix,))
+
+            while index < len(self._keys) and len(suggestions) < limit:
+
+                key_text, suggestion_type, object_id, key_language = self._keys[index]
+
+                index += 1
+
+                if not key_text.startswith(prefix):
+                    break
+
+                if key_language and key_language != language:
+                    continue
+
+                if suggestion_type == self.TITLE_SUGGESTION:
+                    suggestion = {
+                        'type': suggestion_type,
+                        'text': self._media[object_id][0],
+                        'link': reverse('view_media', kwargs={'media_id': object_id}),
+                    }
+
+                elif suggestion_type == self.AUTHOR_SUGGESTION:
+                    suggestion = {'type': suggestion_type, 'text': self._media[object_id][1]}
+
+                else:
+                    suggestion = {'type': suggestion_type, 'text': self._tags[object_id][language], 'id': object_id}
+
+                if (suggestion_type, suggestion['text']) not in found_texts:
+
+                    found_texts.add((suggestion_type, suggestion['text']))
+                    suggestions.append(suggestion)
+
+        return suggestions
+
+
+class TagsIndex(_CacheVersionedIndex):
+    """
+        Per-process index of the active media tags: a bitmap (int) of the active media ids for every tag,
+        so the media having all of the tags are found with the bitwise AND of the tags bitmaps.
+        Checks the changes once per settings.TAGS_INDEX_CHECK_INTERVAL seconds (see _CacheVersionedIndex).
+    """
+
+    def __init__(self) -> None:
+
+        super().__init__('tags', 'TAGS_INDEX_CHECK_INTERVAL')
+
+        # tag id: bitmap, the bit number N is set if the active media with id N has the tag
+        self._tags_bitmaps: dict[int, int] = {}
+        # active media id: its tags ids (media without tags are not stored)
+        self._media_tags: dict[int, set[int]] = {}
+
+    def _add_media_tag(self, media_id: int, tag_id: int) -> None:
+
+        self._tags_bitmaps[tag_id] = self._tags_bitmaps.get(tag_id, 0) | (1 << media_id)
+        self._media_tags.setdefault(media_id, set()).add(tag_id)
+
+    def _remove_media_tag(self, media_id: int, tag_id: int) -> None:
+
+        if tags_bitmap := self._tags_bitmaps.get(tag_id, 0) & ~(1 << media_id):
+            self._tags_bitmaps[tag_id] = tags_bitmap
+
+        else:
+            self._tags_bitmaps.pop(tag_id, None)
+
+        if media_tags := self._media_tags.get(media_id):
+
+            media_tags.discard(tag_id)
+
+            if not media_tags:
+                del self._media_tags[media_id]
+
+    @staticmethod
+    def _get_ids_bitmap(ids) -> int:
+        # the bitmap is filled as bytes, shifting and OR-ing big ints one by one is much slower
+
+        ids = list(ids)
+
+        if not ids:
+            return 0
+
+        bitmap_bytes = bytearray(max(ids) // 8 + 1)
+
+        for object_id in ids:
+            bitmap_bytes[object_id >> 3] |= 1 << (object_id & 7)
+
+        return int.from_bytes(bitmap_bytes, 'little')
+
+    @staticmethod
+    def _get_bitmap_ids(bitmap: int) -> list[int]:
+        # numbers of the set bits, from the lowest
+
+        ids = []
+
+        while bitmap:
+
+            lowest_bit = bitmap & -bitmap
+            ids.append(lowest_bit.bit_length() - 1)
+            bitmap ^= lowest_bit
+
+        return ids
+
+    def _rebuild(self) -> None:
+
+        self._tags_bitmaps, self._media_tags = {}, {}
+
+        media_tags: dict[int, list[int]] = {}
+
+        for tag_id, media_id in Media.tags.through.objects.filter(
+                media__active=Media.ACTIVE
+        ).values_list('mediatags_id', 'media_id'):
+            media_tags.setdefault(tag_id, []).append(media_id)
+
+        # one bitmap building per tag instead of one big int operation per media tag
+        for tag_id, media_ids in media_tags.items():
+
+            self._tags_bitmaps[tag_id] = self._get_ids_bitmap(media_ids)
+
+            for media_id in media_ids:
+                self._media_tags.setdefault(media_id, set()).add(tag_id)
+
+    def _apply_changes(self, changes: list[tuple[str, int]]) -> None:
+
+        media_ids = {object_id for object_type, object_id in changes if object_type == self.MEDIA}
+        tags_ids = {object_id for object_type, object_id in changes if object_type == self.TAG}
+
+        # the changed objects are removed from the index, then their actual media tags are added
+
+        for media_id in media_ids:
+            for tag_id in list(self._media_tags.get(media_id, ())):
+                self._remove_media_tag(media_id, tag_id)
+
+        for tag_id in tags_ids:
+            for media_id in self._get_bitmap_ids(self._tags_bitmaps.get(tag_id, 0)):
+                self._remove_media_tag(media_id, tag_id)
+
+        for tag_id, media_id in Media.tags.through.objects.filter(
+                Q(media_id__in=media_ids) | Q(mediatags_id__in=tags_ids), media__active=Media.ACTIVE
+        ).values_list('mediatags_id', 'media_id'):
+            self._add_media_tag(media_id, tag_id)
+
+    def get_media_ids(self, tags_ids: list[int]) -> list[int]:
+        # returns the ids (ascending) of the active media having all of the tags
+
+        if not tags_ids:
+            return []
+
+        with self._lock:
+
+            self._update()
+
+            bitmap = -1
+
+            for tag_id in set(tags_ids):
+                bitmap &= self._tags_bitmaps.get(tag_id, 0)
+
+        return self._get_bitmap_ids(bitmap)
+
+    def get_tags_counts(self, media_ids=None) -> dict[int, int]:
+        # returns the numbers of the active media (of the media_ids if given) with each tag, except zeros
+
+        media_bitmap = -1 if media_ids is None else self._get_ids_bitmap(media_ids)
+
+        with self._lock:
+
+            self._update()
+
+            tags_counts = {
+                tag_id: (tags_bitmap & media_bitmap).bit_count() for tag_id, tags_bitmap in self._tags_bitmaps.items()
+            }
+
+        return {tag_id: count for tag_id, count in tags_counts.items() if count}
+
+
+# the indexes of this process
+autocomplete_index = AutocompleteIndex()
+tags_index = TagsIndex()
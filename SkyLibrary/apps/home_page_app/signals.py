@@ -0,0 +1,52 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from media_app.models import Media, MediaTags
+from .services import TagsIndex, autocomplete_index, tags_index, media_filter_version
+
+
+@receiver(post_save, sender=Media)
+@receiver(post_delete, sender=Media)
+def register_media_change(sender, instance: Media, **kwargs) -> None:
+    # after the commit, so the other processes reload the committed media
+    for index in (autocomplete_index, tags_index):
+        transaction.on_commit(partial(index.register_change, index.MEDIA, instance.id))
+
+    transaction.on_commit(media_filter_version.increment)
+
+
+@receiver(post_save, sender=MediaTags)
+@receiver(post_delete, sender=MediaTags)
+def register_media_tags_change(sender, instance: MediaTags, **kwargs) -> None:
+    # the deletion of a tag deletes its media tags rows without the m2m_changed signal
+    for index in (autocomplete_index, tags_index):
+        transaction.on_commit(partial(index.register_change, index.TAG, instance.id))
+
+    transaction.on_commit(media_filter_version.increment)
+
+
+@receiver(m2m_changed, sender=Media.tags.through)
+def register_media_tags_relation_change(sender, instance, action: str, reverse: bool, pk_set, **kwargs) -> None:
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    # reverse is True if the relation is changed from the tag side (tag.tags_media.add(...)),
+    # pk_set is None for "post_clear"
+    if reverse and pk_set is not None:
+        changes = [(TagsIndex.MEDIA, media_id) for media_id in pk_set]
+
+    elif reverse:
+        changes = [(TagsIndex.TAG, instance.id)]
+
+    else:
+        changes = [(TagsIndex.MEDIA, instance.id)]
+
+    for object_type, object_id in changes:
+        transaction.on_commit(partial(tags_index.register_change, object_type, object_id))
+
+    transaction.on_commit(media_filter_version.increment)
+
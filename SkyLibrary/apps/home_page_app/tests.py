@@ -1,7 +1,9 @@
 from ast import literal_eval
+from datetime import date, timedelta
 from re import sub
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.test.client import Client, RequestFactory
 from django.contrib.auth import get_user_model
 from django.urls import reverse
@@ -11,7 +13,7 @@ from crispy_forms.utils import render_crispy_form
 from .views import handler400, handler403, handler404, handler500
 from .forms import FilterMediaForm
 from media_app.models import Media, MediaTags, MediaRating
-from .services import _ASCENDING, _DESCENDING
+from .services import _ASCENDING, _DESCENDING, AutocompleteIndex, MediaFilter, TagsIndex
 
 User = get_user_model()
 
@@ -123,6 +125,7 @@ class ErrorsTestCase(TestCase):
         self.assertContains(response, 'Oops, server error', status_code=500)
 
 
+@override_settings(TAGS_INDEX_CHECK_INTERVAL=0)
 class FilterMediaTestCase(TestCase):
 
     @classmethod
@@ -477,6 +480,208 @@ class FilterMediaTestCase(TestCase):
             ),
         )
 
+    def test_post_filter_media_form_search(self):
+        self._test_post_filter_media_form_field(
+            'search',
+            f"{self.media_data_3['description']}",
+            (
+                (self.media_3, self.media_data_3, self.media_3_tags),
+            ),
+        )
+
+    def test_post_filter_media_form_search_words(self):
+        # every word must be found, in any of the title, author and description
+        self._test_post_filter_media_form_field(
+            'search',
+            f"{self.media_filter_1_and_3_medias_title_key} {self.media_data_3['author']}",
+            (
+                (self.media_3, self.media_data_3, self.media_3_tags),
+            ),
+        )
+
+    def test_post_filter_media_form_similar_text(self):
+
+        response = self.client.post(
+            reverse('index'),
+            {
+                'request_type': 'filter_media',
+                'title': self.media_filter_1_and_3_medias_title_key,
+                'author': self.media_data_3['author'],
+                'tags': '',
+                'similar_text': 'true',
+            },
+            **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'},
+        )
+
+        self.assertEqual(response.status_code, 200)
+
+        page_content = literal_eval(response.content.decode('utf-8'))['filter_results']
+
+        self.assertEqual([media_data['title'] for media_data in page_content], [self.media_data_3['title']])
+
+    def test_post_filter_media_form_tags_counts(self):
+
+        response = self.client.post(
+            reverse('index'),
+            {
+                'request_type': 'filter_media',
+                'title': self.media_filter_1_and_3_medias_title_key,
+                'tags': '',
+            },
+            **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'},
+        )
+
+        self.assertEqual(response.status_code, 200)
+
+        # media 1 and 3 are found, both have the tag 1, only media 3 has the tag 2
+        self.assertEqual(
+            literal_eval(response.content.decode('utf-8'))['tags_counts'],
+            {str(self.media_1_tags[0].id): 2, str(self.media_2_tags[0].id): 1},
+        )
+
+    def test_get_filter_media(self):
+
+        filter_media_data = {'title': self.media_filter_1_and_2_medias_title_key.upper(), 'tags': ''}
+
+        response = self.client.get(reverse('filter_media'), filter_media_data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age', response['Cache-Control'])
+
+        self.assertEqual(
+            [media_data['title'] for media_data in literal_eval(response.content.decode('utf-8'))['filter_results']],
+            [self.media_data_1['title'], self.media_data_2['title']],
+        )
+
+        # the same response (from the cache) is not sent again
+        response_not_modified = self.client.get(
+            reverse('filter_media'), filter_media_data, **{'HTTP_IF_NONE_MATCH': response['ETag']}
+        )
+
+        self.assertEqual(response_not_modified.status_code, 304)
+
+        # the cached response is changed with the media
+        with self.captureOnCommitCallbacks(execute=True):
+
+            media = Media.objects.get(id=self.media_2.id)
+            media.active = Media.INACTIVE
+            media.save()
+
+        response_changed = self.client.get(
+            reverse('filter_media'), filter_media_data, **{'HTTP_IF_NONE_MATCH': response['ETag']}
+        )
+
+        self.assertEqual(response_changed.status_code, 200)
+        self.assertEqual(
+            [
+                media_data['title']
+                for media_data in literal_eval(response_changed.content.decode('utf-8'))['filter_results']
+            ],
+            [self.media_data_1['title']],
+        )
+
+    def test_get_filter_media_incorrect_data(self):
+
+        response = self.client.get(reverse('filter_media'), {'tags': 'incorrect'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def _get_filter_media_pages_titles(self, filter_media_data: dict) -> list[list[str]]:
+        # follows the pages cursors, returns the titles of every page
+
+        pages_titles = []
+        cursor = ''
+
+        while cursor is not None:
+
+            response = self.client.get(reverse('filter_media'), {**filter_media_data, 'cursor': cursor})
+
+            self.assertEqual(response.status_code, 200)
+
+            response_data = literal_eval(response.content.decode('utf-8'))
+
+            pages_titles.append([media_data['title'] for media_data in response_data['filter_results']])
+            cursor = response_data.get('next_cursor')
+
+        return pages_titles
+
+    @override_settings(MEDIA_FILTER_PAGE_SIZE=2)
+    def test_get_filter_media_pages(self):
+
+        self.assertEqual(
+            self._get_filter_media_pages_titles({'tags': ''}),
+            [[self.media_data_1['title'], self.media_data_2['title']], [self.media_data_3['title']]],
+        )
+
+    @override_settings(MEDIA_FILTER_PAGE_SIZE=1)
+    def test_get_filter_media_pages_rating_direction(self):
+
+        # media 1 and 2 have the same rating, so the pages are sorted by id inside it
+        Media.objects.filter(id=self.media_1.id).update(rating_avg=self.media_2_rating.rating)
+
+        self.assertEqual(
+            self._get_filter_media_pages_titles({'tags': '', 'rating_direction': _DESCENDING}),
+            [[self.media_data_3['title']], [self.media_data_1['title']], [self.media_data_2['title']]],
+        )
+
+    @override_settings(MEDIA_FILTER_PAGE_SIZE=2)
+    def test_get_filter_media_pages_newest_first(self):
+
+        # the newest first sorting overrides the rating sorting
+        Media.objects.filter(id=self.media_3.id).update(pub_date=date.today() - timedelta(days=1))
+
+        self.assertEqual(
+            self._get_filter_media_pages_titles({'tags': '', 'rating_direction': _DESCENDING, 'newest_first': True}),
+            [[self.media_data_2['title'], self.media_data_1['title']], [self.media_data_3['title']]],
+        )
+
+    def test_get_filter_media_incorrect_cursor(self):
+
+        for cursor in ('incorrect', '1_2_3', f'incorrect_{self.media_1.id}'):
+
+            response = self.client.get(
+                reverse('filter_media'), {'tags': '', 'rating_direction': _DESCENDING, 'cursor': cursor}
+            )
+
+            self.assertEqual(response.status_code, 400)
+
+    @override_settings(TAGS_INDEX_CHECK_INTERVAL=60)
+    def test_post_filter_media_form_queries_number(self):
+
+        filter_media_data = {'request_type': 'filter_media', 'tags': ''}
+
+        # the tags index is loaded, it is not checked during the next minute
+        self.client.post(reverse('index'), filter_media_data, **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'})
+
+        # the page and its media tags, regardless of the media number
+        for page_size in (1, 3):
+            with self.settings(MEDIA_FILTER_PAGE_SIZE=page_size), self.assertNumQueries(2):
+
+                response = self.client.post(
+                    reverse('index'), filter_media_data, **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+                )
+
+                self.assertEqual(len(literal_eval(response.content.decode('utf-8'))['filter_results']), page_size)
+
+    @override_settings(MEDIA_RANKING_WEIGHTS={'text': 1.0, 'rating': 1.0, 'downloads': 0.5, 'freshness': 0.5})
+    def test_post_filter_media_form_best_first(self):
+
+        # the most downloaded and fresh media 1 is the best, the old media 3 with the maximum rating is the worst
+        Media.objects.filter(id=self.media_1.id).update(downloads_count=1000)
+        Media.objects.filter(id=self.media_3.id).update(pub_date=date.today() - timedelta(days=365))
+
+        response = self.client.post(
+            reverse('index'),
+            {'request_type': 'filter_media', 'tags': '', 'rating_direction': _DESCENDING, 'best_first': True},
+            **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [media_data['title'] for media_data in literal_eval(response.content.decode('utf-8'))['filter_results']],
+            [self.media_data_1['title'], self.media_data_2['title'], self.media_data_3['title']],
+        )
+
     def test_post_search_media_form_tags(self):
         self._test_post_filter_media_form_field(
             'tags',
@@ -529,6 +734,20 @@ class FilterMediaTestCase(TestCase):
             ),
         )
 
+    def test_post_search_media_form_rating_minimum_value_rounded(self):
+
+        # shown as the minimum value after the rounding, so must pass the filter
+        Media.objects.filter(id=self.media_2.id).update(rating_avg=self.media_2_rating.rating - 0.004)
+
+        self._test_post_filter_media_form_field(
+            'rating_minimum_value',
+            f'{self.media_2_rating.rating}',
+            (
+                (self.media_3, self.media_data_3, self.media_3_tags),
+                (self.media_2, self.media_data_2, self.media_2_tags),
+            ),
+        )
+
     def test_post_search_media_form_all(self):
 
         response = self.client.post(
@@ -573,3 +792,336 @@ class FilterMediaTestCase(TestCase):
 
                 self.assertEqual(response_tag['name'], media_tag.name_en_us)
                 self.assertEqual(response_tag['help_text'], media_tag.help_text_en_us)
+
+
+@override_settings(AUTOCOMPLETE_INDEX_CHECK_INTERVAL=0)
+class AutocompleteTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        super().setUpClass()
+
+        cls.client = Client()
+
+        cls.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test_email@mail.com', role=1
+        )
+
+        cls.tag = MediaTags.objects.create(
+            name_en_us='Science fiction',
+            help_text_en_us='test tag help text',
+            name_ru='Научная фантастика',
+            help_text_ru='test tag help text ru',
+            user_who_added=cls.user,
+        )
+
+        cls.media = Media.objects.create(
+            title='The Great Gatsby',
+            description='test_description_1',
+            author='Francis Scott Fitzgerald',
+            user_who_added=cls.user,
+            active=Media.ACTIVE,
+        )
+        Media.objects.create(
+            title='Tender Is the Night',
+            description='test_description_2',
+            author='Francis Scott Fitzgerald',
+            user_who_added=cls.user,
+            active=Media.ACTIVE,
+        )
+        Media.objects.create(
+            title='The Great Inactive',
+            description='test_description_3',
+            author='test_author',
+            user_who_added=cls.user,
+            active=Media.INACTIVE,
+        )
+
+    def test_get_suggestions(self):
+
+        autocomplete_index = AutocompleteIndex()
+
+        self.assertEqual(
+            autocomplete_index.get_suggestions('gat', 'en-us'),
+            [{
+                'type': 'title',
+                'text': 'The Great Gatsby',
+                'link': reverse('view_media', kwargs={'media_id': self.media.id}),
+            }],
+        )
+
+        # one suggestion for an author of many media
+        self.assertEqual(
+            autocomplete_index.get_suggestions('  FRANCIS  scott ', 'en-us'),
+            [{'type': 'author', 'text': 'Francis Scott Fitzgerald'}],
+        )
+
+        self.assertEqual(
+            autocomplete_index.get_suggestions('фант', 'ru'),
+            [{'type': 'tag', 'text': 'Научная фантастика', 'id': self.tag.id}],
+        )
+        self.assertEqual(autocomplete_index.get_suggestions('фант', 'en-us'), [])
+
+        self.assertEqual(autocomplete_index.get_suggestions('great inactive', 'en-us'), [])
+        self.assertEqual(autocomplete_index.get_suggestions('', 'en-us'), [])
+        self.assertEqual(len(autocomplete_index.get_suggestions('t', 'en-us', limit=2)), 2)
+
+    @override_settings(AUTOCOMPLETE_INDEX_CHECK_INTERVAL=60)
+    def test_get_suggestions_without_database(self):
+
+        autocomplete_index = AutocompleteIndex()
+
+        autocomplete_index.get_suggestions('gat', 'en-us')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(len(autocomplete_index.get_suggestions('tender', 'en-us')), 1)
+
+    def test_changes(self):
+
+        autocomplete_index = AutocompleteIndex()
+
+        autocomplete_index.get_suggestions('gat', 'en-us')
+
+        with self.captureOnCommitCallbacks(execute=True):
+
+            media = Media.objects.get(id=self.media.id)
+            media.title = 'The Great Gatsby 2'
+            media.save()
+
+            MediaTags.objects.get(id=self.tag.id).delete()
+
+        # the index of another process reloads only the changed objects
+        other_autocomplete_index = AutocompleteIndex()
+        other_autocomplete_index.get_suggestions('gat', 'en-us')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Media.objects.filter(title='The Great Inactive').get().delete()
+
+        for index in (autocomplete_index, other_autocomplete_index):
+
+            self.assertEqual(
+                [suggestion['text'] for suggestion in index.get_suggestions('gat', 'en-us')], ['The Great Gatsby 2']
+            )
+            self.assertEqual(index.get_suggestions('science', 'en-us'), [])
+
+    def test_changes_with_same_version(self):
+
+        autocomplete_index = AutocompleteIndex()
+
+        other_autocomplete_index = AutocompleteIndex()
+        other_autocomplete_index.get_suggestions('gat', 'en-us')
+
+        version = cache.get(autocomplete_index._version_key)
+
+        # two concurrent changes get the same version (the cache increments values with a get and a set)
+        for title in ('The Great Gatsby 2', 'Tender Is the Night 2'):
+
+            media = Media.objects.get(title=title[:-2])
+
+            Media.objects.filter(id=media.id).update(title=title)
+
+            cache.set(autocomplete_index._version_key, version, None)
+            autocomplete_index.register_change(autocomplete_index.MEDIA, media.id)
+
+        # the index of another process is rebuilt
+        self.assertEqual(
+            [suggestion['text'] for suggestion in other_autocomplete_index.get_suggestions('2', 'en-us')],
+            ['The Great Gatsby 2', 'Tender Is the Night 2'],
+        )
+
+    def test_get_autocomplete_ajax(self):
+
+        response = self.client.get(
+            reverse('index'),
+            {'request_type': 'autocomplete', 'text': 'tender'},
+            **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [suggestion['text'] for suggestion in literal_eval(response.content.decode('utf-8'))['suggestions']],
+            ['Tender Is the Night'],
+        )
+
+
+@override_settings(TAGS_INDEX_CHECK_INTERVAL=0)
+class TagsIndexTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test_email@mail.com', role=1
+        )
+
+        cls.tags = [
+            MediaTags.objects.create(
+                name_en_us=f'test tag {i}',
+                help_text_en_us=f'test tag {i} help text',
+                name_ru=f'test tag {i} ru',
+                help_text_ru=f'test tag {i} help text ru',
+                user_who_added=cls.user,
+            )
+            for i in range(3)
+        ]
+
+        cls.media = []
+
+        for i, (media_tags, active) in enumerate((
+                (cls.tags[:1], Media.ACTIVE),
+                (cls.tags[:2], Media.ACTIVE),
+                (cls.tags, Media.ACTIVE),
+                (cls.tags, Media.INACTIVE),
+        )):
+
+            media = Media.objects.create(
+                title=f'test_title_{i}',
+                description=f'test_description_{i}',
+                author='test_author',
+                user_who_added=cls.user,
+                active=active,
+            )
+            media.tags.set(media_tags)
+
+            cls.media.append(media)
+
+    def _get_media_ids(self, tags_index: TagsIndex, *tags: MediaTags) -> list[int]:
+        return tags_index.get_media_ids([tag.id for tag in tags])
+
+    def test_get_media_ids(self):
+
+        tags_index = TagsIndex()
+
+        self.assertEqual(self._get_media_ids(tags_index, self.tags[0]), [media.id for media in self.media[:3]])
+        self.assertEqual(
+            self._get_media_ids(tags_index, self.tags[0], self.tags[1]), [self.media[1].id, self.media[2].id]
+        )
+        self.assertEqual(self._get_media_ids(tags_index, *self.tags), [self.media[2].id])
+        self.assertEqual(tags_index.get_media_ids([]), [])
+        self.assertEqual(tags_index.get_media_ids([self.tags[-1].id + 1]), [])
+
+    def test_get_tags_counts(self):
+
+        tags_index = TagsIndex()
+
+        self.assertEqual(
+            tags_index.get_tags_counts(), {self.tags[0].id: 3, self.tags[1].id: 2, self.tags[2].id: 1}
+        )
+        self.assertEqual(
+            tags_index.get_tags_counts([self.media[0].id, self.media[2].id]),
+            {self.tags[0].id: 2, self.tags[1].id: 1, self.tags[2].id: 1},
+        )
+        self.assertEqual(tags_index.get_tags_counts([]), {})
+
+    def test_changes(self):
+
+        # the index of another process, the changes are registered in the process index (home_page_app.signals)
+        tags_index = TagsIndex()
+
+        self.assertEqual(self._get_media_ids(tags_index, self.tags[2]), [self.media[2].id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+
+            self.media[0].tags.add(self.tags[2])
+            self.tags[2].tags_media.remove(self.media[2])
+
+            media = Media.objects.get(id=self.media[3].id)
+            media.active = Media.ACTIVE
+            media.save()
+
+        self.assertEqual(self._get_media_ids(tags_index, self.tags[2]), [self.media[0].id, self.media[3].id])
+
+        other_tags_index = TagsIndex()
+        other_tags_index.get_media_ids([self.tags[0].id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MediaTags.objects.get(id=self.tags[1].id).delete()
+
+        for index in (tags_index, other_tags_index):
+
+            self.assertEqual(self._get_media_ids(index, self.tags[1]), [])
+            self.assertEqual(
+                self._get_media_ids(index, self.tags[0], self.tags[2]), [self.media[0].id, self.media[3].id]
+            )
+
+
+class BlendedScoreTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        super().setUpClass()
+
+        user = User.objects.create_user(
+            username='test_user', password='test_password', email='test_email@mail.com', role=1
+        )
+
+        cls.media = []
+
+        for i in range(12):
+
+            media = Media.objects.create(
+                title=f'test_title_{i}',
+                description=f'test_description_{i}',
+                author='test_author',
+                user_who_added=user,
+                active=Media.ACTIVE,
+            )
+
+            # different orders of the ratings, the downloads and the dates
+            Media.objects.filter(id=media.id).update(
+                rating_avg=(i * 7) % 12 / 12 * max(MediaRating.rating_choices_list),
+                downloads_count=(i * 5) % 12 * 20,
+                pub_date=date.today() - timedelta(days=(i * 11) % 12 * 10),
+            )
+
+            cls.media.append(media)
+
+    def _get_media_filter(self) -> MediaFilter:
+
+        media_filter = MediaFilter()
+        media_filter.order_by_blended_score()
+
+        return media_filter
+
+    def test_get_page(self):
+
+        all_media_ids = [media.id for media in self._get_media_filter().get(None)]
+
+        for factor in (1, 2, 3):
+            for page_size in range(1, len(self.media) + 1):
+                with self.settings(MEDIA_RANKING_TOP_CANDIDATES_FACTOR=factor):
+
+                    media_filter = self._get_media_filter()
+
+                    page, next_cursor = media_filter.get_page(page_size=page_size)
+
+                    self.assertEqual([media.id for media in page], all_media_ids[:page_size])
+
+                    if next_cursor is None:
+                        continue
+
+                    next_page, _ = media_filter.get_page(next_cursor, page_size=page_size)
+
+                    self.assertEqual(
+                        [media.id for media in next_page], all_media_ids[page_size:page_size * 2]
+                    )
+
+    def test_get_page_with_indexes(self):
+
+        # the best media by every field, so they are found without the sorting of all of the media
+        for media, downloads_count in ((self.media[0], 1000), (self.media[1], 900)):
+            Media.objects.filter(id=media.id).update(
+                rating_avg=max(MediaRating.rating_choices_list), downloads_count=downloads_count, pub_date=date.today()
+            )
+
+        with self.settings(MEDIA_RANKING_TOP_CANDIDATES_FACTOR=2), self.assertNumQueries(4):
+
+            # the candidates of the 3 indexed fields and the candidates sorting
+            page, next_cursor = self._get_media_filter().get_page(page_size=1)
+
+        self.assertEqual([media.id for media in page], [self.media[0].id])
+        self.assertIsNotNone(next_cursor)
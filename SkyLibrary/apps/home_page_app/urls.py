@@ -1,7 +1,8 @@
 from django.urls import path
 
-from .views import ViewIndex
+from .views import ViewIndex, ViewFilterMedia
 
 urlpatterns = [
     path('', ViewIndex.as_view(), name='index'),
+    path('filter/', ViewFilterMedia.as_view(), name='filter_media'),
 ]
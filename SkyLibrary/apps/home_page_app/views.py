@@ -1,18 +1,22 @@
 from json import dumps
+from hashlib import sha1
 
+from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import render
 from django.views import View
 from django.utils.translation import gettext_lazy as _
 from django.utils.translation import get_language
-from django.http import HttpResponse
-from django.urls import reverse_lazy
+from django.http import HttpResponse, QueryDict
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.urls import reverse
 
 from crispy_forms.utils import render_crispy_form
 
 from accounts_app.models import User
 from .forms import FilterMediaForm
-from .services import RATING_DIRECTION_CHOICES_LIST, MediaFilter
-from media_app.models import MediaRating
+from .services import RATING_DIRECTION_CHOICES_LIST, MediaFilter, autocomplete_index, media_filter_version
+from media_app.models import Media, MediaRating
 
 
 def handler400(request, exception=None):
@@ -31,6 +35,172 @@ def handler500(request):
     return render(request, 'errors/500.html', status=500)
 
 
+def _filter_media_by_text_safe(
+        filter_media_form: FilterMediaForm,
+        media_filter: MediaFilter,
+        post_field_name: str,
+        filter_function_name: str,
+        **filter_function_kwargs,
+) -> None:
+
+    field_value = filter_media_form.cleaned_data.get(post_field_name, None)
+
+    if field_value:
+        getattr(media_filter, filter_function_name)(field_value, **filter_function_kwargs)
+
+
+def _get_filter_media_form(request_data: QueryDict) -> FilterMediaForm:
+
+    # needed for correct work with the frontend, tags are sent as one comma separated value:
+
+    request_data_mutable = request_data.copy()
+
+    tags = []
+
+    for tags_value in request_data_mutable.getlist('tags'):
+        tags += [tag for tag in tags_value.split(',') if tag]
+
+    request_data_mutable.setlist('tags', tags)
+
+    return FilterMediaForm(request_data_mutable)
+
+
+def _get_media_filter(filter_media_form: FilterMediaForm) -> MediaFilter:
+    # the filter form must be valid
+
+    media_filter = MediaFilter()
+
+    # rating part:
+
+    rating_filters = {
+        'minimum_value': filter_media_form.cleaned_data.get('rating_minimum_value', None),
+        'maximum_value': filter_media_form.cleaned_data.get('rating_maximum_value', None),
+        'direction': filter_media_form.cleaned_data.get('rating_direction', None),
+    }
+
+    # convert numbers in strings to numbers ('1' -> 1)
+    for key, value in rating_filters.items():
+        if value and value.isdigit():
+            rating_filters[key] = int(value)
+
+    # removing unavailable filters:
+
+    if rating_filters['minimum_value'] not in MediaRating.rating_choices_list:
+        del rating_filters['minimum_value']
+
+    if rating_filters['maximum_value'] not in MediaRating.rating_choices_list:
+        del rating_filters['maximum_value']
+
+    if rating_filters['direction'] not in RATING_DIRECTION_CHOICES_LIST:
+        del rating_filters['direction']
+
+    if rating_filters:
+        media_filter.filter_by_rating(**rating_filters)
+
+    # tags part:
+
+    tags_filter = filter_media_form.cleaned_data.get('tags', [])
+
+    if any(tags_filter):
+        media_filter.filter_by_tags(tags_filter)
+
+    # search, user_who_added, title and author part:
+
+    _filter_media_by_text_safe(filter_media_form, media_filter, 'search', 'filter_by_search')
+
+    text_filters = (
+        ('user_who_added', 'filter_by_user_who_added'),
+        ('title', 'filter_by_title'),
+        ('author', 'filter_by_author'),
+    )
+
+    similar_text = filter_media_form.cleaned_data.get('similar_text', False)
+
+    for post_field_name, filter_function_name in text_filters:
+        _filter_media_by_text_safe(
+            filter_media_form, media_filter, post_field_name, filter_function_name, similar=similar_text
+        )
+
+    # sorting part (overrides the rating, search and similarity sorting):
+
+    if filter_media_form.cleaned_data.get('best_first', False):
+        media_filter.order_by_blended_score()
+
+    if filter_media_form.cleaned_data.get('newest_first', False):
+        media_filter.order_by_recency()
+
+    return media_filter
+
+
+def _get_language_suffix() -> str | None:
+    # the suffix of the MediaTags translated fields, None if the language is not supported
+
+    language = get_language()
+
+    if language == 'en-us':
+        return 'en_us'
+
+    elif language == 'ru':
+        return 'ru'
+
+    else:
+        return None
+
+
+def _get_media_link_parts() -> tuple[str, str]:
+    # the link is the same for every media except the id, so the url is reversed once: prefix + id + suffix
+    return reverse('view_media', kwargs={'media_id': 0}).rsplit('0', 1)
+
+
+def _get_filter_response_data(media_filter: MediaFilter, cursor: str | None = None) -> dict | None:
+    """
+        Returns the filter response data: the page of the filtered media, the next page cursor and the tags counts,
+        or None if the language is not supported. Raises ValueError if the cursor is incorrect.
+
+        A fixed number of queries: the page (only the shown fields), the tags of all of the page media
+        and the tags counts (see MediaFilter.get_tags_counts).
+    """
+
+    language_suffix = _get_language_suffix()
+
+    if language_suffix is None:
+        return None
+
+    page_media, next_cursor = media_filter.get_page(cursor, fields=('id', 'title', 'rating_avg', 'comments_count'))
+
+    page_media_tags: dict[int, list[dict[str, str]]] = {media_data['id']: [] for media_data in page_media}
+
+    if page_media_tags:
+
+        media_tags = Media.tags.through.objects.filter(media_id__in=page_media_tags).order_by('id').values_list(
+            'media_id', f'mediatags__name_{language_suffix}', f'mediatags__help_text_{language_suffix}'
+        )
+
+        for media_id, tag_name, tag_help_text in media_tags:
+            page_media_tags[media_id].append({'name': tag_name, 'help_text': tag_help_text})
+
+    link_prefix, link_suffix = _get_media_link_parts()
+
+    page_media_data = [
+        {
+            'title': media_data['title'],
+            'rating': round(media_data['rating_avg'], 2),
+            'comments_count': media_data['comments_count'],
+            'link': f"{link_prefix}{media_data['id']}{link_suffix}",
+            'tags': page_media_tags[media_data['id']],
+        }
+        for media_data in page_media
+    ]
+
+    response_data = {'filter_results': page_media_data, 'tags_counts': media_filter.get_tags_counts()}
+
+    # the cursor of the next page ("cursor" parameter), it is not set on the last page
+    if next_cursor is not None:
+        response_data['next_cursor'] = next_cursor
+
+    return response_data
+
+
 class ViewIndex(View):
 
     template_name: str = 'home_page_app/index.html'
@@ -42,143 +212,114 @@ class ViewIndex(View):
 
     def get(self, request):
 
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest' and \
+                request.GET.get('request_type') == 'autocomplete':
+
+            suggestions = autocomplete_index.get_suggestions(request.GET.get('text', '')[:300], get_language())
+
+            return HttpResponse(dumps({'suggestions': suggestions}), content_type='application/json')
+
         media_filter = MediaFilter()
 
-        media_filter.filter_by_rating()
+        media_filter.order_by_blended_score()
 
-        best_media = media_filter.get(20)
+        # found with the indexes, without sorting all of the media (see MediaFilter.get_page)
+        best_media, _ = media_filter.get_page(page_size=20)
 
         response_data: dict = {
             'best_media': best_media,
+            # the numbers of all active media with each tag, without filters
+            'tags_counts': MediaFilter().get_tags_counts(),
             'is_user_moderator': request.user.role == User.MODERATOR if request.user.is_authenticated else 0,
             'filter_form': FilterMediaForm(),
         }
 
         return render(request, self.template_name, response_data)
 
-    @staticmethod
-    def _filter_media_by_text_safe(
-            filter_media_form: FilterMediaForm,
-            media_filter: MediaFilter,
-            post_field_name: str,
-            filter_function_name: str,
-    ) -> None:
-
-        field_value = filter_media_form.cleaned_data.get(post_field_name, None)
-
-        if field_value:
-            getattr(media_filter, filter_function_name)(field_value)
-
     def post(self, request):
 
         if request.headers.get('x-requested-with') == 'XMLHttpRequest' and \
                 request.POST.get('request_type') == 'filter_media':
 
-            # needed for correct work with the frontend:
-
-            request_post_mutable = request.POST.copy()
-
-            if tags := request_post_mutable['tags']:
-                tags = tags.split(',')
-
-            else:
-                tags = []
-
-            request_post_mutable.setlist('tags', tags)
-
-            filter_media_form = FilterMediaForm(request_post_mutable)
+            filter_media_form = _get_filter_media_form(request.POST)
 
             if filter_media_form.is_valid():
 
-                media_filter = MediaFilter()
-
-                # rating part:
-
-                rating_filters = {
-                    'minimum_value': filter_media_form.cleaned_data.get('rating_minimum_value', None),
-                    'maximum_value': filter_media_form.cleaned_data.get('rating_maximum_value', None),
-                    'direction': filter_media_form.cleaned_data.get('rating_direction', None),
-                }
+                try:
+                    response_data = _get_filter_response_data(
+                        _get_media_filter(filter_media_form), request.POST.get('cursor') or None
+                    )
 
-                # convert numbers in strings to numbers ('1' -> 1)
-                for key, value in rating_filters.items():
-                    if value and value.isdigit():
-                        rating_filters[key] = int(value)
+                except ValueError:
+                    return handler400(request)
 
-                # removing unavailable filters:
+                if response_data is None:
+                    return handler500(request)
 
-                if rating_filters['minimum_value'] not in MediaRating.rating_choices_list:
-                    del rating_filters['minimum_value']
+                return HttpResponse(dumps(response_data), content_type='application/json')
 
-                if rating_filters['maximum_value'] not in MediaRating.rating_choices_list:
-                    del rating_filters['maximum_value']
+            else:
+                return handler400(request)
 
-                if rating_filters['direction'] not in RATING_DIRECTION_CHOICES_LIST:
-                    del rating_filters['direction']
+        else:
+            return handler404(request)
 
-                if rating_filters:
-                    media_filter.filter_by_rating(**rating_filters)
 
-                # tags part:
+class ViewFilterMedia(View):
+    """
+        Cacheable variant of the ViewIndex media filter, the filter form fields are GET parameters.
 
-                tags_filter = filter_media_form.cleaned_data.get('tags', [])
+        The response is cached per language, filters (see MediaFilter.get_key) and page cursor
+        until the media or tags change (see media_filter_version, the media counters may be outdated),
+        at most settings.MEDIA_FILTER_CACHE_TIMEOUT seconds,
+        and is sent with the ETag and Cache-Control headers, so browsers can reuse it.
+    """
 
-                if any(tags_filter):
-                    media_filter.filter_by_tags(tags_filter)
+    def get(self, request):
 
-                # user_who_added, title and author part:
+        filter_media_form = _get_filter_media_form(request.GET)
 
-                text_filters = (
-                    ('user_who_added', 'filter_by_user_who_added'),
-                    ('title', 'filter_by_title'),
-                    ('author', 'filter_by_author'),
-                )
+        if not filter_media_form.is_valid():
+            return handler400(request)
 
-                for post_field_name, filter_function_name in text_filters:
-                    self._filter_media_by_text_safe(
-                        filter_media_form, media_filter, post_field_name, filter_function_name
-                    )
+        media_filter = _get_media_filter(filter_media_form)
 
-                # return part:
+        cursor = request.GET.get('cursor') or None
 
-                page_media_data = []
+        # the cursor is a part of the key, it is checked by the page getting
+        cache_key = 'media_filter_response_{language}_{filter_key}_{cursor}_{version}'.format(
+            language=get_language(),
+            filter_key=media_filter.get_key(),
+            cursor=sha1(str(cursor).encode()).hexdigest(),
+            version=media_filter_version.get(),
+        )
 
-                if media_filter_result := media_filter.get(20):
+        content_and_etag: tuple[str, str] | None = cache.get(cache_key)
 
-                    language = get_language()
+        if content_and_etag is None:
 
-                    if language == 'en-us':
-                        language_suffix = 'en_us'
+            try:
+                response_data = _get_filter_response_data(media_filter, cursor)
 
-                    elif language == 'ru':
-                        language_suffix = 'ru'
+            except ValueError:
+                return handler400(request)
 
-                    else:
-                        return handler500(request)
+            if response_data is None:
+                return handler500(request)
 
-                    for page_media_object in media_filter_result:
+            content = dumps(response_data)
 
-                        page_media_object_tags = []
+            content_and_etag = (content, f'"{sha1(content.encode()).hexdigest()}"')
 
-                        for tag in page_media_object.tags.values():
-                            page_media_object_tags.append({
-                                'name': tag[f'name_{language_suffix}'],
-                                'help_text': tag[f'help_text_{language_suffix}'],
-                            })
+            cache.set(cache_key, content_and_etag, settings.MEDIA_FILTER_CACHE_TIMEOUT)
 
-                        page_media_data.append({
-                            'title': page_media_object.title,
-                            'rating': page_media_object.get_rating(),
-                            'link': f"{reverse_lazy('view_media', kwargs={'media_id': page_media_object.id})}",
-                            'tags': page_media_object_tags,
-                        })
+        content, etag = content_and_etag
 
-                return HttpResponse(
-                    dumps({'filter_results': page_media_data}), content_type='application/json'
-                )
+        # 304 if the browser has the same response
+        response = get_conditional_response(request, etag=etag) or \
+            HttpResponse(content, content_type='application/json')
 
-            else:
-                return handler400(request)
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_FILTER_BROWSER_CACHE_MAX_AGE)
 
-        else:
-            return handler404(request)
+        return response
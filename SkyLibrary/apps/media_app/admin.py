@@ -5,12 +5,14 @@ from django import forms
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import permission_required
 
-from .models import MediaTags, Media, MediaDownload, MediaRating, Comment, CommentRating, ReportType, Report
+from .models import MediaTags, Media, MediaDownload, MediaRating, Comment, CommentRating, ReportType, Report, \
+    PendingUpload
 
 
 admin.site.register(MediaDownload)
 admin.site.register(MediaRating)
 admin.site.register(CommentRating)
+admin.site.register(PendingUpload)
 
 
 @admin.register(MediaTags)
@@ -8,12 +8,13 @@ from django.conf import settings
 from django.core.cache import cache
 from django.core.cache.utils import make_template_fragment_key
 
+from botocore.exceptions import ClientError
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Submit, Field
 from crispy_forms.bootstrap import FormActions
 from crispy_bootstrap5.bootstrap5 import FloatingField
 
-from .models import Media, MediaTags, ReportType
+from .models import Media, MediaTags, ReportType, PendingUpload
 from app_main.s3_storage import get_s3_connection
 
 
@@ -30,6 +31,13 @@ class CreateOrUpdateMediaForm(forms.ModelForm):
     file = forms.FileField(required=False, label=_('File'))
     file_key = forms.CharField(required=False, max_length=300, widget=forms.HiddenInput())
 
+    def __init__(self, *args, user=None, **kwargs):
+
+        super().__init__(*args, **kwargs)
+
+        # the request user, only the files uploaded by the user can be used (see clean_file_key)
+        self.user = user
+
     def _is_update(self) -> bool:
         return True if self.instance.title else False
 
@@ -115,14 +123,32 @@ class CreateOrUpdateMediaForm(forms.ModelForm):
 
             else:
 
+                if self.user is None or self.user.is_anonymous:
+
+                    self.add_error(None, ValidationError(error_message, code='file_not_uploaded_by_user'))
+
+                    return
+
+                # the uploads of the user completed by S3AuthMultipartDoCompleteView
+                if PendingUpload.objects.filter(user_who_added=self.user, file_key=file_key, completed=True).exists():
+                    return file_key
+
+                # the files uploaded without the registry (or with the expired registry entry),
+                # only in the user upload directory (see get_upload)
+                if not file_key.startswith(f"{settings.MEDIA_URL.replace('/', '')}/media_app/{self.user.username}/"):
+
+                    self.add_error(None, ValidationError(error_message, code='file_not_uploaded_by_user'))
+
+                    return
+
                 s3 = get_s3_connection()
 
-                s3_objects = [i['Key'] for i in s3.list_objects(Bucket=settings.MEDIA_STORAGE_BUCKET_NAME)['Contents']]
+                try:
+                    s3.head_object(Bucket=settings.MEDIA_STORAGE_BUCKET_NAME, Key=file_key)
 
-                if file_key in s3_objects:
                     return file_key
 
-                else:
+                except ClientError:
 
                     self.add_error(None, ValidationError(error_message, code='file_not_exists_in_s3_storage'))
 
@@ -0,0 +1,29 @@
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from media_app.services import abort_expired_pending_uploads
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Abort the media files multipart uploads older than settings.S3_UPLOAD_RESUME_TIMEOUT (not completed '
+        'and not resumed by the users), so their uploaded parts are deleted from the S3 storage'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=int, default=None, help='Run as a worker, aborting the uploads every INTERVAL seconds'
+        )
+
+    def handle(self, *args, **kwargs):
+
+        while True:
+
+            self.stdout.write(f'Aborted expired uploads: {abort_expired_pending_uploads()}')
+
+            if kwargs['interval'] is None:
+                break
+
+            sleep(kwargs['interval'])
@@ -0,0 +1,129 @@
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from statistics import median
+from threading import Thread
+from time import perf_counter
+
+from boto3.session import Session as Boto3_Session
+from botocore.client import Config
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from app_main.s3_storage import get_s3_connection, reset_s3_connection
+
+
+class _S3StandInRequestHandler(BaseHTTPRequestHandler):
+    # answers every request as a successful empty S3 response, with keep-alive connections
+
+    protocol_version = 'HTTP/1.1'
+
+    def _send_empty_response(self):
+
+        if content_length := int(self.headers.get('Content-Length') or 0):
+            self.rfile.read(content_length)
+
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.send_header('ETag', '"benchmark"')
+        self.end_headers()
+
+    do_GET = do_HEAD = do_PUT = do_POST = do_DELETE = _send_empty_response
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Measure the S3 requests latency with a new client per request (the previous get_s3_connection) '
+        'and with the process client (app_main.s3_storage.get_s3_connection), '
+        'on a local S3 stand-in server by default'
+    )
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--endpoint-url', default=None, help='S3 compatible storage (e.g. a local MinIO) instead of the stand-in'
+        )
+        parser.add_argument('--bucket', default='benchmark', help='Bucket of the --endpoint-url storage')
+        parser.add_argument('--repeats', type=int, default=200, help='Requests for every measurement')
+        parser.add_argument('--threads', type=int, default=8, help='Threads of the parallel measurements')
+
+    @staticmethod
+    def _get_new_client():
+        # the previous get_s3_connection: a new session and client (and connections) on every call
+        return Boto3_Session(
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        ).client(
+            service_name='s3', endpoint_url=settings.AWS_S3_ENDPOINT_URL, config=Config(signature_version='s3v4')
+        )
+
+    def _measure(self, request, repeats: int, threads: int) -> tuple[float, float]:
+        # median request milliseconds in one thread and requests per second in "threads" threads
+
+        timings = []
+
+        for _ in range(repeats):
+
+            start = perf_counter()
+            request()
+            timings.append(perf_counter() - start)
+
+        start = perf_counter()
+
+        with ThreadPoolExecutor(threads) as executor:
+            for future in [executor.submit(request) for _ in range(repeats)]:
+                future.result()
+
+        return median(timings) * 1000, repeats / (perf_counter() - start)
+
+    def handle(self, *args, **kwargs):
+
+        endpoint_url = kwargs['endpoint_url']
+        bucket = kwargs['bucket']
+        server = None
+
+        if endpoint_url is None:
+
+            server = ThreadingHTTPServer(('127.0.0.1', 0), _S3StandInRequestHandler)
+            Thread(target=server.serve_forever, daemon=True).start()
+
+            endpoint_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+        requests = {
+            'new client, presign': lambda: self._get_new_client().generate_presigned_url(
+                'put_object', Params={'Bucket': bucket, 'Key': 'benchmark'}
+            ),
+            'process client, presign': lambda: get_s3_connection().generate_presigned_url(
+                'put_object', Params={'Bucket': bucket, 'Key': 'benchmark'}
+            ),
+            'new client, head': lambda: self._get_new_client().head_bucket(Bucket=bucket),
+            'process client, head': lambda: get_s3_connection().head_bucket(Bucket=bucket),
+        }
+
+        try:
+            with override_settings(
+                AWS_S3_ENDPOINT_URL=endpoint_url,
+                AWS_ACCESS_KEY_ID=settings.AWS_ACCESS_KEY_ID or 'benchmark',
+                AWS_SECRET_ACCESS_KEY=settings.AWS_SECRET_ACCESS_KEY or 'benchmark',
+            ):
+
+                reset_s3_connection()
+
+                self.stdout.write(f'{"request":>25}{"median ms":>15}{"requests/s":>15}  ({endpoint_url})')
+
+                for name, request in requests.items():
+
+                    median_ms, requests_per_second = self._measure(request, kwargs['repeats'], kwargs['threads'])
+
+                    self.stdout.write(f'{name:>25}{median_ms:>15.2f}{requests_per_second:>15.1f}')
+
+        finally:
+
+            reset_s3_connection()
+
+            if server is not None:
+                server.shutdown()
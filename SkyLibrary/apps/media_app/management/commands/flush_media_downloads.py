@@ -0,0 +1,31 @@
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from media_app.services import flush_media_downloads_buffer
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Save the media downloads buffered in the cache to the database, '
+        'must be run more often than settings.MEDIA_DOWNLOADS_BUFFER_TIMEOUT and only in one process'
+    )
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--batch-size', type=int, default=1000, help='Downloads saved with one query')
+        parser.add_argument(
+            '--interval', type=int, default=None, help='Run as a worker, flushing the buffer every INTERVAL seconds'
+        )
+
+    def handle(self, *args, **kwargs):
+
+        while True:
+
+            self.stdout.write(f'Flushed media downloads: {flush_media_downloads_buffer(kwargs["batch_size"])}')
+
+            if kwargs['interval'] is None:
+                break
+
+            sleep(kwargs['interval'])
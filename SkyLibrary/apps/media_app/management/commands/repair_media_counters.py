@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from media_app.models import Media, MediaDownload, Comment
+from media_app.services import get_actual_media_count
+
+
+class Command(BaseCommand):
+
+    help = 'Check the media downloads and comments counters against the source tables and repair the wrong ones'
+
+    counters = {
+        'downloads_count': MediaDownload,
+        'comments_count': Comment,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only show the wrong counters, do not repair them')
+
+    def handle(self, *args, **kwargs):
+
+        actual_counts = {counter: get_actual_media_count(model) for counter, model in self.counters.items()}
+
+        wrong_media = Media.objects.annotate(
+            **{f'actual_{counter}': actual_count for counter, actual_count in actual_counts.items()}
+        ).exclude(
+            **{counter: F(f'actual_{counter}') for counter in self.counters}
+        ).values('id', *self.counters, *[f'actual_{counter}' for counter in self.counters])
+
+        wrong_media_ids = []
+
+        for media in wrong_media:
+
+            wrong_media_ids.append(media['id'])
+
+            self.stdout.write(
+                f'Media (id: {media["id"]}): '
+                + ', '.join(f'{counter} {media[counter]} -> {media[f"actual_{counter}"]}' for counter in self.counters)
+            )
+
+        if not wrong_media_ids:
+            self.stdout.write('All media counters are correct')
+
+        elif kwargs['dry_run']:
+            self.stdout.write(f'Wrong media counters: {len(wrong_media_ids)} (not repaired, dry run)')
+
+        else:
+
+            # the counters are calculated again in the UPDATE, so changes made after the check are not lost
+            Media.objects.filter(id__in=wrong_media_ids).update(**actual_counts)
+
+            self.stdout.write(f'Repaired media counters: {len(wrong_media_ids)}')
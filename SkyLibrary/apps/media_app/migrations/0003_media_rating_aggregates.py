@@ -0,0 +1,49 @@
+# Generated by Django 4.2.22 on 2026-10-18 08:58
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_media_rating_aggregates(apps, schema_editor):
+
+    Media = apps.get_model('media_app', 'Media')
+    MediaRating = apps.get_model('media_app', 'MediaRating')
+
+    media_ratings = MediaRating.objects.filter(media=OuterRef('pk')).order_by().values('media')
+
+    Media.objects.update(
+        rating_sum=Coalesce(Subquery(media_ratings.annotate(value=Sum('rating')).values('value')), Value(0)),
+        rating_count=Coalesce(Subquery(media_ratings.annotate(value=Count('id')).values('value')), Value(0)),
+        rating_avg=Coalesce(
+            Subquery(media_ratings.annotate(value=Avg('rating')).values('value')),
+            Value(0.0),
+            output_field=models.FloatField(),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0002_alter_media_cover_alter_media_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='rating_avg',
+            field=models.FloatField(db_index=True, default=0, editable=False, verbose_name='rating average'),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='rating count'),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='rating sum'),
+        ),
+        migrations.RunPython(fill_media_rating_aggregates, migrations.RunPython.noop),
+    ]
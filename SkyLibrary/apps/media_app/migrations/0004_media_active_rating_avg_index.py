@@ -0,0 +1,22 @@
+# Generated by Django 4.2.22 on 2026-10-18 08:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0003_media_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='media',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False, verbose_name='rating average'),
+        ),
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(fields=['active', 'rating_avg', 'id'], name='media_active_rating_avg_idx'),
+        ),
+    ]
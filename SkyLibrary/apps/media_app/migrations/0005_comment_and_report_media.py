@@ -0,0 +1,59 @@
+# Generated by Django 4.2.22 on 2026-10-18 09:02
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+import django.db.models.deletion
+
+MEDIA_TYPE = 1
+COMMENT_TYPE = 2
+
+
+def fill_comment_and_report_media(apps, schema_editor):
+
+    Media = apps.get_model('media_app', 'Media')
+    Comment = apps.get_model('media_app', 'Comment')
+    Report = apps.get_model('media_app', 'Report')
+
+    existing_media_ids = Media.objects.values('id')
+
+    Comment.objects.filter(target_type=MEDIA_TYPE, target_id__in=existing_media_ids).update(media_id=F('target_id'))
+
+    # every pass fills replies one level deeper, replies to deleted comments stay without media
+    while True:
+
+        resolved_comments = Comment.objects.filter(media__isnull=False)
+
+        updated = Comment.objects.filter(
+            target_type=COMMENT_TYPE, media__isnull=True, target_id__in=resolved_comments.values('id')
+        ).update(
+            media_id=Subquery(resolved_comments.filter(id=OuterRef('target_id')).values('media_id')[:1])
+        )
+
+        if not updated:
+            break
+
+    Report.objects.filter(target_type=MEDIA_TYPE, target_id__in=existing_media_ids).update(media_id=F('target_id'))
+    Report.objects.filter(target_type=COMMENT_TYPE).update(
+        media_id=Subquery(Comment.objects.filter(id=OuterRef('target_id')).values('media_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0004_media_active_rating_avg_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='media',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='media_comment', to='media_app.media', verbose_name='media'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='media',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='media_report', to='media_app.media', verbose_name='media'),
+        ),
+        migrations.RunPython(fill_comment_and_report_media, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.22 on 2026-10-18 09:03
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_comment_rating(apps, schema_editor):
+
+    Comment = apps.get_model('media_app', 'Comment')
+    CommentRating = apps.get_model('media_app', 'CommentRating')
+
+    comment_ratings_sum = CommentRating.objects.filter(
+        comment=OuterRef('pk')
+    ).order_by().values('comment').annotate(value=Sum('rating')).values('value')
+
+    Comment.objects.update(rating=Coalesce(Subquery(comment_ratings_sum), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0005_comment_and_report_media'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='rating',
+            field=models.IntegerField(default=0, editable=False, verbose_name='rating'),
+        ),
+        migrations.RunPython(fill_comment_rating, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.22 on 2026-10-18 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0006_comment_rating'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['media', 'target_type', '-pub_date', '-id'], name='comment_media_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['target_type', 'target_id'], name='comment_target_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.22 on 2026-10-18 09:06
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_media_counters(apps, schema_editor):
+
+    Media = apps.get_model('media_app', 'Media')
+    MediaDownload = apps.get_model('media_app', 'MediaDownload')
+    Comment = apps.get_model('media_app', 'Comment')
+
+    def count_subquery(model):
+        return Coalesce(
+            Subquery(
+                model.objects.filter(
+                    media=OuterRef('pk')
+                ).order_by().values('media').annotate(value=Count('id')).values('value')
+            ),
+            Value(0),
+        )
+
+    Media.objects.update(downloads_count=count_subquery(MediaDownload), comments_count=count_subquery(Comment))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0007_comment_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='comments count'),
+        ),
+        migrations.AddField(
+            model_name='media',
+            name='downloads_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='downloads count'),
+        ),
+        migrations.RunPython(fill_media_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.22 on 2026-10-18 09:09
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_media_downloads(apps, schema_editor):
+
+    Media = apps.get_model('media_app', 'Media')
+    MediaDownload = apps.get_model('media_app', 'MediaDownload')
+
+    duplicates = MediaDownload.objects.values('media', 'user_who_added').annotate(
+        first_id=Min('id'), downloads=Count('id')
+    ).filter(downloads__gt=1)
+
+    for duplicate in duplicates:
+        MediaDownload.objects.filter(
+            media=duplicate['media'], user_who_added=duplicate['user_who_added']
+        ).exclude(id=duplicate['first_id']).delete()
+
+    Media.objects.update(
+        downloads_count=Coalesce(
+            Subquery(
+                MediaDownload.objects.filter(
+                    media=OuterRef('pk')
+                ).order_by().values('media').annotate(value=Count('id')).values('value')
+            ),
+            Value(0),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0008_media_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_media_downloads, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='mediadownload',
+            constraint=models.UniqueConstraint(fields=('media', 'user_who_added'), name='media_download_unique_media_user'),
+        ),
+    ]
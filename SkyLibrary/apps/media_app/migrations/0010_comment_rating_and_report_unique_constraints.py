@@ -0,0 +1,67 @@
+# Generated by Django 4.2.22 on 2026-10-18 09:11
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_comment_ratings(apps, schema_editor):
+
+    Comment = apps.get_model('media_app', 'Comment')
+    CommentRating = apps.get_model('media_app', 'CommentRating')
+
+    duplicates = CommentRating.objects.values('comment', 'user_who_added').annotate(
+        first_id=Min('id'), votes=Count('id')
+    ).filter(votes__gt=1)
+
+    for duplicate in duplicates:
+        CommentRating.objects.filter(
+            comment=duplicate['comment'], user_who_added=duplicate['user_who_added']
+        ).exclude(id=duplicate['first_id']).delete()
+
+    Comment.objects.update(
+        rating=Coalesce(
+            Subquery(
+                CommentRating.objects.filter(
+                    comment=OuterRef('pk')
+                ).order_by().values('comment').annotate(value=Sum('rating')).values('value')
+            ),
+            Value(0),
+        )
+    )
+
+
+def remove_duplicate_reports(apps, schema_editor):
+
+    Report = apps.get_model('media_app', 'Report')
+
+    duplicates = Report.objects.values('user_who_added', 'target_type', 'target_id').annotate(
+        first_id=Min('id'), reports=Count('id')
+    ).filter(reports__gt=1)
+
+    for duplicate in duplicates:
+        Report.objects.filter(
+            user_who_added=duplicate['user_who_added'],
+            target_type=duplicate['target_type'],
+            target_id=duplicate['target_id'],
+        ).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0009_media_download_unique_media_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_comment_ratings, migrations.RunPython.noop),
+        migrations.RunPython(remove_duplicate_reports, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='commentrating',
+            constraint=models.UniqueConstraint(fields=('comment', 'user_who_added'), name='comment_rating_unique_comment_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='report',
+            constraint=models.UniqueConstraint(fields=('user_who_added', 'target_type', 'target_id'), name='report_unique_user_target'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.22 on 2026-10-18 09:13
+
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+# the GIN index is PostgreSQL specific, so it is created only there (other databases use the search fallback)
+SEARCH_VECTOR_INDEX_NAME = 'media_search_vector_idx'
+
+
+def create_search_vector_index(apps, schema_editor):
+
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    Media = apps.get_model('media_app', 'Media')
+
+    search_vector = None
+
+    for config in ('english', 'russian'):
+        for field_name, weight in (('title', 'A'), ('author', 'B'), ('description', 'C')):
+
+            field_search_vector = SearchVector(field_name, weight=weight, config=config)
+
+            search_vector = field_search_vector if search_vector is None else search_vector + field_search_vector
+
+    Media.objects.update(search_vector=search_vector)
+
+    schema_editor.execute(
+        f'CREATE INDEX {SEARCH_VECTOR_INDEX_NAME} ON {Media._meta.db_table} USING gin (search_vector)'
+    )
+
+
+def drop_search_vector_index(apps, schema_editor):
+
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(f'DROP INDEX IF EXISTS {SEARCH_VECTOR_INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0010_comment_rating_and_report_unique_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='search vector'),
+        ),
+        migrations.RunPython(create_search_vector_index, drop_search_vector_index),
+    ]
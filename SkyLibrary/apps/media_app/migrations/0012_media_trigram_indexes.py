@@ -0,0 +1,45 @@
+# Generated by Django 4.2.22 on 2026-10-18 09:20
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# the GIN trigram indexes are PostgreSQL specific, so they are created only there,
+# they are built on UPPER(field) to serve both icontains and the trigram similarity filters (see MediaFilter)
+TRIGRAM_INDEXES = {
+    'media_title_trgm_idx': 'title',
+    'media_author_trgm_idx': 'author',
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    Media = apps.get_model('media_app', 'Media')
+
+    for index_name, field_name in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX {index_name} ON {Media._meta.db_table} USING gin (UPPER({field_name}) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for index_name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {index_name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0011_media_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.22 on 2026-10-18 09:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0012_media_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(fields=['active', '-pub_date', '-id'], name='media_active_pub_date_idx'),
+        ),
+    ]
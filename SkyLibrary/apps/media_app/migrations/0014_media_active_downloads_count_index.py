@@ -0,0 +1,17 @@
+# Generated by Django 4.2.22 on 2026-10-18 09:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0013_media_active_pub_date_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(fields=['active', 'downloads_count', 'id'], name='media_active_downloads_idx'),
+        ),
+    ]
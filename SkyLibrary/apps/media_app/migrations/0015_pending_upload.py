@@ -0,0 +1,34 @@
+# Generated by Django 4.2.22 on 2026-10-18 09:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('media_app', '0014_media_active_downloads_count_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('upload_id', models.CharField(max_length=300, verbose_name='upload id')),
+                ('file_key', models.CharField(max_length=300, unique=True, verbose_name='file key')),
+                ('file_name', models.CharField(max_length=300, verbose_name='file name')),
+                ('file_size', models.PositiveBigIntegerField(verbose_name='file size')),
+                ('part_size', models.PositiveBigIntegerField(verbose_name='part size')),
+                ('pub_date', models.DateTimeField(auto_now_add=True, verbose_name='publication date')),
+                ('user_who_added', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_who_added_pending_upload', to=settings.AUTH_USER_MODEL, verbose_name='user who added')),
+            ],
+            options={
+                'verbose_name': 'pending upload',
+                'verbose_name_plural': 'pending uploads',
+                'indexes': [models.Index(fields=['user_who_added', 'file_name', 'file_size'], name='pending_upload_user_file_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.22 on 2026-10-18 09:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0015_pending_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingupload',
+            name='completed',
+            field=models.BooleanField(default=False, verbose_name='completed'),
+        ),
+    ]
@@ -2,9 +2,13 @@ from datetime import datetime, timedelta
 from logging import getLogger
 from uuid import uuid4
 
-from django.db import models
-from django.db.models import Avg, Count, Sum, QuerySet
+from django.db import models, transaction, connection, IntegrityError
+from django.db.models import Avg, Count, Sum, QuerySet, F, Case, When, Value, FloatField
+from django.db.models.functions import Cast
+from django.db.models.lookups import GreaterThan
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.conf import settings
 from django.core.exceptions import ValidationError, NON_FIELD_ERRORS
 from django.utils.translation import gettext_lazy as _
 from django.utils.translation import get_language
@@ -91,20 +95,126 @@ class Media(models.Model):
     file = models.FileField(upload_to=get_upload, verbose_name=_('file'), max_length=300)
     cover = models.ImageField(upload_to=get_upload, null=True, blank=True, verbose_name=_('cover'), max_length=300)
 
+    # denormalized media ratings aggregates, maintained by MediaRating.save() and the media_app.signals receivers
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('rating sum'))
+    rating_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('rating count'))
+    rating_avg = models.FloatField(default=0, editable=False, verbose_name=_('rating average'))
+    # denormalized counters, maintained by MediaDownload.save(), Comment.save() and the media_app.signals receivers,
+    # can be checked and repaired with the "repair_media_counters" management command
+    downloads_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('downloads count'))
+    comments_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('comments count'))
+    # full-text search vector over the title, author and description (PostgreSQL only, NULL on other databases),
+    # maintained by save() (see update_search_vector), GIN-indexed by the migrations
+    search_vector = SearchVectorField(null=True, editable=False, verbose_name=_('search vector'))
+
+    # changed only with UPDATE statements (see update_rating_aggregates, update_counters and update_search_vector)
+    denormalized_fields = (
+        'rating_sum', 'rating_count', 'rating_avg', 'downloads_count', 'comments_count', 'search_vector'
+    )
+
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+
+        # a loaded object may have outdated denormalized values, so they must not overwrite the stored ones
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.denormalized_fields
+            ]
+
+        with transaction.atomic():
+
+            super().save(*args, **kwargs)
+
+            Media.update_search_vector(self.id)
+
     def get_downloads_number(self) -> int:
+        # calculates the number from the media downloads table, use the "downloads_count" field in lists and pages
         return self.media_media_download.aggregate(Count('download'))['download__count']
 
     def get_rating(self) -> float | int:
+        # calculates the rating from the media ratings table, use the "rating_avg" field in lists and filters
         return round(self.media_media_rating.aggregate(Avg('rating'))['rating__avg'] or 0, 2)
 
+    @staticmethod
+    def update_rating_aggregates(media_id: int, rating_sum_delta: int, rating_count_delta: int) -> None:
+        """
+            Applies a media ratings change to the stored rating aggregates with one UPDATE statement,
+            the new values are calculated by the database, so concurrent updates do not overwrite each other.
+        """
+
+        new_rating_sum = F('rating_sum') + rating_sum_delta
+        new_rating_count = F('rating_count') + rating_count_delta
+
+        Media.objects.filter(id=media_id).update(
+            rating_sum=new_rating_sum,
+            rating_count=new_rating_count,
+            rating_avg=Case(
+                When(
+                    GreaterThan(new_rating_count, 0),
+                    then=Cast(new_rating_sum, FloatField()) / Cast(new_rating_count, FloatField()),
+                ),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+        )
+
+    @staticmethod
+    def update_counters(media_id: int, **counters_deltas: int) -> None:
+        """
+            Applies deltas to the stored counters with one UPDATE statement, for example:
+                Media.update_counters(media_id, downloads_count=1, comments_count=-1)
+        """
+
+        Media.objects.filter(id=media_id).update(
+            **{counter: F(counter) + delta for counter, delta in counters_deltas.items()}
+        )
+
+    @staticmethod
+    def get_search_vector() -> SearchVector:
+        """
+            Returns the search vector expression: the title (weight "A"), the author ("B") and the description ("C")
+            stemmed with every text search configuration of settings.MEDIA_SEARCH_CONFIGS,
+            so a query in any of the site languages matches the word forms.
+        """
+
+        search_vector = None
+
+        for config in dict.fromkeys(settings.MEDIA_SEARCH_CONFIGS.values()):
+            for field_name, weight in (('title', 'A'), ('author', 'B'), ('description', 'C')):
+
+                field_search_vector = SearchVector(field_name, weight=weight, config=config)
+
+                search_vector = field_search_vector if search_vector is None else search_vector + field_search_vector
+
+        return search_vector
+
+    @staticmethod
+    def update_search_vector(media_id: int | None = None) -> None:
+        # recalculates the search vector of the media (of all media if media_id is None), PostgreSQL only
+
+        if connection.vendor != 'postgresql':
+            return
+
+        media = Media.objects.all() if media_id is None else Media.objects.filter(id=media_id)
+
+        media.update(search_vector=Media.get_search_vector())
+
     class Meta:
 
         permissions = [
             ('change_media_active_field', _('Can change the value of the media active field')),
         ]
+        indexes = [
+            # serves the home page rating filter and sort: WHERE active = ... AND rating_avg ... ORDER BY rating_avg, id
+            models.Index(fields=['active', 'rating_avg', 'id'], name='media_active_rating_avg_idx'),
+            # the home page filter pages from newest to oldest (see home_page_app.services.MediaFilter.get_page)
+            models.Index(fields=['active', '-pub_date', '-id'], name='media_active_pub_date_idx'),
+            # the home page blended score top media (see home_page_app.services.MediaFilter._get_top)
+            models.Index(fields=['active', 'downloads_count', 'id'], name='media_active_downloads_idx'),
+        ]
         verbose_name = _('media')
         verbose_name_plural = _('medias')
 
@@ -134,29 +244,45 @@ class MediaDownload(models.Model):
     def __str__(self):
         return f'{self.media.title} %s' % _("download")
 
-    def clean(self, *args, **kwargs):
+    def save(self, *args, **kwargs):
+
+        # the uniqueness is checked by the database constraint on insert, not by a SELECT before it
+        self.full_clean(validate_unique=False, validate_constraints=False)
 
         try:
-            if MediaDownload.objects.get(media=self.media, user_who_added=self.user_who_added):
-                raise ValidationError(
-                    {NON_FIELD_ERRORS: [_('Object with this user and media already exists')]},
-                    code='duplicate',
-                )
+            with transaction.atomic():
 
-        except MediaDownload.DoesNotExist:
-            pass
+                if self._state.adding:
+                    previous_media_id = None
 
-        super().clean()
+                else:
+                    previous_media_id = MediaDownload.objects.select_for_update().values_list(
+                        'media_id', flat=True
+                    ).get(id=self.id)
 
-    def save(self, *args, **kwargs):
+                super().save(*args, **kwargs)
 
-        self.full_clean()
+                # deletions are handled by the media_app.signals receivers (they are called for cascade deletions too)
+                if previous_media_id != self.media_id:
+
+                    if previous_media_id is not None:
+                        Media.update_counters(previous_media_id, downloads_count=-1)
 
-        super().save(*args, **kwargs)
+                    Media.update_counters(self.media_id, downloads_count=1)
+
+        except IntegrityError:
+            raise ValidationError(
+                {NON_FIELD_ERRORS: [_('Object with this user and media already exists')]},
+                code='duplicate',
+            )
 
     class Meta:
 
         db_table = 'media_app_media_download'
+        constraints = [
+            # one download from one user, buffered downloads rely on it (see media_app.services)
+            models.UniqueConstraint(fields=['media', 'user_who_added'], name='media_download_unique_media_user'),
+        ]
         verbose_name = _('media download')
         verbose_name_plural = _('media downloads')
 
@@ -195,9 +321,37 @@ class MediaRating(models.Model):
 
     def save(self, *args, **kwargs):
 
-        self.full_clean()
+        # the uniqueness is checked by the database constraint on insert, not by a SELECT before it
+        self.full_clean(validate_unique=False, validate_constraints=False)
+
+        try:
+            with transaction.atomic():
+
+                if self._state.adding:
+                    previous_media_id, previous_rating = None, None
+
+                else:
+                    previous_media_id, previous_rating = MediaRating.objects.select_for_update().values_list(
+                        'media_id', 'rating'
+                    ).get(id=self.id)
+
+                super().save(*args, **kwargs)
+
+                # deletions are handled by the media_app.signals receivers (they are called for cascade deletions too)
+                if previous_media_id == self.media_id:
+                    Media.update_rating_aggregates(self.media_id, self.rating - previous_rating, 0)
 
-        super().save(*args, **kwargs)
+                else:
+
+                    if previous_media_id is not None:
+                        Media.update_rating_aggregates(previous_media_id, -previous_rating, -1)
+
+                    Media.update_rating_aggregates(self.media_id, self.rating, 1)
+
+        except IntegrityError:
+            raise ValidationError(
+                {NON_FIELD_ERRORS: [self.unique_error_message(MediaRating, ('media', 'user_who_added'))]}
+            )
 
     def __str__(self):
         return f'{self.media.title} %s ({self.rating})' % _("rating")
@@ -230,6 +384,18 @@ class Comment(models.Model):
         verbose_name=_('user who added'),
     )
     pub_date = models.DateTimeField(auto_now_add=True, verbose_name=_('publication date'))
+    # the media of the page with the comment (the root of the replies chain), set on save
+    media = models.ForeignKey(
+        Media,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='media_comment',
+        verbose_name=_('media'),
+    )
+    # denormalized comment ratings sum, maintained by CommentRating.save() and the media_app.signals receivers
+    rating = models.IntegerField(default=0, editable=False, verbose_name=_('rating'))
 
     def __str__(self):
 
@@ -261,19 +427,37 @@ class Comment(models.Model):
 
     def save(self, *args, **kwargs):
 
+        if self.media_id is None:
+            self.media_id = get_page_media_id_by_comment(self)
+
         self.full_clean()
 
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+
+            is_adding = self._state.adding
+
+            super().save(*args, **kwargs)
+
+            # the media of a comment does not change, deletions are handled by the media_app.signals receivers
+            if is_adding and self.media_id is not None:
+                Media.update_counters(self.media_id, comments_count=1)
 
     def get_rating(self) -> int:
+        # calculates the rating from the comment ratings table, use the "rating" field in lists and pages
         return self.comment_comment_rating.aggregate(Sum('rating'))['rating__sum'] or 0
 
-    def get_current_user_comment_rating(self) -> int:
+    @staticmethod
+    def update_rating(comment_id: int, rating_delta: int) -> None:
+        # one UPDATE statement, the new value is calculated by the database
+        Comment.objects.filter(id=comment_id).update(rating=F('rating') + rating_delta)
+
+    def get_user_comment_rating(self, user) -> int:
+        # for comments lists use media_app.services.add_current_user_votes_to_comments_tree
 
         rating: int
 
         try:
-            rating = CommentRating.objects.get(user_who_added=self.user_who_added, comment=self.id).rating
+            rating = CommentRating.objects.get(user_who_added=user, comment=self.id).rating
 
         except CommentRating.DoesNotExist:
             rating = 0
@@ -297,6 +481,12 @@ class Comment(models.Model):
                 _('Can change the content of the comment to "This comment was banned"')
             ),
         ]
+        indexes = [
+            # media comments pages (see media_app.services.get_media_comments_page)
+            models.Index(fields=['media', 'target_type', '-pub_date', '-id'], name='comment_media_pub_date_idx'),
+            # replies to comments
+            models.Index(fields=['target_type', 'target_id'], name='comment_target_idx'),
+        ]
         verbose_name = _('comment')
         verbose_name_plural = _('comments')
 
@@ -326,46 +516,105 @@ class CommentRating(models.Model):
     def __str__(self):
         return f'%s (id: {self.comment.id}) %s ({self.rating})' % (_("comment"), _("rating"))
 
-    def clean(self, *args, **kwargs):
+    def save(self, *args, **kwargs):
+
+        # the uniqueness is checked by the database constraint on insert, not by a SELECT before it
+        self.full_clean(validate_unique=False, validate_constraints=False)
 
         try:
+            with transaction.atomic():
 
-            comment_rating: CommentRating = \
-                CommentRating.objects.get(comment=self.comment, user_who_added=self.user_who_added)
+                if self._state.adding:
+                    previous_comment_id, previous_rating = None, None
 
-            comment_rating.delete()
+                else:
+                    previous_comment_id, previous_rating = CommentRating.objects.select_for_update().values_list(
+                        'comment_id', 'rating'
+                    ).get(id=self.id)
 
-            if comment_rating.rating == self.rating:
-                # do not add new record, validation error only for it
-                raise ValidationError({NON_FIELD_ERRORS: ['']})
+                super().save(*args, **kwargs)
 
-        except CommentRating.DoesNotExist:
-            # If the user has no ratings (with needed comment id and vote type), they can add a new rating
-            pass
+                # deletions are handled by the media_app.signals receivers (they are called for cascade deletions too)
+                if previous_comment_id == self.comment_id:
+                    Comment.update_rating(self.comment_id, self.rating - previous_rating)
 
-        super().clean()
+                else:
 
-    def save(self, *args, **kwargs):
+                    if previous_comment_id is not None:
+                        Comment.update_rating(previous_comment_id, -previous_rating)
 
-        self.full_clean()
+                    Comment.update_rating(self.comment_id, self.rating)
+
+        except IntegrityError:
+            raise ValidationError(
+                {NON_FIELD_ERRORS: [_('Object with this user and comment already exists')]},
+                code='duplicate',
+            )
+
+    @staticmethod
+    def toggle_vote(comment_id: int, user_id: int, rating: int) -> int:
+        """
+            Adds, changes or removes (the same vote again) the user vote for the comment in one transaction,
+            returns the new comment rating.
+
+            The comment row is locked for the transaction, so concurrent votes for the comment are applied one by one.
+        """
+
+        with transaction.atomic():
+
+            comment_rating: int = Comment.objects.select_for_update().values_list(
+                'rating', flat=True
+            ).get(id=comment_id)
+
+            try:
+                vote = CommentRating.objects.get(comment_id=comment_id, user_who_added_id=user_id)
+
+            except CommentRating.DoesNotExist:
+                vote = None
 
-        super().save(*args, **kwargs)
+            if vote is None:
+
+                CommentRating(comment_id=comment_id, user_who_added_id=user_id, rating=rating).save()
+
+                return comment_rating + rating
+
+            elif vote.rating == rating:
+
+                vote.delete()
+
+                return comment_rating - rating
+
+            else:
+
+                previous_rating = vote.rating
+
+                vote.rating = rating
+                vote.save()
+
+                return comment_rating - previous_rating + rating
 
     class Meta:
 
         db_table = 'media_app_comment_rating'
+        constraints = [
+            # one vote from one user (see CommentRating.toggle_vote)
+            models.UniqueConstraint(fields=['comment', 'user_who_added'], name='comment_rating_unique_comment_user'),
+        ]
         verbose_name = _('comment rating')
         verbose_name_plural = _('comment ratings')
 
 
 def get_page_media_id_by_comment(comment: Comment) -> int:
 
-    if comment.target_type == Comment.MEDIA_TYPE:
+    if comment.media_id is not None:
+        return comment.media_id
+
+    elif comment.target_type == Comment.MEDIA_TYPE:
         return comment.target_id
 
     elif comment.target_type == Comment.COMMENT_TYPE:
         return get_page_media_id_by_comment(
-            Comment.objects.only('id', 'target_id', 'target_type').get(id=comment.target_id)
+            Comment.objects.only('id', 'target_id', 'target_type', 'media_id').get(id=comment.target_id)
         )
 
 
@@ -414,6 +663,16 @@ class Report(models.Model):
         verbose_name=_('user who added'),
     )
     pub_date = models.DateTimeField(auto_now_add=True, verbose_name=_('publication date'))
+    # the media of the page with the report target, set on save
+    media = models.ForeignKey(
+        Media,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='media_report',
+        verbose_name=_('media'),
+    )
 
     def __str__(self):
 
@@ -423,17 +682,15 @@ class Report(models.Model):
         elif self.target_type == self.COMMENT_TYPE:
             return f'%s (id: {self.id})' % _("Comment report")
 
+    def _get_duplicate_error(self) -> ValidationError:
+        return ValidationError(
+            {NON_FIELD_ERRORS: [_('You can not create one more report on the same media/comment')]},
+            code='second_report_on_the_same_media_or_comment',
+        )
+
     def clean(self, *args, **kwargs):
 
-        if Report.objects.filter(
-                user_who_added=self.user_who_added,
-                target_type=self.target_type,
-                target_id=self.target_id,
-        ).exists():
-            raise ValidationError(
-                {NON_FIELD_ERRORS: [_('You can not create one more report on the same media/comment')]},
-                code='second_report_on_the_same_media_or_comment',
-            )
+        # duplicates are rejected by the database constraint on insert (see save)
 
         try:
 
@@ -442,6 +699,15 @@ class Report(models.Model):
             ).order_by('-pub_date')[0].pub_date
 
             if datetime.now(latest_user_report_pub_date.tzinfo) - latest_user_report_pub_date < timedelta(seconds=30):
+
+                # the duplicate error is more informative, so it is checked first on this (rare) path only
+                if self._state.adding and Report.objects.filter(
+                        user_who_added=self.user_who_added,
+                        target_type=self.target_type,
+                        target_id=self.target_id,
+                ).exists():
+                    raise self._get_duplicate_error()
+
                 raise ValidationError(
                     {NON_FIELD_ERRORS: [_('Too frequent reports, please wait and try again')]},
                     code='too_frequent_reports',
@@ -455,21 +721,39 @@ class Report(models.Model):
 
     def save(self, *args, **kwargs):
 
-        self.full_clean()
+        if self.media_id is None:
 
-        super().save(*args, **kwargs)
+            if self.target_type == self.MEDIA_TYPE:
+                self.media_id = self.target_id
+
+            elif self.target_type == self.COMMENT_TYPE:
+                self.media_id = get_page_media_id_by_comment(
+                    Comment.objects.only('id', 'target_id', 'target_type', 'media_id').get(id=self.target_id)
+                )
+
+        self.full_clean(validate_unique=False, validate_constraints=False)
+
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+
+        except IntegrityError:
+            raise self._get_duplicate_error()
 
     def get_link_to_target(self) -> str:
 
         is_media_type: bool = self.target_type == self.MEDIA_TYPE
         is_comment_type: bool = self.target_type == self.COMMENT_TYPE
 
-        if is_media_type:
+        if self.media_id is not None:
+            media_id = self.media_id
+
+        elif is_media_type:
             media_id = self.target_id
 
         elif is_comment_type:
             media_id = get_page_media_id_by_comment(
-                Comment.objects.only('id', 'target_id', 'target_type').get(id=self.target_id)
+                Comment.objects.only('id', 'target_id', 'target_type', 'media_id').get(id=self.target_id)
             )
 
         else:
@@ -491,5 +775,41 @@ class Report(models.Model):
 
     class Meta:
 
+        constraints = [
+            # one report from one user on one media/comment
+            models.UniqueConstraint(
+                fields=['user_who_added', 'target_type', 'target_id'], name='report_unique_user_target'
+            ),
+        ]
         verbose_name = _('report')
         verbose_name_plural = _('reports')
+
+
+class PendingUpload(models.Model):
+    """
+        A multipart upload of a media file to the S3 storage. A not completed upload can be resumed by the same user,
+        a completed one is a registry entry of the uploaded file (see CreateOrUpdateMediaForm.clean_file_key).
+    """
+
+    user_who_added = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='user_who_added_pending_upload', verbose_name=_('user who added')
+    )
+    upload_id = models.CharField(max_length=300, verbose_name=_('upload id'))
+    file_key = models.CharField(max_length=300, unique=True, verbose_name=_('file key'))
+    file_name = models.CharField(max_length=300, verbose_name=_('file name'))
+    file_size = models.PositiveBigIntegerField(verbose_name=_('file size'))
+    part_size = models.PositiveBigIntegerField(verbose_name=_('part size'))
+    completed = models.BooleanField(default=False, verbose_name=_('completed'))
+    pub_date = models.DateTimeField(auto_now_add=True, verbose_name=_('publication date'))
+
+    def __str__(self):
+        return f'%s (id: {self.id}) {self.file_key}' % _('pending upload')
+
+    class Meta:
+
+        indexes = [
+            # the upload of the same file to resume
+            models.Index(fields=['user_who_added', 'file_name', 'file_size'], name='pending_upload_user_file_idx'),
+        ]
+        verbose_name = _('pending upload')
+        verbose_name_plural = _('pending uploads')
@@ -0,0 +1,476 @@
+from datetime import datetime, timedelta
+from collections import Counter
+from logging import getLogger
+from math import ceil
+from time import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from botocore.exceptions import ClientError
+
+from utils_app.services import is_cache_incr_atomic
+from app_main.s3_storage import get_s3_connection
+
+from .models import Media, MediaDownload, Comment, CommentRating, PendingUpload
+
+
+logger = getLogger(__name__)
+
+User = get_user_model()
+
+# media downloads buffer cache keys, the buffer is a sequence of events with increasing indexes
+_DOWNLOADS_BUFFER_LAST_INDEX_KEY = 'media_downloads_buffer_last_index'
+_DOWNLOADS_BUFFER_FLUSHED_INDEX_KEY = 'media_downloads_buffer_flushed_index'
+_DOWNLOADS_BUFFER_EVENT_KEY = 'media_downloads_buffer_event_{index}'
+# [(flush time, last index at the flush time), ...], the flushes of the last buffer timeout and the one before them
+_DOWNLOADS_BUFFER_CHECKPOINTS_KEY = 'media_downloads_buffer_checkpoints'
+# the value of a flushed event, to tell it from a not set yet one
+_DOWNLOADS_BUFFER_FLUSHED_EVENT = 0
+# not flushed downloads number of the media
+_DOWNLOADS_BUFFER_PENDING_KEY = 'media_downloads_buffer_pending_{media_id}'
+# the user download of the media is already in the buffer
+_DOWNLOADS_BUFFER_USER_KEY = 'media_downloads_buffer_user_{media_id}_{user_id}'
+
+# S3 multipart upload limits (the last part may be smaller than the minimum)
+S3_MIN_PART_SIZE = 1024 * 1024 * 5
+S3_MAX_PART_SIZE = 1024 * 1024 * 1024 * 5
+S3_MAX_PARTS_COUNT = 10000
+
+
+def _get_comments_cursor(comment: Comment) -> str:
+    return f'{comment.pub_date.isoformat()}_{comment.id}'
+
+
+def _parse_comments_cursor(cursor: str) -> tuple[datetime, int]:
+    # raises ValueError if the cursor is incorrect
+
+    pub_date, comment_id = cursor.rsplit('_', 1)
+
+    return datetime.fromisoformat(pub_date), int(comment_id)
+
+
+def get_comments_tree(
+        comments: list[Comment],
+        nesting: int = 0,
+        replies_depth: int | None = None,
+) -> list[dict[str: Comment, str: int, str: bool]]:
+    """
+        Function returns received comments and replies to them (from newest to oldest) down to "replies_depth"
+        nesting levels (settings.COMMENTS_REPLIES_DEPTH by default), with one query per nesting level
+        and one more for the deepest level replies existence.
+
+        Result contains all comments in order like this:
+            comment 1, comment 1 reply 1, comment 1 reply reply 1, comment 1 reply 2, comment 2, ...
+
+        Structure:
+            result = [
+                # comment is a Comment object, nesting >= received nesting,
+                # has_hidden_replies is True if the comment has replies, which are deeper than "replies_depth"
+                {'comment': Comment, 'nesting': int, 'has_hidden_replies': bool},
+                ...
+            ]
+    """
+
+    if replies_depth is None:
+        replies_depth = settings.COMMENTS_REPLIES_DEPTH
+
+    replies: dict[int, list[Comment]] = {}
+    parent_comments = comments
+
+    for _ in range(replies_depth):
+
+        if not parent_comments:
+            break
+
+        parent_comments = list(
+            Comment.objects.filter(
+                target_type=Comment.COMMENT_TYPE, target_id__in=[comment.id for comment in parent_comments]
+            ).select_related('user_who_added').order_by('-pub_date', '-id')
+        )
+
+        # comments are already sorted, so every replies list is sorted from newest to oldest too
+        for reply in parent_comments:
+            replies.setdefault(reply.target_id, []).append(reply)
+
+    # parent_comments are the deepest loaded comments now, their replies are not shown
+    if parent_comments:
+        comments_with_hidden_replies = set(
+            Comment.objects.filter(
+                target_type=Comment.COMMENT_TYPE, target_id__in=[comment.id for comment in parent_comments]
+            ).values_list('target_id', flat=True).distinct()
+        )
+
+    else:
+        comments_with_hidden_replies = set()
+
+    result = []
+
+    # depth-first walk without recursion
+    stack = [(comment, nesting) for comment in reversed(comments)]
+
+    while stack:
+
+        comment, comment_nesting = stack.pop()
+
+        result.append({
+            'comment': comment,
+            'nesting': comment_nesting,
+            'has_hidden_replies': comment.id in comments_with_hidden_replies,
+        })
+
+        stack += [(reply, comment_nesting + 1) for reply in reversed(replies.get(comment.id, []))]
+
+    return result
+
+
+def get_media_comments_page(
+        media_id: int,
+        cursor: str | None = None,
+        page_size: int | None = None,
+) -> tuple[list[dict[str: Comment, str: int, str: bool]], str | None]:
+    """
+        Function returns a page of media comments (from newest to oldest) with replies to them
+        (see get_comments_tree) and the cursor of the next page (None if it is the last page).
+
+        "cursor" is a value returned by the previous call, None for the first page.
+        "page_size" is settings.COMMENTS_PAGE_SIZE by default.
+        Raises ValueError if the cursor is incorrect.
+    """
+
+    if page_size is None:
+        page_size = settings.COMMENTS_PAGE_SIZE
+
+    media_comments = Comment.objects.filter(
+        media_id=media_id, target_type=Comment.MEDIA_TYPE
+    ).select_related('user_who_added').order_by('-pub_date', '-id')
+
+    if cursor:
+
+        pub_date, comment_id = _parse_comments_cursor(cursor)
+
+        media_comments = media_comments.filter(Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=comment_id))
+
+    # one more comment, to know if there is a next page
+    media_comments = list(media_comments[:page_size + 1])
+
+    if len(media_comments) > page_size:
+
+        media_comments = media_comments[:page_size]
+
+        next_cursor = _get_comments_cursor(media_comments[-1])
+
+    else:
+        next_cursor = None
+
+    return get_comments_tree(media_comments), next_cursor
+
+
+def get_comment_nesting(comment: Comment) -> int:
+    """
+        Function returns the comment nesting (0 for media comments), calculated from the replies chain
+        with one query per chain level.
+    """
+
+    nesting = 0
+    target_type, target_id = comment.target_type, comment.target_id
+
+    while target_type == Comment.COMMENT_TYPE:
+
+        nesting += 1
+
+        parent = Comment.objects.filter(id=target_id).values_list('target_type', 'target_id').first()
+
+        if parent is None:
+            break
+
+        target_type, target_id = parent
+
+    return nesting
+
+
+def get_comment_replies_tree(comment: Comment) -> list[dict[str: Comment, str: int, str: bool]]:
+    """
+        Function returns replies to the comment with replies to them (see get_comments_tree),
+        the nesting is calculated on the server (see get_comment_nesting),
+        so the same comment is always rendered with the same nesting.
+    """
+
+    replies = list(
+        Comment.objects.filter(
+            target_type=Comment.COMMENT_TYPE, target_id=comment.id
+        ).select_related('user_who_added').order_by('-pub_date', '-id')
+    )
+
+    return get_comments_tree(replies, get_comment_nesting(comment) + 1, settings.COMMENTS_REPLIES_DEPTH - 1)
+
+
+def add_current_user_votes_to_comments_tree(comments_tree: list[dict[str: Comment, str: int]], user) -> None:
+    """
+        Function adds the request user votes to the comments tree (see get_comments_tree) with one query.
+
+        Every comment dict gets a "current_user_vote" key: CommentRating.UPVOTE, CommentRating.DOWNVOTE
+        or 0 (no vote, or the user is anonymous).
+    """
+
+    if user.is_authenticated and comments_tree:
+
+        user_votes: dict[int, int] = dict(
+            CommentRating.objects.filter(
+                user_who_added=user, comment_id__in=[comment_dict['comment'].id for comment_dict in comments_tree]
+            ).values_list('comment_id', 'rating')
+        )
+
+    else:
+        user_votes = {}
+
+    for comment_dict in comments_tree:
+        comment_dict['current_user_vote'] = user_votes.get(comment_dict['comment'].id, 0)
+
+
+def get_actual_media_count(model) -> Coalesce:
+    # number of the model rows with the media (OuterRef), calculated from the source table, for annotate and update
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                media=OuterRef('pk')
+            ).order_by().values('media').annotate(value=Count('id')).values('value')
+        ),
+        Value(0),
+    )
+
+
+def _incr_cache_value(key: str, delta: int = 1, timeout: int | None = None) -> int:
+
+    cache.add(key, 0, timeout)
+
+    return cache.incr(key, delta)
+
+
+def add_media_download(media: Media, user) -> int:
+    """
+        Function adds the user download of the media and returns the media downloads number.
+
+        If the cache is used and increments values atomically (see is_cache_incr_atomic), the download is only
+        added to the buffer (see flush_media_downloads_buffer) and the returned number is approximate
+        (the stored counter and not flushed downloads).
+    """
+
+    if not settings.USE_CACHE or not is_cache_incr_atomic():
+
+        try:
+            MediaDownload.objects.create(media=media, user_who_added=user)
+
+        except ValidationError:
+            # the user has already downloaded the media
+            return media.downloads_count
+
+        return media.downloads_count + 1
+
+    timeout = settings.MEDIA_DOWNLOADS_BUFFER_TIMEOUT
+    pending_key = _DOWNLOADS_BUFFER_PENDING_KEY.format(media_id=media.id)
+
+    if cache.add(_DOWNLOADS_BUFFER_USER_KEY.format(media_id=media.id, user_id=user.id), True, timeout):
+
+        index = _incr_cache_value(_DOWNLOADS_BUFFER_LAST_INDEX_KEY)
+
+        cache.set(_DOWNLOADS_BUFFER_EVENT_KEY.format(index=index), (media.id, user.id), timeout)
+
+        pending = _incr_cache_value(pending_key, timeout=timeout)
+
+    else:
+        pending = cache.get(pending_key, 0)
+
+    return media.downloads_count + max(pending, 0)
+
+
+def _save_media_downloads(downloads: set[tuple[int, int]]) -> None:
+    # saves the (media id, user id) downloads and updates the downloads counters of the media
+
+    media_ids = {media_id for media_id, _ in downloads}
+    existing_media_ids = set(Media.objects.filter(id__in=media_ids).values_list('id', flat=True))
+    existing_user_ids = set(
+        User.objects.filter(id__in={user_id for _, user_id in downloads}).values_list('id', flat=True)
+    )
+
+    with transaction.atomic():
+
+        MediaDownload.objects.bulk_create(
+            [
+                MediaDownload(media_id=media_id, user_who_added_id=user_id)
+                for media_id, user_id in downloads
+                if media_id in existing_media_ids and user_id in existing_user_ids
+            ],
+            ignore_conflicts=True,
+        )
+
+        Media.objects.filter(id__in=existing_media_ids).update(
+            downloads_count=get_actual_media_count(MediaDownload)
+        )
+
+
+def flush_media_downloads_buffer(batch_size: int = 1000) -> int:
+    """
+        Function saves the buffered media downloads (see add_media_download) to the database by batches,
+        updates the downloads counters of the media and returns the number of the flushed buffer events.
+
+        An event index is taken before the event is set, so a missing event is skipped only
+        if its index was taken more than settings.MEDIA_DOWNLOADS_BUFFER_TIMEOUT ago (the event is expired
+        or will never be set), the indexes time is known from the previous flushes (checkpoints).
+        Until then the flushed index stays before the missing event and the next flushes check it again.
+
+        Duplicate downloads (one user, one media) are skipped by the database unique constraint.
+        Must not be run in parallel with itself.
+    """
+
+    timeout = settings.MEDIA_DOWNLOADS_BUFFER_TIMEOUT
+    now = time()
+
+    last_index = cache.get(_DOWNLOADS_BUFFER_LAST_INDEX_KEY, 0)
+    flushed_index = cache.get(_DOWNLOADS_BUFFER_FLUSHED_INDEX_KEY, 0)
+    checkpoints: list[tuple[float, int]] = cache.get(_DOWNLOADS_BUFFER_CHECKPOINTS_KEY, [])
+
+    # indexes up to the last one of a checkpoint older than the timeout were taken more than the timeout ago
+    old_checkpoints = [checkpoint for checkpoint in checkpoints if checkpoint[0] <= now - timeout]
+    expired_index = max((index for _, index in old_checkpoints), default=0)
+
+    checkpoints = old_checkpoints[-1:] + [checkpoint for checkpoint in checkpoints if checkpoint[0] > now - timeout]
+    cache.set(_DOWNLOADS_BUFFER_CHECKPOINTS_KEY, checkpoints + [(now, last_index)], None)
+
+    flushed_events_number = 0
+    batch_first_index = flushed_index + 1
+    # the flushed index can not be moved past a missing not expired event
+    is_flushed_index_stopped = False
+
+    while batch_first_index <= last_index:
+
+        events_keys = {
+            _DOWNLOADS_BUFFER_EVENT_KEY.format(index=index): index
+            for index in range(batch_first_index, min(batch_first_index + batch_size - 1, last_index) + 1)
+        }
+        batch_first_index += batch_size
+
+        events = cache.get_many(events_keys)
+        new_events = {key: event for key, event in events.items() if event != _DOWNLOADS_BUFFER_FLUSHED_EVENT}
+
+        if new_events:
+
+            _save_media_downloads(set(new_events.values()))
+
+            flushed_events_number += len(new_events)
+
+            # flushed events are kept until the flushed index is moved past them
+            cache.set_many({key: _DOWNLOADS_BUFFER_FLUSHED_EVENT for key in new_events}, timeout)
+
+            for media_id, events_number in Counter(media_id for media_id, _ in new_events.values()).items():
+                _incr_cache_value(
+                    _DOWNLOADS_BUFFER_PENDING_KEY.format(media_id=media_id),
+                    -events_number,
+                    timeout,
+                )
+
+        for key, index in events_keys.items():
+
+            if key not in events and index > expired_index:
+                is_flushed_index_stopped = True
+
+            if is_flushed_index_stopped:
+                break
+
+            flushed_index = index
+
+        cache.set(_DOWNLOADS_BUFFER_FLUSHED_INDEX_KEY, flushed_index, None)
+
+    return flushed_events_number
+
+
+def get_multipart_upload_plan(file_size: int, part_size: int | None = None) -> dict[str, int]:
+    """
+        Function returns the multipart upload plan of the file:
+            {'part_size': int, 'parts_count': int, 'concurrency': int, 'part_max_attempts': int}
+
+        The file is split to about settings.S3_UPLOAD_TARGET_PARTS_COUNT parts (fewer for small files,
+        since a part is 5 MiB at least) of up to settings.FILE_UPLOAD_CHUNK_SIZE, so any file is uploaded
+        in parallel by up to settings.S3_UPLOAD_MAX_CONCURRENCY parts, within the S3 parts size and number limits.
+        "part_size" - the part size of a resumed upload, it is not calculated then.
+        Raises ValueError if the file size is negative or the file can not be uploaded within the limits.
+    """
+
+    if file_size < 0:
+        raise ValueError(f'Incorrect file size - "{file_size}"')
+
+    if part_size is None:
+
+        max_part_size = min(max(settings.FILE_UPLOAD_CHUNK_SIZE, S3_MIN_PART_SIZE), S3_MAX_PART_SIZE)
+
+        # rounded up to whole MiB
+        part_size = ceil(file_size / settings.S3_UPLOAD_TARGET_PARTS_COUNT / 1024 / 1024) * 1024 * 1024
+        part_size = min(max(part_size, S3_MIN_PART_SIZE, ceil(file_size / S3_MAX_PARTS_COUNT)), max_part_size)
+
+    parts_count = max(ceil(file_size / part_size), 1)
+
+    if parts_count > S3_MAX_PARTS_COUNT:
+        raise ValueError(f'Too large file size - "{file_size}"')
+
+    return {
+        'part_size': part_size,
+        'parts_count': parts_count,
+        'concurrency': min(settings.S3_UPLOAD_MAX_CONCURRENCY, parts_count),
+        'part_max_attempts': settings.S3_UPLOAD_PART_MAX_ATTEMPTS,
+    }
+
+
+def abort_expired_pending_uploads(user=None) -> int:
+    """
+        Function aborts the multipart uploads older than settings.S3_UPLOAD_RESUME_TIMEOUT (of the user, of all users
+        if the user is None), so their uploaded parts are deleted from the storage,
+        and returns the number of the aborted uploads.
+
+        The expired completed uploads entries are deleted, their files are checked in the storage
+        (see CreateOrUpdateMediaForm.clean_file_key). An upload failed to be aborted (a storage error)
+        is kept and aborted next time.
+    """
+
+    s3 = get_s3_connection()
+
+    expired_pending_uploads = PendingUpload.objects.filter(
+        pub_date__lt=timezone.now() - timedelta(seconds=settings.S3_UPLOAD_RESUME_TIMEOUT)
+    )
+
+    if user is not None:
+        expired_pending_uploads = expired_pending_uploads.filter(user_who_added=user)
+
+    expired_pending_uploads.filter(completed=True).delete()
+
+    aborted_uploads_number = 0
+
+    for pending_upload in expired_pending_uploads.filter(completed=False):
+
+        try:
+            s3.abort_multipart_upload(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                Key=pending_upload.file_key,
+                UploadId=pending_upload.upload_id,
+            )
+
+        except s3.exceptions.NoSuchUpload:
+            # already aborted or completed outside of the site
+            pass
+
+        except ClientError as error:
+
+            logger.warning(f'The multipart upload "{pending_upload.upload_id}" is not aborted: {error}')
+
+            continue
+
+        pending_upload.delete()
+
+        aborted_uploads_number += 1
+
+    return aborted_uploads_number
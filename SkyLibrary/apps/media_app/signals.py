@@ -0,0 +1,28 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Media, MediaRating, Comment, CommentRating, MediaDownload
+
+
+@receiver(post_delete, sender=MediaRating)
+def remove_media_rating_from_rating_aggregates(sender, instance: MediaRating, **kwargs) -> None:
+    # if the media itself is deleted (cascade deletion), the update just does not find the row
+    Media.update_rating_aggregates(instance.media_id, -instance.rating, -1)
+
+
+@receiver(post_delete, sender=CommentRating)
+def remove_comment_rating_from_comment_rating(sender, instance: CommentRating, **kwargs) -> None:
+    # if the comment itself is deleted (cascade deletion), the update just does not find the row
+    Comment.update_rating(instance.comment_id, -instance.rating)
+
+
+@receiver(post_delete, sender=MediaDownload)
+def remove_media_download_from_media_counters(sender, instance: MediaDownload, **kwargs) -> None:
+    Media.update_counters(instance.media_id, downloads_count=-1)
+
+
+@receiver(post_delete, sender=Comment)
+def remove_comment_from_media_counters(sender, instance: Comment, **kwargs) -> None:
+
+    if instance.media_id is not None:
+        Media.update_counters(instance.media_id, comments_count=-1)
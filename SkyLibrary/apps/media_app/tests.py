@@ -5,6 +5,10 @@ from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
 from django.contrib.humanize.templatetags.humanize import naturalday, naturaltime
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
 
 from crispy_forms.utils import render_crispy_form
 
@@ -12,10 +16,23 @@ from PIL import Image
 from shutil import rmtree
 from ast import literal_eval
 from os.path import isfile
-
-from media_app.models import Media, MediaTags, MediaDownload, Comment, CommentRating, get_upload,\
-     Report, ReportType
-from media_app.forms import CreateReplyCommentForm, CreateReportCommentForm, CreateReportMediaForm
+from io import StringIO
+from json import loads
+from time import time
+from datetime import timedelta
+from threading import Thread
+from unittest.mock import patch
+
+from botocore.stub import Stubber
+
+from media_app.models import Media, MediaTags, MediaDownload, MediaRating, Comment, CommentRating, get_upload,\
+     Report, ReportType, PendingUpload
+from app_main.s3_storage import get_s3_connection, reset_s3_connection
+from media_app.forms import CreateReplyCommentForm, CreateReportCommentForm, CreateReportMediaForm, \
+    CreateOrUpdateMediaForm
+from media_app.services import get_media_comments_page, get_comments_tree, get_comment_replies_tree, \
+    get_comment_nesting, add_current_user_votes_to_comments_tree, add_media_download, flush_media_downloads_buffer, \
+    get_multipart_upload_plan, S3_MIN_PART_SIZE, S3_MAX_PARTS_COUNT
 
 User = get_user_model()
 
@@ -833,6 +850,13 @@ class ViewMediaTestCase(TestCase):
 
         # check downloads number:
 
+        # the approximate number, the download is in the buffer now
+        self.assertEqual(
+            literal_eval(response.content.decode('utf-8'))['downloads_number'], downloads_before_request + 1
+        )
+
+        flush_media_downloads_buffer()
+
         self.assertEqual(downloads_before_request + 1, self.media.get_downloads_number())
 
         # check again, one download from one user:
@@ -842,6 +866,8 @@ class ViewMediaTestCase(TestCase):
             **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'},
         )
 
+        flush_media_downloads_buffer()
+
         self.assertEqual(downloads_before_request + 1, self.media.get_downloads_number())
 
         self.client.logout()
@@ -1792,3 +1818,1134 @@ class ViewMediaTestCase(TestCase):
 
         rmtree(TEST_MEDIA_ROOT)
         rmtree(TEST_IMAGES_ROOT)
+
+
+class MediaRatingAggregatesTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        super().setUpClass()
+
+        cls.users = [
+            User.objects.create_user(
+                username=f'test_user_{i}', password='test_password', email=f'test_email_{i}@mail.com', role=1
+            )
+            for i in range(1, 4)
+        ]
+
+        cls.media = Media.objects.create(
+            title='test_title',
+            description='test_description',
+            author='test_author',
+            user_who_added=cls.users[0],
+            active=1,
+        )
+        cls.second_media = Media.objects.create(
+            title='test_title 2',
+            description='test_description 2',
+            author='test_author',
+            user_who_added=cls.users[0],
+            active=1,
+        )
+
+    def _assert_rating_aggregates(self, media: Media) -> None:
+
+        media.refresh_from_db()
+
+        ratings = list(media.media_media_rating.values_list('rating', flat=True))
+
+        self.assertEqual(media.rating_sum, sum(ratings))
+        self.assertEqual(media.rating_count, len(ratings))
+        self.assertAlmostEqual(media.rating_avg, media.get_rating(), places=2)
+
+    def test_create(self):
+
+        for user, rating in zip(self.users, (1, 4, 5)):
+
+            MediaRating.objects.create(media=self.media, user_who_added=user, rating=rating)
+
+            self._assert_rating_aggregates(self.media)
+
+        self.assertAlmostEqual(self.media.rating_avg, 10 / 3)
+
+    def test_update(self):
+
+        media_rating = MediaRating.objects.create(media=self.media, user_who_added=self.users[0], rating=2)
+        MediaRating.objects.create(media=self.media, user_who_added=self.users[1], rating=4)
+
+        media_rating.rating = 5
+        media_rating.save()
+
+        self._assert_rating_aggregates(self.media)
+
+        # moving the rating to another media
+        media_rating.media = self.second_media
+        media_rating.save()
+
+        self._assert_rating_aggregates(self.media)
+        self._assert_rating_aggregates(self.second_media)
+
+    def test_delete(self):
+
+        media_rating = MediaRating.objects.create(media=self.media, user_who_added=self.users[0], rating=2)
+        MediaRating.objects.create(media=self.media, user_who_added=self.users[1], rating=4)
+        MediaRating.objects.create(media=self.media, user_who_added=self.users[2], rating=5)
+
+        media_rating.delete()
+
+        self._assert_rating_aggregates(self.media)
+
+        # queryset (and cascade) deletions
+        MediaRating.objects.filter(media=self.media).delete()
+
+        self._assert_rating_aggregates(self.media)
+
+        self.assertEqual(self.media.rating_avg, 0)
+
+
+class CommentRatingToggleTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        super().setUpClass()
+
+        cls.users = [
+            User.objects.create_user(
+                username=f'test_user_{i}', password='test_password', email=f'test_email_{i}@mail.com', role=1
+            )
+            for i in range(1, 3)
+        ]
+
+        media = Media.objects.create(
+            title='test_title',
+            description='test_description',
+            author='test_author',
+            user_who_added=cls.users[0],
+            active=1,
+        )
+
+        cls.comment = Comment.objects.create(
+            content='test_content', target_type=Comment.MEDIA_TYPE, target_id=media.id, user_who_added=cls.users[0]
+        )
+
+    def _toggle_vote(self, user: User, rating: int, expected_comment_rating: int) -> None:
+
+        new_rating = CommentRating.toggle_vote(self.comment.id, user.id, rating)
+
+        self.comment.refresh_from_db()
+
+        self.assertEqual(new_rating, expected_comment_rating)
+        self.assertEqual(self.comment.rating, expected_comment_rating)
+        self.assertEqual(self.comment.get_rating(), expected_comment_rating)
+
+    def test_toggle_vote(self):
+
+        self._toggle_vote(self.users[0], CommentRating.UPVOTE, 1)
+        self._toggle_vote(self.users[1], CommentRating.UPVOTE, 2)
+
+        # the same vote again removes it
+        self._toggle_vote(self.users[0], CommentRating.UPVOTE, 1)
+
+        self._toggle_vote(self.users[0], CommentRating.DOWNVOTE, 0)
+
+        # changing the vote
+        self._toggle_vote(self.users[1], CommentRating.DOWNVOTE, -2)
+
+        self.assertEqual(self.comment.comment_comment_rating.count(), 2)
+
+    def test_delete(self):
+
+        CommentRating.toggle_vote(self.comment.id, self.users[0].id, CommentRating.UPVOTE)
+        CommentRating.toggle_vote(self.comment.id, self.users[1].id, CommentRating.UPVOTE)
+
+        CommentRating.objects.filter(user_who_added=self.users[0]).delete()
+
+        self.comment.refresh_from_db()
+
+        self.assertEqual(self.comment.rating, 1)
+
+
+class MediaCommentsTreeTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        super().setUpClass()
+
+        # a user can not add comments too frequently, so every comment has its own user
+        users = [
+            User.objects.create_user(
+                username=f'test_user_{i}', password='test_password', email=f'test_email_{i}@mail.com', role=1
+            )
+            for i in range(1, 8)
+        ]
+
+        cls.media = Media.objects.create(
+            title='test_title',
+            description='test_description',
+            author='test_author',
+            user_who_added=users[0],
+            active=1,
+        )
+        other_media = Media.objects.create(
+            title='test_title 2',
+            description='test_description 2',
+            author='test_author',
+            user_who_added=users[0],
+            active=1,
+        )
+
+        users = iter(users)
+
+        def create_comment(target_type: int, target_id: int) -> Comment:
+            return Comment.objects.create(
+                content='test_content', target_type=target_type, target_id=target_id, user_who_added=next(users)
+            )
+
+        cls.old_comment = create_comment(Comment.MEDIA_TYPE, cls.media.id)
+        cls.new_comment = create_comment(Comment.MEDIA_TYPE, cls.media.id)
+        cls.old_reply = create_comment(Comment.COMMENT_TYPE, cls.new_comment.id)
+        cls.new_reply = create_comment(Comment.COMMENT_TYPE, cls.new_comment.id)
+        cls.reply_to_reply = create_comment(Comment.COMMENT_TYPE, cls.old_reply.id)
+
+        other_media_comment = create_comment(Comment.MEDIA_TYPE, other_media.id)
+        create_comment(Comment.COMMENT_TYPE, other_media_comment.id)
+
+    @staticmethod
+    def _get_comments_tree_values(comments_tree: list[dict]) -> list[tuple[Comment, int, bool]]:
+        return [
+            (comment_dict['comment'], comment_dict['nesting'], comment_dict['has_hidden_replies'])
+            for comment_dict in comments_tree
+        ]
+
+    def test_get_media_comments_page(self):
+
+        # media comments, 3 reply levels (the last one is empty)
+        with self.assertNumQueries(4):
+
+            comments_tree, next_cursor = get_media_comments_page(self.media.id)
+
+            # user_who_added is preloaded
+            for comment_dict in comments_tree:
+                str(comment_dict['comment'].user_who_added)
+
+        self.assertEqual(
+            self._get_comments_tree_values(comments_tree),
+            [
+                (self.new_comment, 0, False),
+                (self.new_reply, 1, False),
+                (self.old_reply, 1, False),
+                (self.reply_to_reply, 2, False),
+                (self.old_comment, 0, False),
+            ],
+        )
+        self.assertIsNone(next_cursor)
+
+    def test_get_media_comments_page_pagination(self):
+
+        comments_tree, next_cursor = get_media_comments_page(self.media.id, page_size=1)
+
+        self.assertEqual([comment_dict['comment'] for comment_dict in comments_tree][0], self.new_comment)
+        self.assertEqual(len(comments_tree), 4)
+
+        comments_tree, next_cursor = get_media_comments_page(self.media.id, next_cursor, page_size=1)
+
+        self.assertEqual(self._get_comments_tree_values(comments_tree), [(self.old_comment, 0, False)])
+        self.assertIsNone(next_cursor)
+
+        with self.assertRaises(ValueError):
+            get_media_comments_page(self.media.id, 'incorrect cursor')
+
+    def test_hidden_replies(self):
+
+        comments_tree = get_comments_tree([self.new_comment], replies_depth=1)
+
+        self.assertEqual(
+            self._get_comments_tree_values(comments_tree),
+            [
+                (self.new_comment, 0, False),
+                (self.new_reply, 1, False),
+                (self.old_reply, 1, True),
+            ],
+        )
+
+        self.assertEqual(
+            self._get_comments_tree_values(get_comment_replies_tree(self.old_reply)),
+            [(self.reply_to_reply, 2, False)],
+        )
+
+    def test_get_comment_nesting(self):
+
+        self.assertEqual(get_comment_nesting(self.new_comment), 0)
+        self.assertEqual(get_comment_nesting(self.old_reply), 1)
+        self.assertEqual(get_comment_nesting(self.reply_to_reply), 2)
+
+    def test_get_comments_ajax(self):
+
+        response = self.client.get(
+            reverse('view_media', kwargs={'media_id': self.media.id}),
+            {'request_type': 'get_comments_page', 'cursor': ''},
+            **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'},
+        )
+
+        self.assertEqual(response.status_code, 200)
+
+        page_content: dict = response.json()
+
+        self.assertIsNone(page_content['next_cursor'])
+        self.assertIn(f'id="comment_{self.reply_to_reply.id}"', page_content['comments'])
+
+        response = self.client.get(
+            reverse('view_media', kwargs={'media_id': self.media.id}),
+            {'request_type': 'get_comment_replies', 'target_id': self.old_reply.id},
+            **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'id="comment_{self.reply_to_reply.id}" data-comment-nesting="2"', response.json()['comments'])
+
+        # the client nesting is ignored, it must not get into the cached comment fragments
+        response = self.client.get(
+            reverse('view_media', kwargs={'media_id': self.media.id}),
+            {'request_type': 'get_comment_replies', 'target_id': self.old_reply.id, 'nesting': 500},
+            **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'},
+        )
+
+        self.assertIn(f'id="comment_{self.reply_to_reply.id}" data-comment-nesting="2"', response.json()['comments'])
+
+        # incorrect data
+        for request_data in (
+                {'request_type': 'get_comments_page', 'cursor': 'incorrect cursor'},
+                {'request_type': 'get_comment_replies', 'target_id': 'incorrect'},
+                {'request_type': 'get_comment_replies', 'target_id': 0},
+        ):
+
+            response = self.client.get(
+                reverse('view_media', kwargs={'media_id': self.media.id}),
+                request_data,
+                **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'},
+            )
+
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('messages', response.json())
+
+    def test_add_current_user_votes_to_comments_tree(self):
+
+        # the vote of the comment author must not be shown to other users
+        CommentRating.toggle_vote(self.new_comment.id, self.new_comment.user_who_added_id, CommentRating.UPVOTE)
+
+        user = self.old_comment.user_who_added
+
+        CommentRating.toggle_vote(self.new_reply.id, user.id, CommentRating.UPVOTE)
+        CommentRating.toggle_vote(self.reply_to_reply.id, user.id, CommentRating.DOWNVOTE)
+
+        comments_tree, _ = get_media_comments_page(self.media.id)
+
+        with self.assertNumQueries(1):
+            add_current_user_votes_to_comments_tree(comments_tree, user)
+
+        self.assertEqual(
+            {comment_dict['comment']: comment_dict['current_user_vote'] for comment_dict in comments_tree},
+            {
+                self.new_comment: 0,
+                self.new_reply: CommentRating.UPVOTE,
+                self.old_reply: 0,
+                self.reply_to_reply: CommentRating.DOWNVOTE,
+                self.old_comment: 0,
+            },
+        )
+
+        with self.assertNumQueries(0):
+            add_current_user_votes_to_comments_tree(comments_tree, AnonymousUser())
+
+        self.assertFalse(any(comment_dict['current_user_vote'] for comment_dict in comments_tree))
+
+    def test_comment_media(self):
+
+        for comment in (self.old_comment, self.new_reply, self.reply_to_reply):
+            self.assertEqual(comment.media_id, self.media.id)
+
+    def test_report_get_link_to_target(self):
+
+        media_report = Report.objects.create(
+            content='test_content',
+            target_type=Report.MEDIA_TYPE,
+            target_id=self.media.id,
+            user_who_added=self.media.user_who_added,
+        )
+        comment_report = Report.objects.create(
+            content='test_content',
+            target_type=Report.COMMENT_TYPE,
+            target_id=self.reply_to_reply.id,
+            user_who_added=self.reply_to_reply.user_who_added,
+        )
+
+        media_link = reverse('view_media', kwargs={'media_id': self.media.id})
+
+        # the media is stored in the report, so no queries are needed
+        with self.assertNumQueries(0):
+            self.assertEqual(media_report.get_link_to_target(), media_link)
+            self.assertEqual(comment_report.get_link_to_target(), f'{media_link}#comment_{self.reply_to_reply.id}')
+
+    def test_get_media_comments_page_without_comments(self):
+
+        media = Media.objects.create(
+            title='test_title 3',
+            description='test_description 3',
+            author='test_author',
+            user_who_added=self.media.user_who_added,
+            active=1,
+        )
+
+        self.assertEqual(get_media_comments_page(media.id), ([], None))
+
+
+class MediaCountersTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        super().setUpClass()
+
+        cls.users = [
+            User.objects.create_user(
+                username=f'test_user_{i}', password='test_password', email=f'test_email_{i}@mail.com', role=1
+            )
+            for i in range(1, 4)
+        ]
+
+        cls.media = Media.objects.create(
+            title='test_title',
+            description='test_description',
+            author='test_author',
+            user_who_added=cls.users[0],
+            active=1,
+        )
+
+    @staticmethod
+    def _create_comment(target_type: int, target_id: int, user: User) -> Comment:
+        return Comment.objects.create(
+            content='test_content', target_type=target_type, target_id=target_id, user_who_added=user
+        )
+
+    def _assert_counters(self, downloads_count: int, comments_count: int) -> None:
+
+        self.media.refresh_from_db()
+
+        self.assertEqual(self.media.downloads_count, downloads_count)
+        self.assertEqual(self.media.comments_count, comments_count)
+
+    def test_counters(self):
+
+        for user in self.users:
+            MediaDownload.objects.create(media=self.media, user_who_added=user)
+
+        comment = self._create_comment(Comment.MEDIA_TYPE, self.media.id, self.users[0])
+        self._create_comment(Comment.COMMENT_TYPE, comment.id, self.users[1])
+
+        self._assert_counters(3, 2)
+
+        # saving an outdated media object does not change the counters
+        media = Media.objects.get(id=self.media.id)
+
+        self._create_comment(Comment.MEDIA_TYPE, self.media.id, self.users[2])
+
+        media.author = 'test_author_2'
+        media.save()
+
+        self._assert_counters(3, 3)
+
+        MediaDownload.objects.filter(user_who_added=self.users[0]).delete()
+        comment.delete()
+
+        self._assert_counters(2, 2)
+
+    @patch('media_app.services.is_cache_incr_atomic', return_value=True)
+    def test_buffered_downloads(self, _):
+
+        MediaDownload.objects.create(media=self.media, user_who_added=self.users[0])
+
+        self.media.refresh_from_db()
+
+        # the first user has already downloaded the media, the approximate number does not know it
+        self.assertEqual(add_media_download(self.media, self.users[0]), 2)
+        self.assertEqual(add_media_download(self.media, self.users[1]), 3)
+        # the same user again
+        self.assertEqual(add_media_download(self.media, self.users[1]), 3)
+
+        self._assert_counters(1, 0)
+
+        output = StringIO()
+
+        call_command('flush_media_downloads', stdout=output)
+
+        self.assertIn('Flushed media downloads: 2', output.getvalue())
+        self._assert_counters(2, 0)
+        self.assertEqual(self.media.get_downloads_number(), 2)
+
+        # the buffer is empty
+        self.assertEqual(flush_media_downloads_buffer(), 0)
+        self.assertEqual(add_media_download(self.media, self.users[2]), 3)
+
+    @override_settings(USE_CACHE=False)
+    def test_not_buffered_downloads(self):
+
+        self.media.refresh_from_db()
+
+        self.assertEqual(add_media_download(self.media, self.users[0]), 1)
+
+        self.media.refresh_from_db()
+
+        self.assertEqual(add_media_download(self.media, self.users[0]), 1)
+        self._assert_counters(1, 0)
+
+    def test_not_buffered_downloads_without_atomic_cache_incr(self):
+
+        self.media.refresh_from_db()
+
+        # the tests cache is DatabaseCache, it increments values with a get and a set
+        self.assertEqual(add_media_download(self.media, self.users[0]), 1)
+        self._assert_counters(1, 0)
+        self.assertEqual(flush_media_downloads_buffer(), 0)
+
+    @patch('media_app.services.is_cache_incr_atomic', return_value=True)
+    def test_buffered_downloads_missing_event(self, _):
+
+        add_media_download(self.media, self.users[0])
+
+        # the second writer has taken the index, but has not set the event yet
+        cache.incr('media_downloads_buffer_last_index')
+        cache.add(f'media_downloads_buffer_user_{self.media.id}_{self.users[1].id}', True)
+
+        add_media_download(self.media, self.users[2])
+
+        self.assertEqual(flush_media_downloads_buffer(), 2)
+        self._assert_counters(2, 0)
+
+        cache.set('media_downloads_buffer_event_2', (self.media.id, self.users[1].id))
+
+        # the missing event is not skipped, the flushed events are not flushed again
+        self.assertEqual(flush_media_downloads_buffer(), 1)
+        self._assert_counters(3, 0)
+        self.assertEqual(cache.get('media_downloads_buffer_flushed_index'), 3)
+
+    @patch('media_app.services.is_cache_incr_atomic', return_value=True)
+    def test_buffered_downloads_expired_event(self, _):
+
+        with override_settings(MEDIA_DOWNLOADS_BUFFER_TIMEOUT=60):
+
+            # the index is taken, the event is not set yet
+            cache.set('media_downloads_buffer_last_index', 1)
+
+            self.assertEqual(flush_media_downloads_buffer(), 0)
+            self.assertEqual(cache.get('media_downloads_buffer_flushed_index'), 0)
+
+            # the index was taken more than the timeout ago (before the first flush)
+            with patch('media_app.services.time', return_value=time() + 61):
+                self.assertEqual(flush_media_downloads_buffer(), 0)
+
+            self.assertEqual(cache.get('media_downloads_buffer_flushed_index'), 1)
+
+    def test_repair_media_counters(self):
+
+        MediaDownload.objects.create(media=self.media, user_who_added=self.users[0])
+
+        Media.objects.filter(id=self.media.id).update(downloads_count=10, comments_count=5)
+
+        output = StringIO()
+
+        call_command('repair_media_counters', '--dry-run', stdout=output)
+
+        self.assertIn('downloads_count 10 -> 1, comments_count 5 -> 0', output.getvalue())
+        self._assert_counters(10, 5)
+
+        call_command('repair_media_counters', stdout=StringIO())
+
+        self._assert_counters(1, 0)
+
+        output = StringIO()
+
+        call_command('repair_media_counters', stdout=output)
+
+        self.assertIn('All media counters are correct', output.getvalue())
+
+
+class UniqueConstraintsTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test_email@mail.com', role=1
+        )
+
+        cls.media = Media.objects.create(
+            title='test_title',
+            description='test_description',
+            author='test_author',
+            user_who_added=cls.user,
+            active=1,
+        )
+
+        cls.comment = Comment.objects.create(
+            content='test_content', target_type=Comment.MEDIA_TYPE, target_id=cls.media.id, user_who_added=cls.user
+        )
+
+    def test_media_download(self):
+
+        MediaDownload.objects.create(media=self.media, user_who_added=self.user)
+
+        with self.assertRaises(ValidationError) as error:
+            MediaDownload.objects.create(media=self.media, user_who_added=self.user)
+
+        self.assertEqual(error.exception.messages, ['Object with this user and media already exists'])
+
+        self.media.refresh_from_db()
+
+        self.assertEqual(self.media.downloads_count, 1)
+
+    def test_media_rating(self):
+
+        MediaRating.objects.create(media=self.media, user_who_added=self.user, rating=5)
+
+        with self.assertRaises(ValidationError) as error:
+            MediaRating.objects.create(media=self.media, user_who_added=self.user, rating=1)
+
+        self.assertEqual(error.exception.error_dict['__all__'][0].code, 'unique_together')
+
+        self.media.refresh_from_db()
+
+        self.assertEqual((self.media.rating_sum, self.media.rating_count), (5, 1))
+
+    def test_comment_rating(self):
+
+        CommentRating.objects.create(comment=self.comment, user_who_added=self.user, rating=CommentRating.UPVOTE)
+
+        with self.assertRaises(ValidationError) as error:
+            CommentRating.objects.create(comment=self.comment, user_who_added=self.user, rating=CommentRating.UPVOTE)
+
+        self.assertEqual(error.exception.messages, ['Object with this user and comment already exists'])
+
+        self.comment.refresh_from_db()
+
+        self.assertEqual(self.comment.rating, CommentRating.UPVOTE)
+
+    def test_report(self):
+
+        report_data = {
+            'content': 'test_content',
+            'target_type': Report.MEDIA_TYPE,
+            'target_id': self.media.id,
+            'user_who_added': self.user,
+        }
+
+        report = Report.objects.create(**report_data)
+
+        # duplicate inside the reports rate limit
+        with self.assertRaises(ValidationError) as error:
+            Report.objects.create(**report_data)
+
+        self.assertEqual(error.exception.messages, ['You can not create one more report on the same media/comment'])
+
+        # duplicate outside the reports rate limit, rejected by the database constraint
+        Report.objects.filter(id=report.id).update(pub_date=report.pub_date - timedelta(minutes=1))
+
+        with self.assertRaises(ValidationError) as error:
+            Report.objects.create(**report_data)
+
+        self.assertEqual(error.exception.messages, ['You can not create one more report on the same media/comment'])
+        self.assertEqual(Report.objects.filter(user_who_added=self.user).count(), 1)
+
+
+class S3ConnectionTestCase(TestCase):
+
+    def setUp(self):
+        reset_s3_connection()
+
+    def tearDown(self):
+        reset_s3_connection()
+
+    def test_get_s3_connection(self):
+
+        s3 = get_s3_connection()
+
+        self.assertIs(get_s3_connection(), s3)
+        self.assertEqual(s3.meta.config.max_pool_connections, settings.S3_CLIENT_MAX_POOL_CONNECTIONS)
+        self.assertEqual(s3.meta.config.retries['total_max_attempts'], settings.S3_CLIENT_MAX_ATTEMPTS)
+
+        # one client for all threads
+        threads_s3 = []
+        threads = [Thread(target=lambda: threads_s3.append(get_s3_connection())) for _ in range(4)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(all(thread_s3 is s3 for thread_s3 in threads_s3))
+
+    def test_get_s3_connection_forked(self):
+
+        s3 = get_s3_connection()
+
+        # a forked process does not use the parent process client (and its connections)
+        with patch('app_main.s3_storage.getpid', return_value=-1):
+
+            forked_s3 = get_s3_connection()
+
+            self.assertIsNot(forked_s3, s3)
+            self.assertIs(get_s3_connection(), forked_s3)
+
+
+@override_settings(
+    AWS_ACCESS_KEY_ID='test_access_key', AWS_SECRET_ACCESS_KEY='test_secret_key', AWS_STORAGE_BUCKET_NAME='test-bucket'
+)
+class S3MultipartUploadTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(
+            username='test_user', password='test_password', email='test_email@mail.com', role=1
+        )
+        cls.second_user = User.objects.create_user(
+            username='test_user_2', password='test_password', email='test_email_2@mail.com', role=1
+        )
+
+    def setUp(self):
+
+        reset_s3_connection()
+
+        self.s3 = get_s3_connection()
+        self.s3_stubber = Stubber(self.s3)
+        self.s3_stubber.activate()
+
+        for target in ('media_app.views.get_s3_connection', 'media_app.services.get_s3_connection'):
+
+            patcher = patch(target, return_value=self.s3)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        reset_s3_connection()
+
+    def _create_pending_upload(self, file_size: int = 1024) -> PendingUpload:
+        return PendingUpload.objects.create(
+            user_who_added=self.user,
+            upload_id='test_upload_id',
+            file_key='media/media_app/test_user/test.pdf',
+            file_name='test.pdf',
+            file_size=file_size,
+            part_size=S3_MIN_PART_SIZE,
+        )
+
+    def _get_upload_parts_presigned_urls(self, first_part_number: int, last_part_number: int, file_size=None):
+        return self.client.get(
+            reverse(
+                's3auth_multipart_get_upload_parts_presigned_urls',
+                kwargs={
+                    'upload_id': 'test_upload_id',
+                    'first_part_number': first_part_number,
+                    'last_part_number': last_part_number,
+                    'file_key': 'media/media_app/test_user/test.pdf',
+                },
+            ),
+            {} if file_size is None else {'file_size': file_size},
+            **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'},
+        )
+
+    def test_get_upload_parts_presigned_urls(self):
+
+        self._create_pending_upload()
+
+        self.client.force_login(self.user)
+
+        response = self._get_upload_parts_presigned_urls(3, 5)
+
+        self.assertEqual(response.status_code, 200)
+
+        upload_urls = response.json()['upload_urls']
+
+        self.assertEqual(list(upload_urls), ['3', '4', '5'])
+
+        for part_number, upload_url in upload_urls.items():
+
+            self.assertIn(f'partNumber={part_number}', upload_url)
+            self.assertIn('uploadId=test_upload_id', upload_url)
+            self.assertIn(f'X-Amz-Expires={settings.S3_PRESIGNED_URL_MIN_EXPIRES_IN}', upload_url)
+
+    def test_get_upload_parts_presigned_urls_expires_in(self):
+
+        self._create_pending_upload(settings.S3_UPLOAD_MIN_SPEED * 60 * 60)
+
+        self.client.force_login(self.user)
+
+        # the client file size is ignored, the expiration time is calculated from the upload file size
+        response = self._get_upload_parts_presigned_urls(1, 1, settings.S3_UPLOAD_MIN_SPEED * 60 * 60 * 24 * 7)
+
+        self.assertIn(
+            f'X-Amz-Expires={settings.S3_PRESIGNED_URL_MIN_EXPIRES_IN + 60 * 60}', response.json()['upload_urls']['1']
+        )
+
+    def test_get_upload_parts_presigned_urls_incorrect_data(self):
+
+        pending_upload = self._create_pending_upload()
+
+        self.client.force_login(self.user)
+
+        for first_part_number, last_part_number in (
+                (0, 1),
+                (2, 1),
+                (1, settings.S3_PRESIGNED_URLS_BATCH_MAX_SIZE + 1),
+                (10000, 10001),
+        ):
+
+            response = self._get_upload_parts_presigned_urls(first_part_number, last_part_number)
+
+            self.assertEqual(response.status_code, 400)
+
+        # not the user upload
+        self.client.force_login(self.second_user)
+
+        self.assertEqual(self._get_upload_parts_presigned_urls(1, 1).status_code, 404)
+
+        # a completed upload
+        PendingUpload.objects.filter(id=pending_upload.id).update(completed=True)
+
+        self.client.force_login(self.user)
+
+        self.assertEqual(self._get_upload_parts_presigned_urls(1, 1).status_code, 404)
+
+        self.client.logout()
+
+        self.assertEqual(self._get_upload_parts_presigned_urls(1, 1).status_code, 403)
+
+    @override_settings(
+        FILE_UPLOAD_CHUNK_SIZE=1024 * 1024 * 1024, S3_UPLOAD_TARGET_PARTS_COUNT=32, S3_UPLOAD_MAX_CONCURRENCY=4
+    )
+    def test_get_multipart_upload_plan(self):
+
+        mib = 1024 * 1024
+
+        for file_size, part_size, parts_count, concurrency in (
+                (0, S3_MIN_PART_SIZE, 1, 1),
+                (mib, S3_MIN_PART_SIZE, 1, 1),
+                # small files are split to the minimum parts
+                (12 * mib, S3_MIN_PART_SIZE, 3, 3),
+                (320 * mib, 10 * mib, 32, 4),
+                (320 * mib + 1, 11 * mib, 30, 4),
+                # large files are split to the maximum parts
+                (64 * 1024 * mib, 1024 * mib, 64, 4),
+        ):
+
+            upload_plan = get_multipart_upload_plan(file_size)
+
+            self.assertEqual(upload_plan['part_size'], part_size)
+            self.assertEqual(upload_plan['parts_count'], parts_count)
+            self.assertEqual(upload_plan['concurrency'], concurrency)
+
+    @override_settings(FILE_UPLOAD_CHUNK_SIZE=1024 * 1024 * 10, S3_UPLOAD_TARGET_PARTS_COUNT=32)
+    def test_get_multipart_upload_plan_limits(self):
+
+        # the maximum parts number with the maximum part size
+        upload_plan = get_multipart_upload_plan(S3_MAX_PARTS_COUNT * 1024 * 1024 * 10)
+
+        self.assertEqual(upload_plan['parts_count'], S3_MAX_PARTS_COUNT)
+
+        for file_size in (-1, S3_MAX_PARTS_COUNT * 1024 * 1024 * 10 + 1):
+            with self.assertRaises(ValueError):
+                get_multipart_upload_plan(file_size)
+
+    def _get_data_for_upload(self, file_name: str = 'test.pdf', file_size: int | str = 1024):
+        return self.client.get(
+            reverse('s3auth_multipart_get_data_for_upload', kwargs={'file_name': file_name}),
+            {'file_size': file_size},
+            **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'},
+        )
+
+    def test_get_data_for_upload_resumed(self):
+
+        self.client.force_login(self.user)
+
+        self.s3_stubber.add_response('create_multipart_upload', {'UploadId': 'test_upload_id'})
+
+        response = self._get_data_for_upload()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['upload_id'], 'test_upload_id')
+        self.assertFalse(response.json()['is_resumed'])
+
+        pending_upload = PendingUpload.objects.get(user_who_added=self.user)
+
+        self.assertEqual(pending_upload.file_key, response.json()['file_key'])
+
+        # the same file is resumed without the storage requests (the stubber has no more responses)
+        resumed_response = self._get_data_for_upload()
+
+        self.assertEqual(resumed_response.status_code, 200)
+        self.assertTrue(resumed_response.json()['is_resumed'])
+        self.assertEqual(resumed_response.json()['upload_id'], 'test_upload_id')
+        self.assertEqual(resumed_response.json()['file_key'], pending_upload.file_key)
+
+        self.s3_stubber.assert_no_pending_responses()
+
+    def test_get_data_for_upload_expired(self):
+
+        self.client.force_login(self.user)
+
+        expired_pending_upload = PendingUpload.objects.create(
+            user_who_added=self.user,
+            upload_id='expired_upload_id',
+            file_key='media/media_app/test_user/expired.pdf',
+            file_name='test.pdf',
+            file_size=1024,
+            part_size=S3_MIN_PART_SIZE,
+        )
+        PendingUpload.objects.filter(id=expired_pending_upload.id).update(
+            pub_date=expired_pending_upload.pub_date - timedelta(seconds=settings.S3_UPLOAD_RESUME_TIMEOUT + 1)
+        )
+
+        # the expired upload is aborted, a new one is created
+        self.s3_stubber.add_response(
+            'abort_multipart_upload',
+            {},
+            {'Bucket': 'test-bucket', 'Key': expired_pending_upload.file_key, 'UploadId': 'expired_upload_id'},
+        )
+        self.s3_stubber.add_response('create_multipart_upload', {'UploadId': 'test_upload_id'})
+
+        response = self._get_data_for_upload()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['is_resumed'])
+        self.assertEqual(
+            list(PendingUpload.objects.filter(user_who_added=self.user).values_list('upload_id', flat=True)),
+            ['test_upload_id'],
+        )
+
+        self.s3_stubber.assert_no_pending_responses()
+
+    def _create_expired_pending_upload(self, user: User, upload_id: str) -> PendingUpload:
+
+        pending_upload = PendingUpload.objects.create(
+            user_who_added=user,
+            upload_id=upload_id,
+            file_key=f'media/media_app/{user.username}/{upload_id}.pdf',
+            file_name='test.pdf',
+            file_size=1024,
+            part_size=S3_MIN_PART_SIZE,
+        )
+        PendingUpload.objects.filter(id=pending_upload.id).update(
+            pub_date=pending_upload.pub_date - timedelta(seconds=settings.S3_UPLOAD_RESUME_TIMEOUT + 1)
+        )
+
+        return pending_upload
+
+    def test_abort_expired_uploads_command(self):
+
+        for user in (self.user, self.second_user):
+            self._create_expired_pending_upload(user, f'expired_upload_id_{user.id}')
+
+        not_expired_pending_upload = self._create_pending_upload()
+
+        self.s3_stubber.add_response('abort_multipart_upload', {})
+        self.s3_stubber.add_client_error('abort_multipart_upload', service_error_code='NoSuchUpload')
+
+        output = StringIO()
+
+        call_command('abort_expired_uploads', stdout=output)
+
+        self.assertIn('Aborted expired uploads: 2', output.getvalue())
+        self.assertEqual(list(PendingUpload.objects.values_list('id', flat=True)), [not_expired_pending_upload.id])
+
+        self.s3_stubber.assert_no_pending_responses()
+
+    def test_get_data_for_upload_abort_error(self):
+
+        self.client.force_login(self.user)
+
+        expired_pending_upload = self._create_expired_pending_upload(self.user, 'expired_upload_id')
+
+        # the storage error does not break the new upload, the expired one is aborted next time
+        self.s3_stubber.add_client_error(
+            'abort_multipart_upload', service_error_code='AccessDenied', http_status_code=403
+        )
+        self.s3_stubber.add_response('create_multipart_upload', {'UploadId': 'test_upload_id'})
+
+        response = self._get_data_for_upload()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(PendingUpload.objects.filter(id=expired_pending_upload.id).exists())
+
+        self.s3_stubber.assert_no_pending_responses()
+
+    def test_get_uploaded_parts(self):
+
+        pending_upload = PendingUpload.objects.create(
+            user_who_added=self.user,
+            upload_id='test_upload_id',
+            file_key='media/media_app/test_user/test.pdf',
+            file_name='test.pdf',
+            file_size=S3_MIN_PART_SIZE * 3,
+            part_size=S3_MIN_PART_SIZE,
+        )
+
+        url = reverse(
+            's3auth_multipart_get_uploaded_parts',
+            kwargs={'upload_id': pending_upload.upload_id, 'file_key': pending_upload.file_key},
+        )
+
+        # the parts are listed by pages
+        self.s3_stubber.add_response(
+            'list_parts',
+            {
+                'Parts': [{'PartNumber': 1, 'ETag': '"etag_1"', 'Size': S3_MIN_PART_SIZE}],
+                'IsTruncated': True,
+                'NextPartNumberMarker': 1,
+            },
+        )
+        self.s3_stubber.add_response(
+            'list_parts',
+            {'Parts': [{'PartNumber': 3, 'ETag': '"etag_3"', 'Size': S3_MIN_PART_SIZE}], 'IsTruncated': False},
+        )
+
+        self.client.force_login(self.user)
+
+        response = self.client.get(url, **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            loads(b''.join(response.streaming_content))['parts'],
+            [
+                {'PartNumber': 1, 'ETag': '"etag_1"', 'Size': S3_MIN_PART_SIZE},
+                {'PartNumber': 3, 'ETag': '"etag_3"', 'Size': S3_MIN_PART_SIZE},
+            ],
+        )
+
+        # not the user upload
+        self.client.force_login(self.second_user)
+
+        response = self.client.get(url, **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'})
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_do_complete_marks_pending_upload(self):
+
+        pending_upload = self._create_pending_upload()
+
+        url = reverse(
+            's3auth_multipart_do_complete',
+            kwargs={'upload_id': pending_upload.upload_id, 'file_key': pending_upload.file_key},
+        )
+        data = {'upload_parts': '[{"PartNumber": 1, "ETag": "etag_1"}]'}
+
+        # not the user upload, the storage is not requested
+        self.client.force_login(self.second_user)
+
+        response = self.client.post(url, data, **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(PendingUpload.objects.get(id=pending_upload.id).completed)
+
+        self.s3_stubber.add_response('complete_multipart_upload', {})
+
+        self.client.force_login(self.user)
+
+        response = self.client.post(url, data, **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(PendingUpload.objects.get(id=pending_upload.id).completed)
+
+        self.s3_stubber.assert_no_pending_responses()
+
+    def test_do_abort_deletes_pending_upload(self):
+
+        pending_upload = self._create_pending_upload()
+
+        url = reverse(
+            's3auth_multipart_do_abort',
+            kwargs={'upload_id': pending_upload.upload_id, 'file_key': pending_upload.file_key},
+        )
+
+        self.client.force_login(self.second_user)
+
+        self.assertEqual(self.client.post(url, **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}).status_code, 404)
+        self.assertTrue(PendingUpload.objects.filter(id=pending_upload.id).exists())
+
+        self.s3_stubber.add_response('abort_multipart_upload', {})
+
+        self.client.force_login(self.user)
+
+        self.assertEqual(self.client.post(url, **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}).status_code, 200)
+        self.assertFalse(PendingUpload.objects.filter(id=pending_upload.id).exists())
+
+    @override_settings(IS_TEST=False, MEDIA_STORAGE_BUCKET_NAME='test-bucket')
+    def test_clean_file_key(self):
+
+        error_message = \
+            'Something went wrong, you may not have specified the file field, please try again or contact support'
+
+        for user, file_key in (
+                (self.user, 'media/media_app/test_user/completed.pdf'),
+                (self.second_user, 'media/media_app/test_user_2/other_user.pdf'),
+        ):
+            PendingUpload.objects.create(
+                user_who_added=user,
+                upload_id=f'test_upload_id_{user.id}',
+                file_key=file_key,
+                file_name='test.pdf',
+                file_size=1024,
+                part_size=S3_MIN_PART_SIZE,
+                completed=True,
+            )
+
+        # the registry is checked first, the storage is checked only for the user files not in it
+        self.s3_stubber.add_response(
+            'head_object', {}, {'Bucket': 'test-bucket', 'Key': 'media/media_app/test_user/not_registered.pdf'}
+        )
+        self.s3_stubber.add_client_error(
+            'head_object',
+            service_error_code='404',
+            http_status_code=404,
+            expected_params={'Bucket': 'test-bucket', 'Key': 'media/media_app/test_user/not_exists.pdf'},
+        )
+
+        with patch('media_app.forms.get_s3_connection', return_value=self.s3):
+            for file_key, user, is_correct in (
+                    ('media/media_app/test_user/completed.pdf', self.user, True),
+                    ('media/media_app/test_user/not_registered.pdf', self.user, True),
+                    ('media/media_app/test_user/not_exists.pdf', self.user, False),
+                    # the files of another user, registered and not
+                    ('media/media_app/test_user_2/other_user.pdf', self.user, False),
+                    ('media/media_app/test_user_2/not_registered.pdf', self.user, False),
+                    ('media/media_app/test_user/completed.pdf', self.second_user, False),
+                    ('media/media_app/test_user/completed.pdf', None, False),
+            ):
+
+                form = CreateOrUpdateMediaForm(data={'file_key': file_key}, user=user)
+                form.is_valid()
+
+                self.assertEqual(error_message in form.non_field_errors(), not is_correct)
+
+        self.s3_stubber.assert_no_pending_responses()
+
+    def test_get_data_for_upload_incorrect_file_size(self):
+
+        self.client.force_login(self.user)
+
+        for file_size in ('', 'incorrect', '-1'):
+
+            response = self.client.get(
+                reverse('s3auth_multipart_get_data_for_upload', kwargs={'file_name': 'test.pdf'}),
+                {'file_size': file_size},
+                **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'},
+            )
+
+            self.assertEqual(response.status_code, 400)
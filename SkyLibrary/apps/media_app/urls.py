@@ -2,7 +2,8 @@ from django.urls import path
 from django.views.generic import TemplateView
 
 from .views import ViewCreateMedia, ViewViewMedia, ViewUpdateMedia, S3AuthMultipartGetDataForUploadView, \
-    S3AuthMultipartGetUploadPartPresignedUrlView, S3AuthMultipartDoCompleteView, S3AuthMultipartDoAbortView
+    S3AuthMultipartGetUploadPartPresignedUrlView, S3AuthMultipartGetUploadPartsPresignedUrlsView, \
+    S3AuthMultipartGetUploadedPartsView, S3AuthMultipartDoCompleteView, S3AuthMultipartDoAbortView
 
 urlpatterns = [
     path('create/', ViewCreateMedia.as_view(), name='create_media'),
@@ -28,6 +29,17 @@ urlpatterns = [
         S3AuthMultipartGetUploadPartPresignedUrlView.as_view(),
         name='s3auth_multipart_get_upload_part_presigned_url',
     ),
+    path(
+        'create_or_update/s3auth/get_upload_parts_presigned_urls/'
+        '<str:upload_id>/<int:first_part_number>/<int:last_part_number>/<path:file_key>/',
+        S3AuthMultipartGetUploadPartsPresignedUrlsView.as_view(),
+        name='s3auth_multipart_get_upload_parts_presigned_urls',
+    ),
+    path(
+        'create_or_update/s3auth/get_uploaded_parts/<str:upload_id>/<path:file_key>/',
+        S3AuthMultipartGetUploadedPartsView.as_view(),
+        name='s3auth_multipart_get_uploaded_parts',
+    ),
     path(
         'create_or_update/s3auth/do_abort/<str:upload_id>/<path:file_key>/',
         S3AuthMultipartDoAbortView.as_view(),
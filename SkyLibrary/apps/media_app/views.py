@@ -1,7 +1,11 @@
 from json import dumps
+from datetime import timedelta
 from ast import literal_eval
+from collections.abc import Iterator
+from itertools import chain
 
 from django.shortcuts import render, get_object_or_404
+from django.template.loader import render_to_string
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic.edit import CreateView, UpdateView
 from django.urls import reverse_lazy
@@ -12,18 +16,20 @@ from django.contrib.auth import get_user_model
 from django.contrib import messages
 from django.utils.translation import gettext_lazy as _
 from django.contrib.humanize.templatetags.humanize import naturaltime
-from django.db.models import QuerySet
 from django.conf import settings
+from django.utils import timezone
 
 from crispy_forms.utils import render_crispy_form
 
-from .models import Media, MediaDownload, Comment, CommentRating, Report, get_upload
+from .models import Media, Comment, CommentRating, Report, PendingUpload, get_upload
+from .services import get_media_comments_page, get_comment_replies_tree, add_current_user_votes_to_comments_tree, \
+    add_media_download, get_multipart_upload_plan, abort_expired_pending_uploads
 from .forms import CreateOrUpdateMediaForm, CreateCommentForm, CreateReplyCommentForm, CreateReportCommentForm, \
     CreateReportMediaForm
 from staff_app.models import ModeratorTask
 from staff_app.views import ViewModeratorPage
 from home_page_app.views import handler403, handler404, handler400
-from utils_app.services import messages_to_json
+from utils_app.services import messages_to_json, get_streaming_json_response
 from app_main.s3_storage import get_s3_connection
 
 
@@ -44,12 +50,62 @@ class S3AuthMultipartGetDataForUploadView(View):
 
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
 
-            file_key = f"{settings.MEDIA_URL.replace('/', '')}/{get_upload(request.user.username, file_name)}"
+            if request.user.is_anonymous:
+                return handler403(request)
+
+            try:
+                file_size = int(request.GET.get('file_size'))
+
+            except (ValueError, TypeError):
+                return handler400(request)
+
+            # the not expired upload of the same file is resumed (see S3AuthMultipartGetUploadedPartsView)
+            pending_upload = PendingUpload.objects.filter(
+                user_who_added=request.user,
+                file_name=file_name,
+                file_size=file_size,
+                completed=False,
+                pub_date__gte=timezone.now() - timedelta(seconds=settings.S3_UPLOAD_RESUME_TIMEOUT),
+            ).order_by('-pub_date').first()
+
+            try:
+                upload_plan = get_multipart_upload_plan(
+                    file_size, None if pending_upload is None else pending_upload.part_size
+                )
+
+            except ValueError:
+                return handler400(request)
+
+            if pending_upload is None:
+
+                abort_expired_pending_uploads(request.user)
+
+                file_key = f"{settings.MEDIA_URL.replace('/', '')}/{get_upload(request.user.username, file_name)}"
+
+                pending_upload = PendingUpload.objects.create(
+                    user_who_added=request.user,
+                    upload_id=self.get_multipart_upload_id(file_key),
+                    file_key=file_key,
+                    file_name=file_name,
+                    file_size=file_size,
+                    part_size=upload_plan['part_size'],
+                )
+
+                is_resumed = False
+
+            else:
+                is_resumed = True
 
             return JsonResponse({
-                'upload_id': self.get_multipart_upload_id(file_key),
-                'file_key': file_key,
-                'chunk_size': settings.FILE_UPLOAD_CHUNK_SIZE,
+                'upload_id': pending_upload.upload_id,
+                'file_key': pending_upload.file_key,
+                'is_resumed': is_resumed,
+                'chunk_size': upload_plan['part_size'],
+                'parts_count': upload_plan['parts_count'],
+                'concurrency': upload_plan['concurrency'],
+                'part_max_attempts': upload_plan['part_max_attempts'],
+                # see S3AuthMultipartGetUploadPartsPresignedUrlsView
+                'presigned_urls_batch_size': settings.S3_PRESIGNED_URLS_BATCH_MAX_SIZE,
             })
 
         else:
@@ -82,6 +138,132 @@ class S3AuthMultipartGetUploadPartPresignedUrlView(View):
             return handler400(request)
 
 
+class S3AuthMultipartGetUploadPartsPresignedUrlsView(View):
+
+    # S3 limits: the part number and the presigned url expiration time (7 days)
+    MAX_PART_NUMBER = 10000
+    MAX_EXPIRES_IN = 60 * 60 * 24 * 7
+
+    @classmethod
+    def get_expires_in(cls, file_size: int) -> int:
+        # the file upload time at settings.S3_UPLOAD_MIN_SPEED, so the urls of the last parts do not expire
+        return min(
+            settings.S3_PRESIGNED_URL_MIN_EXPIRES_IN + file_size // settings.S3_UPLOAD_MIN_SPEED, cls.MAX_EXPIRES_IN
+        )
+
+    @staticmethod
+    def get_presigned_upload_urls(
+            key: str,
+            upload_id: str,
+            part_numbers: range,
+            expires_in: int,
+    ) -> dict[int, str]:
+
+        s3 = get_s3_connection()
+
+        # presigning is calculated locally, without requests to the storage
+        return {
+            part_number: s3.generate_presigned_url(
+                'upload_part',
+                Params={
+                    'Bucket': settings.AWS_STORAGE_BUCKET_NAME,
+                    'Key': key,
+                    'UploadId': upload_id,
+                    'PartNumber': part_number,
+                },
+                ExpiresIn=expires_in,
+            )
+            for part_number in part_numbers
+        }
+
+    def get(self, request, upload_id: str, first_part_number: int, last_part_number: int, file_key: str):
+
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+
+            if request.user.is_anonymous:
+                return handler403(request)
+
+            part_numbers = range(first_part_number, last_part_number + 1)
+
+            if not (1 <= first_part_number <= last_part_number <= self.MAX_PART_NUMBER) or \
+                    len(part_numbers) > settings.S3_PRESIGNED_URLS_BATCH_MAX_SIZE:
+                return handler400(request)
+
+            # only the uploads of the user, the file size is the one of the upload creation
+            pending_upload = PendingUpload.objects.filter(
+                user_who_added=request.user, upload_id=upload_id, file_key=file_key, completed=False
+            ).only('file_size').first()
+
+            if pending_upload is None:
+                return handler404(request)
+
+            return JsonResponse({
+                'upload_urls': self.get_presigned_upload_urls(
+                    file_key, upload_id, part_numbers, self.get_expires_in(pending_upload.file_size)
+                ),
+            })
+
+        else:
+            return handler400(request)
+
+
+class S3AuthMultipartGetUploadedPartsView(View):
+
+    @staticmethod
+    def get_uploaded_parts(key: str, upload_id: str) -> Iterator[dict[str: int | str]] | None:
+        # None if there is no such upload, the pages after the first one are requested while the parts are sent
+
+        s3 = get_s3_connection()
+
+        pages = iter(
+            s3.get_paginator('list_parts').paginate(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key, UploadId=upload_id
+            )
+        )
+
+        try:
+            first_page = next(pages)
+
+        except s3.exceptions.NoSuchUpload:
+            return None
+
+        return (
+            {'PartNumber': part['PartNumber'], 'ETag': part['ETag'], 'Size': part['Size']}
+            for page in chain([first_page], pages)
+            for part in page.get('Parts', [])
+        )
+
+    def get(self, request, upload_id: str, file_key: str):
+
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+
+            if request.user.is_anonymous:
+                return handler403(request)
+
+            # only the uploads of the user
+            pending_upload = PendingUpload.objects.filter(
+                user_who_added=request.user, upload_id=upload_id, file_key=file_key, completed=False
+            ).first()
+
+            if pending_upload is None:
+                return handler404(request)
+
+            uploaded_parts = self.get_uploaded_parts(file_key, upload_id)
+
+            if uploaded_parts is None:
+
+                # aborted or completed outside of the site
+                pending_upload.delete()
+
+                return handler404(request)
+
+            # up to 10000 parts, they are sent by chunks
+            return get_streaming_json_response(uploaded_parts, list_key='parts')
+
+        else:
+            return handler400(request)
+
+
 class S3AuthMultipartDoCompleteView(View):
 
     @staticmethod
@@ -108,6 +290,17 @@ class S3AuthMultipartDoCompleteView(View):
 
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
 
+            if request.user.is_anonymous:
+                return handler403(request)
+
+            # only the uploads of the user
+            pending_upload = PendingUpload.objects.filter(
+                user_who_added=request.user, upload_id=upload_id, file_key=file_key, completed=False
+            ).first()
+
+            if pending_upload is None:
+                return handler404(request)
+
             upload_parts = request.POST.get('upload_parts', None)
 
             if upload_parts:
@@ -126,6 +319,11 @@ class S3AuthMultipartDoCompleteView(View):
                                 (upload_parts[0]['ETag'] and type(upload_parts[0]['ETag']) == str):
 
                             if self.do_complete_multipart_upload(file_key, upload_id, {'Parts': upload_parts}):
+
+                                # the file can be used in the media form of the user now
+                                pending_upload.completed = True
+                                pending_upload.save(update_fields=['completed'])
+
                                 return JsonResponse({})
 
                             else:
@@ -167,7 +365,21 @@ class S3AuthMultipartDoAbortView(View):
 
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
 
+            if request.user.is_anonymous:
+                return handler403(request)
+
+            # only the uploads of the user
+            pending_upload = PendingUpload.objects.filter(
+                user_who_added=request.user, upload_id=upload_id, file_key=file_key, completed=False
+            ).first()
+
+            if pending_upload is None:
+                return handler404(request)
+
             if self.do_abort_multipart_upload(file_key, upload_id):
+
+                pending_upload.delete()
+
                 return JsonResponse({})
 
             else:
@@ -184,6 +396,9 @@ class ViewCreateMedia(LoginRequiredMixin, CreateView):
     template_name = 'media_app/create_media.html'
     success_url = reverse_lazy('create_media_successful')
 
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), 'user': self.request.user}
+
     def form_valid(self, form):
 
         form.instance.user_who_added = self.request.user
@@ -191,37 +406,6 @@ class ViewCreateMedia(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
-def get_all_replies_to_replies(
-        replies: QuerySet[Comment],
-        result: list[dict[str: Comment, str: int]] = None,
-        nesting: int = 1,
-) -> list[dict[str: Comment, str: int]]:
-    """
-        Function returns all existing replies to received replies (from newest to oldest).
-
-        "result" contains all replies in order like this:
-            media comment 1, media comment reply 1, media comment reply 2, media comment reply reply 1,
-            media comment reply reply 2, media comment 2, ...
-
-        Structure:
-            result = [
-                {'comment': Comment, 'nesting': int},  # comment is a Comment object, nesting >= 1
-                ...
-            ]
-    """
-
-    if result is None:
-        result = []
-
-    for reply in replies:
-
-        result.append({'comment': reply, 'nesting': nesting})
-
-        result = get_all_replies_to_replies(reply.get_replies(), result, nesting + 1)
-
-    return result
-
-
 class ViewViewMedia(View):
 
     template_name = 'media_app/view_media.html'
@@ -295,7 +479,51 @@ class ViewViewMedia(View):
         if not self.check_user_can_be_on_page(request, media):
             return handler403(request)
 
-        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest' and \
+                request.GET.get('request_type') in ('get_comments_page', 'get_comment_replies'):
+
+            # comments are available for anonymous users too
+
+            if request.GET.get('request_type') == 'get_comments_page':
+
+                try:
+                    comments_tree, next_cursor = get_media_comments_page(media_id, request.GET.get('cursor'))
+
+                except ValueError:
+
+                    messages.error(request, self.error_messages.get('bad_request').format(error_code='7.1'))
+
+                    return HttpResponse(messages_to_json(request), content_type='application/json')
+
+            else:
+
+                try:
+                    target_comment = Comment.objects.only('id', 'target_type', 'target_id').get(
+                        id=request.GET.get('target_id'), media_id=media_id
+                    )
+
+                except (Comment.DoesNotExist, ValueError, TypeError):
+
+                    messages.error(request, self.error_messages.get('bad_request').format(error_code='7.2'))
+
+                    return HttpResponse(messages_to_json(request), content_type='application/json')
+
+                comments_tree = get_comment_replies_tree(target_comment)
+                next_cursor = None
+
+            add_current_user_votes_to_comments_tree(comments_tree, request.user)
+
+            return HttpResponse(
+                dumps({
+                    'comments': render_to_string(
+                        'media_app/comments.html', {'comments': comments_tree}, request=request
+                    ),
+                    'next_cursor': next_cursor,
+                }),
+                content_type='application/json',
+            )
+
+        elif request.headers.get('x-requested-with') == 'XMLHttpRequest':
 
             if request.user.is_anonymous:
                 return handler403(request)
@@ -332,22 +560,16 @@ class ViewViewMedia(View):
 
         else:
 
-            media_comments = Comment.objects.filter(
-                target_type=Comment.MEDIA_TYPE, target_id=media_id
-            ).order_by('-pub_date')
+            comments_tree, comments_next_cursor = get_media_comments_page(media_id)
 
-            media_comments_with_replies = []
-
-            for media_comment in media_comments:
-                media_comments_with_replies += get_all_replies_to_replies(
-                    media_comment.get_replies(), result=[{'comment': media_comment, 'nesting': 0}]
-                )
+            add_current_user_votes_to_comments_tree(comments_tree, request.user)
 
             render_data = {
                 'media': media,
                 'is_moderate': self.is_moderate(request, media),
                 'form': CreateCommentForm(),
-                'comments': media_comments_with_replies,
+                'comments': comments_tree,
+                'comments_next_cursor': comments_next_cursor,
                 'is_user_moderator': request.user.role == User.MODERATOR if request.user.is_authenticated else 0,
             }
 
@@ -378,14 +600,8 @@ class ViewViewMedia(View):
         elif request.headers.get('x-requested-with') == 'XMLHttpRequest' and \
                 request.POST.get('request_type') == 'download_file':
 
-            try:
-                MediaDownload.objects.create(media=media, user_who_added=request.user)
-
-            except ValidationError:
-                pass
-
             return HttpResponse(
-                dumps({'downloads_number': media.get_downloads_number()}),
+                dumps({'downloads_number': add_media_download(media, request.user)}),
                 content_type='application/json',
             )
 
@@ -497,20 +713,15 @@ class ViewViewMedia(View):
                 return HttpResponse(messages_to_json(request), content_type='application/json')
 
             try:
-                CommentRating.objects.create(
-                    comment=target_comment,
-                    rating=vote_type,
-                    user_who_added=request.user,
-                )
+                new_rating = CommentRating.toggle_vote(target_comment.id, request.user.id, vote_type)
 
             except ValidationError as e:
-                if e.messages[0]:  # error message != '', see model clean method for more info
 
-                    messages_with_code = [f'{message} (code: 2.3)' for message in e.messages]
+                messages_with_code = [f'{message} (code: 2.3)' for message in e.messages]
 
-                    messages.error(request, messages_with_code)
+                messages.error(request, messages_with_code)
 
-                    return HttpResponse(messages_to_json(request), content_type='application/json')
+                return HttpResponse(messages_to_json(request), content_type='application/json')
 
             if request.POST.get('vote_type') == target_types['upvote']:
                 not_target_type = target_types['downvote']
@@ -520,7 +731,7 @@ class ViewViewMedia(View):
 
             return HttpResponse(
                 dumps({
-                    'new_rating': target_comment.get_rating(),
+                    'new_rating': new_rating,
                     'target_id': request.POST.get('target_id'),
                     'not_target_type': not_target_type,
                 }),
@@ -650,6 +861,9 @@ class ViewUpdateMedia(LoginRequiredMixin, UpdateView):
 
         return obj
 
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), 'user': self.request.user}
+
     def form_valid(self, form):
 
         form.instance.active = Media.INACTIVE
@@ -1,6 +1,14 @@
-from django.contrib import messages
-
+from collections.abc import Callable, Iterable, Iterator
 from json import dumps
+from typing import Any
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.cache.backends.redis import RedisCache
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
 
 
 def messages_to_json(request) -> str:
@@ -16,3 +24,67 @@ def messages_to_json(request) -> str:
         )
 
     return dumps({'messages': result})
+
+
+def is_cache_incr_atomic() -> bool:
+    # Redis and Memcached increment values atomically, other backends (e.g. DatabaseCache) with a get and a set,
+    # so concurrent increments may get the same value
+    return isinstance(caches['default'], (RedisCache, BaseMemcachedCache))
+
+
+def _get_json_list_chunks(
+        items: Iterable,
+        serialize_item: Callable[[Any], Any],
+        list_key: str,
+        data: dict,
+        chunk_size: int,
+) -> Iterator[str]:
+
+    yield '{' + ''.join(f'{dumps(key)}: {dumps(value)}, ' for key, value in data.items()) + f'{dumps(list_key)}: ['
+
+    chunk = []
+    separator = ''
+
+    for item in items:
+
+        chunk.append(dumps(serialize_item(item)))
+
+        if len(chunk) == chunk_size:
+
+            yield separator + ', '.join(chunk)
+
+            chunk = []
+            separator = ', '
+
+    if chunk:
+        yield separator + ', '.join(chunk)
+
+    yield ']}'
+
+
+def get_streaming_json_response(
+        items: Iterable,
+        serialize_item: Callable[[Any], Any] = lambda item: item,
+        list_key: str = 'results',
+        data: dict | None = None,
+        chunk_size: int | None = None,
+) -> StreamingHttpResponse:
+    """
+        Function returns a JSON object response, which is serialized while it is sent:
+            {**data, list_key: [serialize_item(item), ...]}
+
+        Querysets are loaded by chunks of "chunk_size" rows (settings.JSON_STREAM_CHUNK_SIZE by default)
+        with .iterator(), prefetch_related is applied to every chunk, so the memory does not depend
+        on the items number.
+    """
+
+    if chunk_size is None:
+        chunk_size = settings.JSON_STREAM_CHUNK_SIZE
+
+    if isinstance(items, QuerySet):
+        items = items.iterator(chunk_size=chunk_size)
+
+    return StreamingHttpResponse(
+        _get_json_list_chunks(items, serialize_item, list_key, data or {}, chunk_size),
+        content_type='application/json',
+    )
@@ -1,3 +1,45 @@
+from json import loads
+
 from django.test import TestCase
+from django.contrib.auth import get_user_model
+
+from .services import get_streaming_json_response
+
+User = get_user_model()
+
+
+class StreamingJsonResponseTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        super().setUpClass()
+
+        for i in range(1, 6):
+            User.objects.create_user(
+                username=f'test_user_{i}', password='test_password', email=f'test_email_{i}@mail.com', role=1
+            )
+
+    def test_queryset(self):
+
+        response = get_streaming_json_response(
+            User.objects.order_by('id').values_list('username', flat=True),
+            str.upper,
+            'users',
+            {'count': 5},
+            chunk_size=2,
+        )
+
+        self.assertTrue(response.streaming)
+
+        # the queryset is loaded while the response is sent
+        with self.assertNumQueries(1):
+            content = b''.join(response.streaming_content)
+
+        self.assertEqual(loads(content), {'count': 5, 'users': [f'TEST_USER_{i}' for i in range(1, 6)]})
+
+    def test_empty_items(self):
+
+        response = get_streaming_json_response(iter([]))
 
-# Create your tests here.
+        self.assertEqual(loads(b''.join(response.streaming_content)), {'results': []})
@@ -29,116 +29,235 @@ $(document).ready(async function () {
 
         let file = $(this).prop('files')[0];
 
-        await $.ajax(`/en-us/media/create_or_update/s3auth/get_data_for_upload/${file.name}/`).done(async function (multipart_upload_data) {
+        await $.ajax({
+            url: `/en-us/media/create_or_update/s3auth/get_data_for_upload/${file.name}/`,
+            data: {'file_size': file.size},
+        }).done(async function (multipart_upload_data) {
 
             const upload_id = multipart_upload_data.upload_id;
             const file_key = multipart_upload_data.file_key;
             const chunk_size = multipart_upload_data.chunk_size;
+            const parts_count = multipart_upload_data.parts_count;
+            const concurrency = multipart_upload_data.concurrency;
+            const part_max_attempts = multipart_upload_data.part_max_attempts;
+            const presigned_urls_batch_size = multipart_upload_data.presigned_urls_batch_size;
 
-            const status_percents_step = Math.ceil(100 / (file.size / chunk_size));
+            // the parts presigned urls requests (part number: promise of the url), the urls are requested by windows
+            // of parts, the next window is requested in advance, so the parts are uploaded one after another
+            let upload_urls_requests = {};
+            let requested_upload_urls_count = 0;
 
-            let chunk_number = 0;
+            function request_next_upload_urls_window() {
 
-            let chunk_start = -chunk_size;
-            let chunk_end = 0;
+                const first_part_number = requested_upload_urls_count + 1;
+                const last_part_number = Math.min(requested_upload_urls_count + presigned_urls_batch_size, parts_count);
+
+                const upload_urls_request = $.ajax({
+                    url: `/en-us/media/create_or_update/s3auth/get_upload_parts_presigned_urls/${upload_id}/${first_part_number}/${last_part_number}/${file_key}/`,
+                });
+
+                for (let part_number = first_part_number; part_number <= last_part_number; part_number++) {
+                    upload_urls_requests[part_number] = upload_urls_request.then(function (response) {
+                        return response.upload_urls[part_number];
+                    });
+                }
+
+                requested_upload_urls_count = last_part_number;
+            }
+
+            function get_upload_url(part_number) {
+
+                while (requested_upload_urls_count < part_number) {
+                    request_next_upload_urls_window();
+                }
+
+                if (
+                    requested_upload_urls_count < parts_count &&
+                    part_number + Math.floor(presigned_urls_batch_size / 2) > requested_upload_urls_count
+                ) {
+                    request_next_upload_urls_window();
+                }
+
+                return upload_urls_requests[part_number];
+            }
+
+            // uploaded bytes of every part (part number: bytes), for the progress
+            let parts_uploaded_bytes = {};
 
             let chunks_numbers_with_etags = [];
 
-            let current_status_percents_value = 0;
+            function show_progress() {
 
-            status.text(uploading_text_translated);
-            status_percents.text(`${current_status_percents_value}%`);
+                let uploaded_bytes = 0;
 
-            file_input.prop('disabled', true);
-            submit_button.prop('disabled', true);
+                for (const part_uploaded_bytes of Object.values(parts_uploaded_bytes)) {
+                    uploaded_bytes += part_uploaded_bytes;
+                }
+
+                // 100% is shown after the upload completion
+                status_percents.text(`${Math.min(Math.floor(uploaded_bytes / Math.max(file.size, 1) * 100), 99)}%`);
+            }
+
+            async function upload_part(part_number) {
+
+                const chunk = file.slice((part_number - 1) * chunk_size, Math.min(part_number * chunk_size, file.size));
+
+                for (let attempt = 1; ; attempt++) {
+
+                    try {
+
+                        const upload_url = await get_upload_url(part_number);
+
+                        let jqXHR = null;
+
+                        await $.ajax({
+                            method: 'PUT',
+                            url: upload_url,
+                            data: chunk,
+                            processData: false,
+                            contentType: false,
+                            cache: false,
+                            xhr: function () {
+
+                                const xhr = new XMLHttpRequest();
+
+                                xhr.upload.addEventListener('progress', function (event) {
+                                    parts_uploaded_bytes[part_number] = event.loaded;
+                                    show_progress();
+                                });
+
+                                return xhr;
+                            },
+                            success: function (data, textStatus, part_jqXHR) {
+                                jqXHR = part_jqXHR;
+                            },
+                        });
+
+                        parts_uploaded_bytes[part_number] = chunk.size;
+                        show_progress();
 
-            function upload_parts() {
+                        return {'PartNumber': part_number, 'ETag': jqXHR.getResponseHeader('Etag').replace(new RegExp('"', 'g'), '')};
 
-                chunk_start += chunk_size;
+                    } catch (error) {
 
-                chunk_end = Math.min(chunk_end + chunk_size, file.size);
+                        parts_uploaded_bytes[part_number] = 0;
+                        show_progress();
 
-                chunk_number++;
+                        if (attempt >= part_max_attempts) {
+                            throw error;
+                        }
+
+                        // the url may be expired or the connection may be lost, the part is retried with a new url
+                        upload_urls_requests[part_number] = $.ajax({
+                            url: `/en-us/media/create_or_update/s3auth/get_upload_parts_presigned_urls/${upload_id}/${part_number}/${part_number}/${file_key}/`,
+                        }).then(function (response) {
+                            return response.upload_urls[part_number];
+                        });
+
+                        await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** (attempt - 1)));
+                    }
+                }
+            }
 
-                const chunk = file.slice(chunk_start, chunk_end);
+            // the parts uploaded before a reload or a connection loss (part number: true), they are not uploaded again
+            let uploaded_parts = {};
 
-                let is_break = false;
-                let is_complete_successful = true;
+            if (multipart_upload_data.is_resumed) {
 
-                $.ajax(`/en-us/media/create_or_update/s3auth/get_upload_part_presigned_url/${upload_id}/${chunk_number}/${file_key}/`).done(function (upload_url) {
-                    $.when($.ajax({
-                        method: 'PUT',
-                        url: upload_url.upload_url,
-                        data: chunk,
-                        processData: false,
-                        contentType: false,
-                        cache: false,
-                        success: function (data, textStatus, jqXHR) {
+                try {
 
-                            current_status_percents_value += status_percents_step;
+                    const uploaded_parts_data = await $.ajax(
+                        `/en-us/media/create_or_update/s3auth/get_uploaded_parts/${upload_id}/${file_key}/`
+                    );
 
-                            if (current_status_percents_value >= 100) {
-                                current_status_percents_value = 99;
-                            }
+                    for (const part of uploaded_parts_data.parts) {
 
-                            status_percents.text(`${current_status_percents_value}%`);
+                        const expected_part_size = Math.min(part.PartNumber * chunk_size, file.size) - (part.PartNumber - 1) * chunk_size;
+
+                        // a part of an interrupted request may be not complete
+                        if (part.PartNumber <= parts_count && part.Size === expected_part_size) {
+
+                            uploaded_parts[part.PartNumber] = true;
+                            parts_uploaded_bytes[part.PartNumber] = part.Size;
 
                             chunks_numbers_with_etags.push(
-                                {'PartNumber': chunk_number, 'ETag': jqXHR.getResponseHeader('Etag').replace(new RegExp('"', 'g'), '')}
+                                {'PartNumber': part.PartNumber, 'ETag': part.ETag.replace(new RegExp('"', 'g'), '')}
                             );
-                        },
-                        error: function () {
-                            is_break = true;
-                            is_complete_successful = false;
-                        },
-                    })).done(function () {
+                        }
+                    }
 
-                        if (!is_break && (chunk_start + chunk_size >= file.size)) {
+                } catch (error) {
+                    // all of the parts are uploaded again
+                }
+            }
 
-                            file_input.prop('disabled', false);
-                            submit_button.prop('disabled', false);
+            // the next part number to upload, the parts are uploaded by "concurrency" workers at the same time
+            let next_part_number = 1;
+            let is_upload_failed = false;
 
-                            status_percents.text('100%');
+            async function upload_parts_worker() {
 
-                            if (is_complete_successful) {
+                while (next_part_number <= parts_count && !is_upload_failed) {
 
-                                status.text(uploaded_text_translated);
+                    const part_number = next_part_number++;
 
-                                file_key_input.val(file_key);
+                    if (uploaded_parts[part_number]) {
+                        continue;
+                    }
 
-                                $.ajax({
-                                    method: 'POST',
-                                    url: `/en-us/media/create_or_update/s3auth/do_complete/${upload_id}/${file_key}/`,
-                                    dataType: 'json',
-                                    data: {
-                                        'csrfmiddlewaretoken': csrf_token,
-                                        'upload_parts': JSON.stringify(chunks_numbers_with_etags),
-                                    },
-                                });
-                            } else {
+                    try {
+                        chunks_numbers_with_etags.push(await upload_part(part_number));
 
-                                status.text(error_text_translated);
+                    } catch (error) {
+                        is_upload_failed = true;
+                    }
+                }
+            }
 
-                                file_input.val('');
-                                file_key_input.val('');
+            status.text(uploading_text_translated);
+            show_progress();
 
-                                $.ajax({
-                                    method: 'POST',
-                                    url: `/en-us/media/create_or_update/s3auth/do_abort/${upload_id}/${file_key}/`,
-                                    dataType: 'json',
-                                    data: {
-                                        'csrfmiddlewaretoken': csrf_token,
-                                    },
-                                });
-                            }
-                        } else {
-                            upload_parts();
-                        }
-                    });
-                });
+            file_input.prop('disabled', true);
+            submit_button.prop('disabled', true);
+
+            let workers = [];
+
+            for (let i = 0; i < concurrency; i++) {
+                workers.push(upload_parts_worker());
             }
 
-            upload_parts();
+            await Promise.all(workers);
+
+            file_input.prop('disabled', false);
+            submit_button.prop('disabled', false);
+
+            if (!is_upload_failed) {
+
+                status_percents.text('100%');
+                status.text(uploaded_text_translated);
+
+                file_key_input.val(file_key);
+
+                // the parts must be sorted by the part number
+                chunks_numbers_with_etags.sort((a, b) => a.PartNumber - b.PartNumber);
+
+                $.ajax({
+                    method: 'POST',
+                    url: `/en-us/media/create_or_update/s3auth/do_complete/${upload_id}/${file_key}/`,
+                    dataType: 'json',
+                    data: {
+                        'csrfmiddlewaretoken': csrf_token,
+                        'upload_parts': JSON.stringify(chunks_numbers_with_etags),
+                    },
+                });
+            } else {
+
+                // the upload is not aborted, it is resumed when the same file is chosen again
+                status.text(error_text_translated);
+
+                file_input.val('');
+                file_key_input.val('');
+            }
         });
     });
 
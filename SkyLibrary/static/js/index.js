@@ -1,84 +1,189 @@
-$(document).ready(function() {
-    $(document).on('submit', '#filter_media_form', function () {
-        $.ajax({
-            url: get_full_path,
-            type: 'POST',
-            dataType: 'json',
-            data: {
-                'csrfmiddlewaretoken': csrf_token,
-                'request_type': 'filter_media',
-                'title': $('#filter_media_form_title_field').val(),
-                'author': $('#filter_media_form_author_field').val(),
-                'tags': `${$('#id_tags').val()}`,
-                'rating_direction': $('#id_rating_direction').val(),
-                'rating_minimum_value': $('#id_rating_minimum_value').val(),
-                'rating_maximum_value': $('#id_rating_maximum_value').val(),
-                'user_who_added': $('#filter_media_form_user_who_added_field').val(),
-            },
-            success: function (response) {
-                if (response.filter_results && Object.keys(response.filter_results).length !== 0) {
+function updateTagsCounts(tagsCounts) {
+    // shows the number of the filtered media with every tag in the tags filter
+    $('#id_tags option').each(function () {
 
-                    let filter_results_html = '<hr>';
+        if ($(this).data('name') === undefined) {
+            $(this).data('name', $(this).text());
+        }
 
-                    for (const media_data of response.filter_results) {
+        $(this).text(`${$(this).data('name')} (${tagsCounts[$(this).val()] || 0})`);
+    });
+}
+
+function getMediaHtml(media_data) {
+    // the filter result html of one media
+    let filter_results_html = '';
+
+    filter_results_html += '<section class="mt-2">';
+
+    // open flex-row section
+    filter_results_html += '<section class="list-group flex-row align-items-center">';
+
+    // link part
 
-                        filter_results_html += '<section class="mt-2">';
+    filter_results_html += '<section class="fs-4">';
 
-                        // open flex-row section
-                        filter_results_html += '<section class="list-group flex-row align-items-center">';
+    filter_results_html += `<a href="${media_data.link}">${media_data.title}</a>`;
 
-                        // link part
+    filter_results_html += '</section>';
 
-                        filter_results_html += '<section class="fs-4">';
+    // rating part
 
-                        filter_results_html += `<a href="${media_data.link}">${media_data.title}</a>`;
+    filter_results_html += '<section class="d-inline-flex align-items-end rating ms-1" style="font-size: 80%">';
 
-                        filter_results_html += '</section>';
+    filter_results_html += '<section class="position-relative rating__stars_body">';
 
-                        // rating part
+    filter_results_html += '<section class="position-absolute rating__stars"></section>';
 
-                        filter_results_html += '<section class="d-inline-flex align-items-end rating ms-1" style="font-size: 80%">';
+    filter_results_html += '</section>';
 
-                        filter_results_html += '<section class="position-relative rating__stars_body">';
+    filter_results_html += '<section class="rating__value">';
 
-                        filter_results_html += '<section class="position-absolute rating__stars"></section>';
+    filter_results_html += media_data.rating;
 
-                        filter_results_html += '</section>';
+    filter_results_html += '</section>';
 
-                        filter_results_html += '<section class="rating__value">';
+    filter_results_html += '</section>';
 
-                        filter_results_html += media_data.rating;
+    // comments count part
+
+    filter_results_html += `<section class="small fw-light ms-3" title="${comments_translated}">`;
+
+    filter_results_html += `<ion-icon name="chatbubble-outline"></ion-icon> ${media_data.comments_count}`;
+
+    filter_results_html += '</section>';
+
+    // close flex-rpw section
+    filter_results_html += '</section>';
+
+    // tags part
+    filter_results_html += '<section class="small fw-light">';
+
+    for (const tag of media_data.tags) {
+        filter_results_html += `<a data-toggle="tooltip" title="${tag.help_text}" href="">#${tag.name}</a>  `;
+    }
+
+    filter_results_html += '</section>';
+
+    filter_results_html += '</section>';
+
+    filter_results_html += '<hr>';
+
+    return filter_results_html;
+}
+
+$(document).ready(function() {
+    updateTagsCounts(JSON.parse($('#tags_counts').text()));
 
-                        filter_results_html += '</section>';
+    let autocompleteTimeout = null;
 
-                        filter_results_html += '</section>';
+    $(document).on('input', '#filter_media_form_search_field', function () {
 
-                        // close flex-rpw section
-                        filter_results_html += '</section>';
+        const text = $(this).val();
 
-                        // tags part
-                        filter_results_html += '<section class="small fw-light">';
+        // the request is sent after a pause in typing
+        clearTimeout(autocompleteTimeout);
 
-                        for (const tag of media_data.tags) {
-                            filter_results_html += `<a data-toggle="tooltip" title="${tag.help_text}" href="">#${tag.name}</a>  `;
-                        }
+        autocompleteTimeout = setTimeout(function () {
+            $.ajax({
+                url: get_full_path,
+                type: 'GET',
+                dataType: 'json',
+                data: {
+                    'request_type': 'autocomplete',
+                    'text': text,
+                },
+                success: function (response) {
 
-                        filter_results_html += '</section>';
+                    const autocompleteList = $('#search_autocomplete_list');
 
-                        filter_results_html += '</section>';
+                    autocompleteList.empty();
 
-                        filter_results_html += '<hr>';
+                    for (const suggestion of response.suggestions) {
+                        autocompleteList.append($('<option>').attr('value', suggestion.text));
                     }
+                },
+            });
+        }, 150);
+    });
+
+    // the next page cursor and the filter parameters of the shown results (see loadFilterResults)
+    let filterNextCursor = null;
+    let filterParams = null;
+    let filterLoading = false;
+
+    function loadFilterResults(cursor) {
+        // the first page replaces the shown results, the next pages (with the cursor) are appended to them
+        filterLoading = true;
+
+        $.ajax({
+            url: filter_media_url,
+            type: 'GET',
+            dataType: 'json',
+            data: cursor ? {...filterParams, 'cursor': cursor} : filterParams,
+            success: function (response) {
+
+                filterNextCursor = response.next_cursor;
+
+                if (!cursor) {
+                    updateTagsCounts(response.tags_counts);
+                }
+
+                if (response.filter_results && Object.keys(response.filter_results).length !== 0) {
 
-                    $('#section_for_filter_results').html(filter_results_html);
+                    let filter_results_html = cursor ? '' : '<hr>';
+
+                    for (const media_data of response.filter_results) {
+                        filter_results_html += getMediaHtml(media_data);
+                    }
+
+                    if (cursor) {
+                        $('#section_for_filter_results').append(filter_results_html);
+                    } else {
+                        $('#section_for_filter_results').html(filter_results_html);
+                    }
 
                     updateRatings();
 
-                } else {
+                } else if (!cursor) {
                     $('#section_for_filter_results').html(`<hr><section>${nothing_found_translated}</section>`);
                 }
             },
+            complete: function () {
+                filterLoading = false;
+            },
         });
+    }
+
+    $(document).on('submit', '#filter_media_form', function () {
+
+        filterParams = {
+            'search': $('#filter_media_form_search_field').val(),
+            'title': $('#filter_media_form_title_field').val(),
+            'author': $('#filter_media_form_author_field').val(),
+            'tags': `${$('#id_tags').val()}`,
+            'rating_direction': $('#id_rating_direction').val(),
+            'rating_minimum_value': $('#id_rating_minimum_value').val(),
+            'rating_maximum_value': $('#id_rating_maximum_value').val(),
+            'user_who_added': $('#filter_media_form_user_who_added_field').val(),
+            'similar_text': $('#filter_media_form_similar_text_field').is(':checked'),
+            'best_first': $('#filter_media_form_best_first_field').is(':checked'),
+            'newest_first': $('#filter_media_form_newest_first_field').is(':checked'),
+        };
+        filterNextCursor = null;
+
+        loadFilterResults(null);
+
         return false;
     });
+
+    // infinite scroll: the next page is loaded near the end of the results
+    $(window).on('scroll', function () {
+        if (
+            filterNextCursor && !filterLoading &&
+            $(window).scrollTop() + $(window).height() > $(document).height() - 300
+        ) {
+            loadFilterResults(filterNextCursor);
+        }
+    });
 });
@@ -192,6 +192,85 @@ $(document).ready(function () {
         });
     });
 
+    function alertMessages (response_messages) {
+
+        let messages = '';
+
+        for (let message of response_messages) {
+            messages += `${message.message}\n`;
+        }
+
+        alert(messages);
+    }
+
+    $(document).on('click', '#more_comments_button', function () {
+        $.ajax({
+            url: get_full_path,
+            type: 'GET',
+            dataType: 'json',
+            triggeredButton: this,
+            data: {
+                'request_type': 'get_comments_page',
+                'cursor': $(this).attr('data-comments-cursor'),
+            },
+            success: function (response) {
+
+                if (response.messages) {
+                    alertMessages(response.messages);
+
+                } else {
+
+                    $('#comments').append(response.comments);
+
+                    if (response.next_cursor) {
+                        $(this.triggeredButton).attr('data-comments-cursor', response.next_cursor);
+
+                    } else {
+                        $(this.triggeredButton).remove();
+                    }
+                }
+            },
+        });
+    });
+
+    $(document).on('click', '.show-replies-button', function () {
+
+        let target_id = $(this).attr('data-show-replies-target-id');
+        let target_comment = $(`#comments section[id="comment_${target_id}"]`);
+        let target_nesting = parseInt(target_comment.attr('data-comment-nesting'));
+
+        $.ajax({
+            url: get_full_path,
+            type: 'GET',
+            dataType: 'json',
+            triggeredButton: this,
+            data: {
+                'request_type': 'get_comment_replies',
+                'target_id': target_id,
+            },
+            success: function (response) {
+
+                if (response.messages) {
+                    alertMessages(response.messages);
+
+                } else {
+
+                    let target_comment_position = target_comment;
+
+                    for (let i = 0; i < target_nesting; i++) {
+                        target_comment_position = target_comment_position.parent();
+                    }
+
+                    target_comment_position.after(response.comments);
+
+                    /* the button and the dot before it */
+                    $(this.triggeredButton).prev('.dot').remove();
+                    $(this.triggeredButton).remove();
+                }
+            },
+        });
+    });
+
     function removeUnderCommentAndMediaFormsAndMessages () {
 
         let under_comment_form_element = $('#under_comment_form');
@@ -14,6 +14,9 @@ python manage.py migrate --noinput
 echo "${PURPLE}Create cache table${NO_COLOR}"
 python manage.py createcachetable
 
+echo "${PURPLE}Save buffered media downloads before clearing the cache${NO_COLOR}"
+python manage.py flush_media_downloads
+
 echo "${PURPLE}Clear possibly outdated cache${NO_COLOR}"
 python manage.py clear_cache
 
@@ -26,5 +29,11 @@ python manage.py test --noinput
 echo "${PURPLE}Send test email${NO_COLOR}"
 python manage.py sendtestemail plug@yandex.ru
 
+echo "${PURPLE}Run buffered media downloads worker${NO_COLOR}"
+python manage.py flush_media_downloads --interval 60 > /dev/null &
+
+echo "${PURPLE}Run expired media uploads aborting worker${NO_COLOR}"
+python manage.py abort_expired_uploads --interval 3600 > /dev/null &
+
 echo "${PURPLE}Run server${NO_COLOR}"
 gunicorn app_main.wsgi:application --workers 3 --timeout 60 --bind 0.0.0.0:8000